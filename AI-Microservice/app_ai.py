@@ -3,7 +3,7 @@ import sys
 import base64
 import io
 import numpy as np
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from PIL import Image
 import traceback
@@ -20,6 +20,16 @@ from utils.face_register import register_face_auto, register_instructor_face
 from utils.face_login import recognize_face
 from utils.face_utils import get_face_embedding
 from utils.anti_spoofing import check_real_or_spoof
+from utils.inference_scheduler import scheduler, prioritized
+from utils.deadline import DeadlineExceeded, check_deadline
+from utils import deadline as deadline_stats
+from utils.local_transport import (
+    RejectedHandle,
+    StaleHandle,
+    local_transport_app,
+    resolve_shm_payload,
+    start_unix_socket_server,
+)
 
 app = Flask(__name__)
 CORS(app)
@@ -92,12 +102,18 @@ def read_b64_to_bgr(b64: str) -> np.ndarray:
         print("Failed to decode base64 image:", e, flush=True)
         return None
 
+def read_face_to_bgr(face) -> np.ndarray:
+    # Faces arrive as raw encoded bytes over shared memory, base64 otherwise.
+    if isinstance(face, (bytes, bytearray)):
+        return cv2.imdecode(np.frombuffer(face, np.uint8), cv2.IMREAD_COLOR)
+    return read_b64_to_bgr(face)
+
 @app.get("/")
 def home():
     return jsonify({
         "status": "ok",
         "message": "FRAMS AI Microservice running",
-        "endpoints": ["/embed", "/antispoof", "/register-auto", "/register-instructor", "/recognize", "/recognize-multi", "/warmup"],
+        "endpoints": ["/embed", "/antispoof", "/register-auto", "/register-instructor", "/recognize", "/recognize-multi", "/embed-multi", "/warmup", "/metrics"],
         "railway_backend": RAILWAY_BACKEND_URL,
     })
 
@@ -105,7 +121,15 @@ def home():
 def healthz():
     return jsonify({"ready": True, "service": "frams-ai"}), 200
 
+@app.get("/metrics")
+def metrics():
+    return jsonify({
+        "scheduler": scheduler.stats(),
+        "deadlines": deadline_stats.stats(),
+    }), 200
+
 @app.get("/warmup")
+@prioritized("bulk")
 def warmup():
     try:
         dummy = np.zeros((224, 224, 3), np.uint8)
@@ -118,6 +142,7 @@ def warmup():
         return jsonify({"warmup": "failed", "error": str(e)}), 500
 
 @app.post("/embed")
+@prioritized("bulk")
 def get_embedding():
     try:
         data = request.get_json(force=True, silent=True) or {}
@@ -129,6 +154,7 @@ def get_embedding():
         if img is None:
             return jsonify({"error": "Failed to decode image"}), 400
 
+        check_deadline(g.deadline, "detect")
         faces = face_model.get(img)
         if not faces:
             return jsonify({"faces": 0, "embeddings": [], "bboxes": []})
@@ -145,11 +171,14 @@ def get_embedding():
         print(f"/embed → generated {len(embeddings)} embeddings", flush=True)
         return jsonify({"faces": len(embeddings), "embeddings": embeddings, "bboxes": boxes})
 
+    except DeadlineExceeded:
+        raise
     except Exception:
         print("Error in /embed:", traceback.format_exc(), flush=True)
         return jsonify({"error": "Internal server error"}), 500
 
 @app.post("/antispoof")
+@prioritized("bulk")
 def antispoof():
     try:
         data = request.get_json(force=True, silent=True) or {}
@@ -161,42 +190,52 @@ def antispoof():
         if img is None:
             return jsonify({"error": "Invalid base64 image"}), 400
 
+        check_deadline(g.deadline, "spoof")
         is_real, confidence, probs = check_real_or_spoof(img)
         print(f"/antispoof → real={probs['real']:.3f}, spoof={probs['spoof']:.3f}", flush=True)
 
         return jsonify({"is_real": bool(is_real), "confidence": float(confidence), "probs": probs})
 
+    except DeadlineExceeded:
+        raise
     except Exception:
         print("Error in /antispoof:", traceback.format_exc(), flush=True)
         return jsonify({"error": "Internal server error"}), 500
 
 @app.post("/register-auto")
+@prioritized("registration")
 def register_auto_route():
     try:
         data = request.get_json(force=True, silent=True) or {}
         print(f"/register-auto → student={data.get('student_id')}", flush=True)
-        result = register_face_auto(data)
+        result = register_face_auto(data, deadline=g.deadline)
         print(f"/register-auto result → {result.get('angle', '?')} | success={result.get('success')}", flush=True)
         return jsonify(result), 200
+    except DeadlineExceeded:
+        raise
     except Exception:
         print("Error in /register-auto:", traceback.format_exc(), flush=True)
         return jsonify({"error": "Internal server error"}), 500
     
 @app.post("/register-instructor")
+@prioritized("registration")
 def register_instructor():
     try:
         data = request.get_json(silent=True) or {}
         print(f"/register-instructor → instructor={data.get('instructor_id')}", flush=True)
-        result = register_instructor_face(data)
+        result = register_instructor_face(data, deadline=g.deadline)
         print(f"/register-instructor result → {result.get('angle', '?')} | success={result.get('success')}", flush=True)
         # Return the result from the face registration
         return jsonify(result), 200
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logging.error(f"/register-instructor error: {traceback.format_exc()}")
         return jsonify({"error": "Internal server error"}), 500
 
 @app.post("/recognize")
+@prioritized("interactive")
 def recognize_route():
     try:
         data = request.get_json(force=True, silent=True) or {}
@@ -207,19 +246,32 @@ def recognize_route():
             return jsonify({"success": False, "error": "Missing image field"}), 400
 
         print(f"/recognize → {len(registered_faces)} embeddings received", flush=True)
-        result = recognize_face({"image": base64_image, "registered_faces": registered_faces})
+        result = recognize_face(
+            {"image": base64_image, "registered_faces": registered_faces},
+            deadline=g.deadline,
+        )
         print(f"/recognize result → success={result.get('success')} match={result.get('student_id')} score={result.get('match_score')}", flush=True)
 
         return jsonify(result), 200
 
+    except DeadlineExceeded:
+        raise
     except Exception:
         print("Error in /recognize:", traceback.format_exc(), flush=True)
         return jsonify({"success": False, "error": "Internal server error"}), 500
     
 @app.post("/recognize-multi")
+@prioritized("live")
 def recognize_multi_route():
     try:
         data = request.get_json(force=True, silent=True) or {}
+        try:
+            data = resolve_shm_payload(data, request.environ)
+        except StaleHandle as e:
+            # Backend resends the frame inline.
+            return jsonify({"success": False, "error": str(e), "stale": True}), 409
+        except RejectedHandle as e:
+            return jsonify({"success": False, "error": str(e)}), 400
         faces = data.get("faces", [])
         registered_faces = data.get("registered_faces", [])
 
@@ -251,15 +303,17 @@ def recognize_multi_route():
         reg_embs = np.stack(embeddings_list, axis=0)
         seen_user_ids = set()  # Fix 5
 
-        for base64_image in faces:
+        for face in faces:
+            check_deadline(g.deadline, "decode")
 
             # Fix 1 — decode once
-            img_bgr = read_b64_to_bgr(base64_image)
+            img_bgr = read_face_to_bgr(face)
             if img_bgr is None or img_bgr.size == 0 or np.mean(img_bgr) < 5:
                 print("Skipping invalid crop", flush=True)
                 continue
 
             # Fix 2 — correct function (no internal flip)
+            check_deadline(g.deadline, "embed")
             emb = get_face_embedding(img_bgr)
             if emb is None:
                 print("No embedding extracted", flush=True)
@@ -299,6 +353,7 @@ def recognize_multi_route():
             seen_user_ids.add(user_id)
 
             # Fix 1 — reuse img_bgr, no second decode
+            check_deadline(g.deadline, "spoof")
             is_real, confidence, probs = check_real_or_spoof(img_bgr)
             spoof_status = "Real" if is_real else "Spoof"
 
@@ -319,14 +374,77 @@ def recognize_multi_route():
         print(f"Recognized {len(recognized)} face(s)")
         return jsonify({"success": True, "recognized": recognized}), 200
 
+    except DeadlineExceeded:
+        raise
     except Exception:
         print("Error in /recognize-multi:", traceback.format_exc())
         return jsonify({"success": False, "error": "Internal server error"}), 500
 
+@app.post("/embed-multi")
+@prioritized("live")
+def embed_multi_route():
+    # Embed-only pipeline: embeddings + liveness per face, the backend matches.
+    try:
+        data = request.get_json(force=True, silent=True) or {}
+        try:
+            data = resolve_shm_payload(data, request.environ)
+        except StaleHandle as e:
+            return jsonify({"success": False, "error": str(e), "stale": True}), 409
+        except RejectedHandle as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        faces = data.get("faces", [])
+
+        if not faces:
+            return jsonify({"success": False, "error": "Missing faces list"}), 400
+
+        results = []
+        for face in faces:
+            check_deadline(g.deadline, "decode")
+            img_bgr = read_face_to_bgr(face)
+            if img_bgr is None or img_bgr.size == 0 or np.mean(img_bgr) < 5:
+                print("Skipping invalid crop", flush=True)
+                continue
+
+            check_deadline(g.deadline, "embed")
+            emb = get_face_embedding(img_bgr)
+            if emb is None:
+                print("No embedding extracted", flush=True)
+                continue
+
+            emb = np.squeeze(np.array(emb, dtype=np.float32))
+            if emb.shape != (512,):
+                print(f"Invalid face embedding dim: {emb.shape}", flush=True)
+                continue
+
+            check_deadline(g.deadline, "spoof")
+            is_real, confidence, probs = check_real_or_spoof(img_bgr)
+
+            results.append({
+                "embedding": emb.tolist(),
+                "is_real": bool(is_real),
+                "spoof_confidence": confidence,
+                "real_prob": probs["real"],
+                "spoof_prob": probs["spoof"],
+            })
+
+        print(f"Embedded {len(results)} face(s)")
+        return jsonify({"success": True, "faces": results}), 200
+
+    except DeadlineExceeded:
+        raise
+    except Exception:
+        print("Error in /embed-multi:", traceback.format_exc())
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 7860))
+    # Only the reloader child actually serves requests.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_unix_socket_server(app)
     print(f"Starting Flask server on port {port}...", flush=True)
     app.run(host="0.0.0.0", port=port, debug=True)
 
 application = app
+# WSGI entry for a gunicorn instance bound only to the Unix socket (AI_UDS_PATH).
+local_application = local_transport_app(app)
@@ -0,0 +1,86 @@
+import time
+import threading
+from collections import defaultdict
+
+# ============================================================
+# CONFIGURATION
+# ============================================================
+# The backend forwards the caller's *remaining* budget in milliseconds
+# rather than an absolute timestamp, so clock skew between hosts doesn't
+# matter. The deadline is fixed against this process's monotonic clock
+# as soon as the request arrives.
+BUDGET_HEADER = "X-Request-Budget-Ms"
+
+PIPELINE_STAGES = ("queue", "decode", "detect", "embed", "spoof")
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage):
+        super().__init__(f"Deadline exceeded before stage: {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    def __init__(self, budget_ms):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000.0
+
+    @classmethod
+    def from_headers(cls, headers):
+        raw = headers.get(BUDGET_HEADER)
+        if raw is None:
+            return None
+        try:
+            return cls(max(0.0, float(raw)))
+        except (TypeError, ValueError):
+            return None
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, stage):
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+
+def check_deadline(deadline, stage):
+    """No-op when the caller sent no budget."""
+    if deadline is not None:
+        deadline.check(stage)
+
+
+# ============================================================
+# COUNTERS
+# ============================================================
+_lock = threading.Lock()
+_dropped = defaultdict(lambda: defaultdict(int))   # endpoint -> stage -> count
+_with_deadline = defaultdict(int)                  # endpoint -> requests carrying a budget
+
+
+def record_request(endpoint, deadline):
+    if deadline is None:
+        return
+    with _lock:
+        _with_deadline[endpoint] += 1
+
+
+def record_dropped(endpoint, stage):
+    with _lock:
+        _dropped[endpoint][stage] += 1
+
+
+def stats():
+    with _lock:
+        per_endpoint = {}
+        for endpoint in set(_with_deadline) | set(_dropped):
+            stages = dict(_dropped.get(endpoint, {}))
+            per_endpoint[endpoint] = {
+                "with_deadline": _with_deadline.get(endpoint, 0),
+                "cancelled_in_queue": stages.pop("queue", 0),
+                "dropped_mid_pipeline": stages,
+            }
+        total_dropped = sum(sum(s.values()) for s in _dropped.values())
+        return {"total_dropped": total_dropped, "endpoints": per_endpoint}
@@ -7,6 +7,7 @@ from scipy.spatial.distance import cosine
 from collections import defaultdict
 from utils.model_loader import get_face_model
 from utils.anti_spoofing import check_real_or_spoof  # ✅ Anti-spoof check
+from utils.deadline import DeadlineExceeded, check_deadline
 
 # ============================================================
 # CONFIGURATION
@@ -111,7 +112,7 @@ def find_matching_user(live_embedding, registered_faces, threshold=MATCH_THRESHO
 # ============================================================
 # MAIN RECOGNITION PIPELINE
 # ============================================================
-def recognize_face(data):
+def recognize_face(data, deadline=None):
     """Recognize face using ArcFace + ConvNeXt anti-spoofing (robust version)."""
     try:
         base64_image = data.get("image")
@@ -152,6 +153,7 @@ def recognize_face(data):
             img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
 
         # ---- STEP 1: Detect faces ----
+        check_deadline(deadline, "detect")
         start = time.time()
         faces = face_model.get(img_rgb)
         print(f"🕒 Detection took {time.time() - start:.2f}s")
@@ -191,6 +193,7 @@ def recognize_face(data):
         print(f"✅ Face detected (score={getattr(f, 'det_score', 0):.3f}) bbox={getattr(f, 'bbox', None)}")
 
         # ---- STEP 2: Anti-spoofing ----
+        check_deadline(deadline, "spoof")
         is_real, confidence, probs = check_real_or_spoof(face_crop, threshold=0.65)
         print(f"🛡️ Anti-spoof → real={probs['real']:.3f}, spoof={probs['spoof']:.3f}, th=0.50", flush=True)
 
@@ -199,6 +202,7 @@ def recognize_face(data):
         
         # ---- STEP 3: Ensure embedding is available ----
         if not hasattr(f, "embedding") or f.embedding is None:
+            check_deadline(deadline, "embed")
             print("⚙️ No embedding found → forcing re-extraction...")
             faces_with_emb = face_model.get(img_rgb)
             if faces_with_emb and hasattr(faces_with_emb[0], "embedding"):
@@ -227,6 +231,8 @@ def recognize_face(data):
             "message": "Face recognized successfully!"
         }
 
+    except DeadlineExceeded:
+        raise
     except Exception:
         print("❌ ERROR in recognize_face():", traceback.format_exc())
         return {"success": False, "error": "Internal server error"}
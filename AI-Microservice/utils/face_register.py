@@ -5,6 +5,7 @@ import numpy as np
 import mediapipe as mp
 from datetime import datetime
 from utils.model_loader import get_face_model
+from utils.deadline import DeadlineExceeded, check_deadline
 
 face_model = get_face_model()
 
@@ -38,7 +39,7 @@ def get_face_angle(landmarks, w, h):
         logging.warning(f"Angle detection failed: {str(e)}")
         return "front"
 
-def register_face_auto(data):
+def register_face_auto(data, deadline=None):
     try:
         student_id = data.get("student_id")
         base64_image = data.get("image")
@@ -62,6 +63,7 @@ def register_face_auto(data):
             return {"success": False, "error": "Invalid image format"}
 
         # --- FaceMesh: detect face and get angle ---
+        check_deadline(deadline, "detect")
         rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         results = face_mesh.process(rgb)
 
@@ -95,6 +97,7 @@ def register_face_auto(data):
 
         # --- ArcFace: extract embedding ---
         # Use original image for detection as it's more accurate than 112x112 resize
+        check_deadline(deadline, "embed")
         faces = face_model.get(img) 
 
         # Fix 3: Return success=False on no detection — clear failure signal
@@ -137,12 +140,14 @@ def register_face_auto(data):
             "created_at": datetime.utcnow().isoformat(),
         }
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logging.error(f"[register_face_auto] Exception for student_id={data.get('student_id')}: {str(e)}")
         return {"success": False, "error": "Internal server error"}
 
 
-def register_instructor_face(data):
+def register_instructor_face(data, deadline=None):
     try:
         instructor_id = data.get("instructor_id")
         base64_image = data.get("image")
@@ -156,6 +161,7 @@ def register_instructor_face(data):
         if img is None:
             return {"success": False, "error": "Image decoding failed"}
 
+        check_deadline(deadline, "detect")
         rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         results = face_mesh.process(rgb)
 
@@ -173,6 +179,7 @@ def register_instructor_face(data):
 
         logging.info(f"Detected angle: {angle}")
 
+        check_deadline(deadline, "embed")
         faces = face_model.get(img)
         if not faces:
             logging.warning(f"No faces detected by ArcFace model for {angle}. Image might be blurry or out of frame.")
@@ -193,6 +200,8 @@ def register_instructor_face(data):
             "created_at": datetime.utcnow().isoformat(),
         }
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logging.error(f"register_instructor_face() Exception: {str(e)}")
         return {"success": False, "error": "Internal server error"}
\ No newline at end of file
@@ -0,0 +1,193 @@
+import os
+import time
+import threading
+import itertools
+from contextlib import contextmanager
+from functools import wraps
+from flask import request, g, jsonify
+
+from utils.deadline import Deadline, DeadlineExceeded, record_request, record_dropped
+
+# ============================================================
+# CONFIGURATION
+# ============================================================
+# Lower number = served first. Live attendance frames are the most
+# latency-sensitive, then interactive login, then registration, then
+# bulk /embed and /antispoof calls.
+PRIORITY_CLASSES = {
+    "live": 0,
+    "interactive": 1,
+    "registration": 2,
+    "bulk": 3,
+}
+
+# Total model slots shared by every class (one slot = one request running
+# ArcFace / anti-spoof at a time).
+MAX_CONCURRENT = int(os.getenv("INFERENCE_MAX_CONCURRENT", 2))
+
+# Per-class caps so a registration burst can't take every slot.
+CLASS_CAPS = {
+    "live": int(os.getenv("INFERENCE_CAP_LIVE", MAX_CONCURRENT)),
+    "interactive": int(os.getenv("INFERENCE_CAP_INTERACTIVE", MAX_CONCURRENT)),
+    "registration": int(os.getenv("INFERENCE_CAP_REGISTRATION", 1)),
+    "bulk": int(os.getenv("INFERENCE_CAP_BULK", 1)),
+}
+
+# Starvation protection: every AGING_SECONDS spent waiting promotes a
+# ticket by one priority level, so low-priority work still progresses.
+AGING_SECONDS = float(os.getenv("INFERENCE_AGING_SECONDS", 2.0))
+
+
+class _Ticket:
+    __slots__ = ("cls", "priority", "seq", "enqueued_at", "granted")
+
+    def __init__(self, cls, seq):
+        self.cls = cls
+        self.priority = PRIORITY_CLASSES[cls]
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+    def effective_priority(self, now):
+        return self.priority - int((now - self.enqueued_at) / AGING_SECONDS)
+
+
+class InferenceScheduler:
+    """Priority admission gate in front of the shared face models."""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, caps=None):
+        self.max_concurrent = max_concurrent
+        self.caps = dict(caps or CLASS_CAPS)
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting = []
+        self._running = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._stats = {
+            cls: {"granted": 0, "completed": 0, "wait_total": 0.0, "wait_max": 0.0, "promoted": 0}
+            for cls in PRIORITY_CLASSES
+        }
+
+    # --------------------------
+    # Internal
+    # --------------------------
+    def _total_running(self):
+        return sum(self._running.values())
+
+    def _dispatch(self):
+        """Grant free slots to the best eligible waiting tickets (lock held)."""
+        now = time.monotonic()
+        while self._waiting and self._total_running() < self.max_concurrent:
+            eligible = [
+                t for t in self._waiting
+                if self._running[t.cls] < self.caps.get(t.cls, self.max_concurrent)
+            ]
+            if not eligible:
+                return
+            best = min(eligible, key=lambda t: (t.effective_priority(now), t.seq))
+            if best.effective_priority(now) < best.priority:
+                self._stats[best.cls]["promoted"] += 1
+            self._waiting.remove(best)
+            self._running[best.cls] += 1
+            best.granted = True
+            self._cond.notify_all()
+
+    # --------------------------
+    # Public API
+    # --------------------------
+    def acquire(self, cls, deadline=None):
+        if cls not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown inference class: {cls}")
+
+        with self._cond:
+            ticket = _Ticket(cls, next(self._seq))
+            self._waiting.append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                # Wake up periodically so aging can re-rank waiting tickets.
+                timeout = AGING_SECONDS
+                if deadline is not None:
+                    if deadline.expired():
+                        # Nobody is waiting for this answer any more.
+                        self._waiting.remove(ticket)
+                        raise DeadlineExceeded("queue")
+                    timeout = min(timeout, deadline.remaining())
+                self._cond.wait(timeout=timeout)
+                self._dispatch()
+
+            waited = time.monotonic() - ticket.enqueued_at
+            stats = self._stats[cls]
+            stats["granted"] += 1
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+            return ticket
+
+    def release(self, ticket):
+        with self._cond:
+            self._running[ticket.cls] -= 1
+            self._stats[ticket.cls]["completed"] += 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, cls, deadline=None):
+        ticket = self.acquire(cls, deadline=deadline)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self):
+        with self._cond:
+            waiting = {cls: 0 for cls in PRIORITY_CLASSES}
+            for t in self._waiting:
+                waiting[t.cls] += 1
+
+            per_class = {}
+            for cls, s in self._stats.items():
+                granted = s["granted"]
+                per_class[cls] = {
+                    "priority": PRIORITY_CLASSES[cls],
+                    "cap": self.caps.get(cls, self.max_concurrent),
+                    "running": self._running[cls],
+                    "waiting": waiting[cls],
+                    "completed": s["completed"],
+                    "promoted": s["promoted"],
+                    "avg_wait_ms": round(s["wait_total"] / granted * 1000, 2) if granted else 0.0,
+                    "max_wait_ms": round(s["wait_max"] * 1000, 2),
+                }
+
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": self._total_running(),
+                "waiting": len(self._waiting),
+                "classes": per_class,
+            }
+
+
+scheduler = InferenceScheduler()
+
+
+def prioritized(cls):
+    """Route decorator: run the handler inside an inference slot of `cls`.
+
+    The caller's deadline (if any) is exposed to the handler as `g.deadline`;
+    work that expires while queued or between pipeline stages is dropped.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            deadline = Deadline.from_headers(request.headers)
+            g.deadline = deadline
+            record_request(request.path, deadline)
+            try:
+                with scheduler.slot(cls, deadline=deadline):
+                    return fn(*args, **kwargs)
+            except DeadlineExceeded as e:
+                record_dropped(request.path, e.stage)
+                print(f"{request.path} dropped: deadline exceeded at {e.stage}", flush=True)
+                return jsonify({
+                    "success": False,
+                    "error": "Deadline exceeded",
+                    "stage": e.stage,
+                }), 504
+        return wrapper
+    return decorator
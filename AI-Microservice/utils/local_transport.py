@@ -0,0 +1,211 @@
+import os
+import mmap
+import tempfile
+import stat
+import struct
+import threading
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+# ============================================================
+# CONFIGURATION
+# ============================================================
+# When the backend runs on the same host it can talk to us over a Unix
+# domain socket instead of TCP loopback, and hand over image / gallery
+# bytes through shared memory (only small handles travel in the JSON).
+# Unset = TCP only, exactly as before.
+AI_UDS_PATH = os.getenv("AI_UDS_PATH")
+# Handles are only honored on requests that came in over that socket
+# (the TCP listener is public). Gallery snapshot files must live in the
+# backend's snapshot directory (server/utils/gallery_snapshot.py).
+_DEFAULT_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+GALLERY_SNAPSHOT_DIR = os.getenv("GALLERY_SNAPSHOT_DIR", os.path.join(_DEFAULT_DIR, "frams-galleries"))
+LOCAL_TRANSPORT_ENVIRON_KEY = "frams.local_transport"
+
+# Must match the backend writer (server/utils/local_transport.py):
+# every ring slot starts with (seq, length) followed by the payload.
+SLOT_HEADER = struct.Struct("<QQ")
+
+MAX_ATTACHED_SEGMENTS = 16
+
+
+class StaleHandle(Exception):
+    """The slot was reused (or the segment vanished) before we read it."""
+
+
+class RejectedHandle(Exception):
+    """Handles sent over TCP, or a snapshot path outside the snapshot directory."""
+
+
+# ============================================================
+# UNIX SOCKET SERVER
+# ============================================================
+def local_transport_app(app):
+    """WSGI wrapper marking requests as arrived on the Unix socket."""
+    def wsgi(environ, start_response):
+        environ[LOCAL_TRANSPORT_ENVIRON_KEY] = True
+        return app(environ, start_response)
+    return wsgi
+
+
+def is_local_request(environ):
+    return environ.get(LOCAL_TRANSPORT_ENVIRON_KEY) is True
+
+
+def start_unix_socket_server(app, path=AI_UDS_PATH):
+    """Serve `app` on a Unix socket in a background thread (python app_ai.py).
+
+    Under gunicorn, run a separate Unix-socket-only instance serving
+    app_ai:local_application (--bind unix:/path).
+    """
+    if not path:
+        return None
+
+    from werkzeug.serving import make_server
+
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.unlink(path)
+
+    server = make_server(f"unix://{path}", 0, local_transport_app(app), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="uds-server", daemon=True)
+    thread.start()
+    print(f"Serving on Unix socket {path}", flush=True)
+    return server
+
+
+# ============================================================
+# SHARED MEMORY READER
+# ============================================================
+_segments = OrderedDict()
+_segments_lock = threading.Lock()
+
+
+def _attach(name):
+    with _segments_lock:
+        shm = _segments.get(name)
+        if shm is not None:
+            _segments.move_to_end(name)
+            return shm
+
+        shm = shared_memory.SharedMemory(name=name)
+        # The backend owns the segment; don't let our resource tracker
+        # unlink it when this process exits.
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+
+        _segments[name] = shm
+        while len(_segments) > MAX_ATTACHED_SEGMENTS:
+            _, old = _segments.popitem(last=False)
+            old.close()
+        return shm
+
+
+def read_handle(handle):
+    """Copy one payload out of the backend's ring, verifying its sequence."""
+    try:
+        shm = _attach(handle["name"])
+    except FileNotFoundError:
+        raise StaleHandle(f"Shared memory segment {handle['name']} not found")
+
+    offset = int(handle["offset"])
+    seq, length = SLOT_HEADER.unpack_from(shm.buf, offset)
+    if seq != handle["seq"] or length != handle["len"]:
+        raise StaleHandle("Shared memory slot was overwritten")
+
+    start = offset + SLOT_HEADER.size
+    data = bytes(shm.buf[start:start + length])
+
+    # The writer zeroes the sequence before reusing a slot, so a change
+    # here means our copy may be torn.
+    seq_after, _ = SLOT_HEADER.unpack_from(shm.buf, offset)
+    if seq_after != seq:
+        raise StaleHandle("Shared memory slot was overwritten during read")
+    return data
+
+
+_snapshots = OrderedDict()
+
+
+def _snapshot_path(path):
+    """Resolved path of a snapshot file, refusing anything outside GALLERY_SNAPSHOT_DIR."""
+    root = os.path.realpath(GALLERY_SNAPSHOT_DIR)
+    real = os.path.realpath(str(path))
+    if not real.startswith(root + os.sep) or not real.endswith(".gal"):
+        raise RejectedHandle("Gallery snapshot outside the snapshot directory")
+    return real
+
+
+def _map_snapshot(path):
+    """Read-only map of a backend gallery snapshot file (LRU by path)."""
+    path = _snapshot_path(path)
+    with _segments_lock:
+        mm = _snapshots.get(path)
+        if mm is not None:
+            _snapshots.move_to_end(path)
+            return mm
+
+        try:
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            raise StaleHandle(f"Gallery snapshot {path} not found")
+
+        _snapshots[path] = mm
+        while len(_snapshots) > MAX_ATTACHED_SEGMENTS:
+            _snapshots.popitem(last=False)
+        return mm
+
+
+def _read_gallery(gallery):
+    if "file" in gallery:
+        # Snapshot files are immutable (new versions get new names), so the
+        # rows can be used in place without copying or sequence checks.
+        count, dim = gallery["count"], gallery["dim"]
+        mm = _map_snapshot(gallery["file"])
+        matrix = np.frombuffer(mm, np.dtype(gallery["dtype"]), count * dim, gallery["offset"])
+        return matrix.reshape(count, dim).astype(np.float32, copy=False)
+
+    matrix = np.frombuffer(read_handle(gallery["handle"]), dtype=np.float32)
+    return matrix.reshape(gallery["count"], gallery["dim"])
+
+
+def resolve_shm_payload(data, environ):
+    """Replace shared-memory handles in a /recognize-multi body with data.
+
+    faces → raw encoded image bytes (one ring slot holding every image
+    back to back, split by "sizes"), registered_faces → dicts whose
+    "embedding" is a float32 row of the transferred gallery matrix (a ring
+    slot, or the backend's mapped gallery snapshot file).
+    Bodies without an "shm" key are returned unchanged; bodies with one
+    raise RejectedHandle unless the request came over the Unix socket.
+    """
+    shm = data.get("shm")
+    if not shm:
+        return data
+    if not is_local_request(environ):
+        raise RejectedHandle("Shared memory handles are only accepted on the local socket")
+
+    faces = []
+    blob = shm.get("faces")
+    if blob:
+        data, pos = read_handle(blob), 0
+        for size in blob.get("sizes", []):
+            faces.append(data[pos:pos + size])
+            pos += size
+
+    registered_faces = []
+    gallery = shm.get("gallery")
+    if gallery:
+        matrix = _read_gallery(gallery)
+        for row, meta in zip(matrix, shm.get("meta", [])):
+            registered_faces.append({**meta, "embedding": row})
+
+    resolved = dict(data)
+    resolved.pop("shm")
+    resolved["faces"] = faces
+    resolved["registered_faces"] = registered_faces
+    return resolved
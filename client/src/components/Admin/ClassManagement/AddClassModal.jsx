@@ -96,19 +96,33 @@ const AddClassModal = ({ isOpen, onClose, onAdded }) => {
       const formData = new FormData();
       formData.append("file", selectedFile);
 
-      await axios.post(`${API_URL}/api/admin/${classId}/upload-students`, formData, {
+      const uploadRes = await axios.post(`${API_URL}/api/admin/${classId}/upload-students`, formData, {
         headers: {
           Authorization: `Bearer ${token}`,
           "Content-Type": "multipart/form-data",
         },
       });
 
+      // The roster is parsed in a background job; wait for it to finish.
+      const jobId = uploadRes.data.job_id;
+      let job = { status: "queued" };
+      while (jobId && ["queued", "running"].includes(job.status)) {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobRes = await axios.get(`${API_URL}/api/jobs/${jobId}`, {
+          headers: { Authorization: `Bearer ${token}` },
+        });
+        job = jobRes.data;
+      }
+      if (jobId && job.status !== "done") {
+        throw new Error(job.error || `Student upload ${job.status}`);
+      }
+
       toast.success("🎉 Class created and students added!");
       onAdded();
       onClose();
       resetModal();
     } catch (err) {
-      toast.error(err.response?.data?.error || "Failed to create class");
+      toast.error(err.response?.data?.error || err.message || "Failed to create class");
     } finally {
       setLoading(false);
     }
@@ -3,6 +3,10 @@ import axios from "axios";
 import * as faceapi from "face-api.js";
 import { toast } from "react-toastify";
 
+// How long a recognition frame is worth waiting for; stale frames are
+// dropped server-side once this budget runs out.
+const RECOGNITION_BUDGET_MS = 8000;
+
 // ⚡ Global model loader — loads once, reused across all sessions
 let modelsLoaded = false;
 let modelsLoadingPromise = null;
@@ -288,7 +292,12 @@ const AttendanceLiveSession = ({
       const res = await axios.post(
         "http://127.0.0.1:8080/api/face/multi-recognize",
         { faces: facesToSend, class_id: activeClassId },
-        { signal: abortControllerRef.current.signal }
+        {
+          signal: abortControllerRef.current.signal,
+          timeout: RECOGNITION_BUDGET_MS,
+          // Backend forwards what's left of this budget to the AI service
+          headers: { "X-Client-Timeout-Ms": RECOGNITION_BUDGET_MS },
+        }
       );
 
       console.log("Backend responded:", res.data);
@@ -382,6 +391,14 @@ const AttendanceLiveSession = ({
       }
     } catch (err) {
       if (axios.isCancel(err) || err?.code === "ERR_CANCELED") return;
+      if (err?.response?.status === 503 && err.response.data?.busy) {
+        // Server is shedding load — hold off until its retry hint
+        const retryMs = err.response.data.retry_after_ms || 1500;
+        lastSentRef.current = Date.now() + retryMs - 1500;
+        return;
+      }
+      // Previous frame still in flight — this one was dropped, nothing to log
+      if (err?.response?.status === 409 && err.response.data?.superseded) return;
       console.error("Recognition error:", err);
     }
   };
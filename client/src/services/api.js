@@ -12,7 +12,10 @@ export const studentFaceLogin = (payload) =>
   API.post("/face/login", payload, { timeout: 90000 });
 
 export const registerFaceAuto = (payload) =>
-  API.post("/face/register-auto", payload, { timeout: 60000});
+  API.post("/face/register-auto", payload, {
+    timeout: 60000,
+    headers: { "X-Client-Timeout-Ms": 60000 },
+  });
 
 export const registerFaceFrame = (payload) =>
   API.post("/face/register-frame", payload);
@@ -24,7 +27,10 @@ export const detectBlink = (payload) =>
   API.post("/blink/blink-detect", payload);
 
 export const registerInstructorFace = (payload) =>
-  API.post("/face/register-instructor", payload, { timeout: 60000 });
+  API.post("/face/register-instructor", payload, {
+    timeout: 60000,
+    headers: { "X-Client-Timeout-Ms": 60000 },
+  });
 
 // ==============================
 // 🔹 Attendance Control
@@ -19,8 +19,8 @@ CORS(
     app,
     resources={r"/*": {"origins": allowed_origins}},
     supports_credentials=True,
-    expose_headers=["Content-Type", "Authorization"],
-    allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["Content-Type", "Authorization", "X-Total-Count", "X-Next-Cursor", "Content-Disposition"],
+    allow_headers=["Content-Type", "Authorization", "X-Client-Timeout-Ms"],
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
 )
 
@@ -34,14 +34,29 @@ jwt = JWTManager(app)
 from routes.auth_routes import auth_bp
 from routes.instructor_routes import instructor_bp
 from routes.attendance_routes import attendance_bp
-from routes.face_routes import face_bp
+from routes.face_routes import face_bp, limiter, warm_class_caches, evict_class_caches
 from routes.admin import admin_bp
+from routes.job_routes import job_bp
+from utils.ai_client import ai_client
+from utils.embedding_migration import start_background_migration
+from utils.student_schema import start_student_schema_migration
+from utils.programs import start_program_key_backfill
+from utils.gallery_versions import start_gallery_version_watcher
+from utils.gallery_warmup import start_gallery_warmup
+from utils.attendance_buffer import start_attendance_buffer
+from utils.db_indexes import apply_indexes_on_start
+from utils.attendance_rollups import start_rollup_job
+from utils.attendance_stats import start_stats_seed
+from utils.jobs import start_job_maintenance
 
 app.register_blueprint(auth_bp, url_prefix="/api/auth")
 app.register_blueprint(instructor_bp, url_prefix="/api/instructor")
 app.register_blueprint(attendance_bp, url_prefix="/api/attendance")
 app.register_blueprint(face_bp, url_prefix="/api/face")
 app.register_blueprint(admin_bp)
+app.register_blueprint(job_bp, url_prefix="/api/jobs")
+
+limiter.init_app(app)
 
 # Health checks 
 @app.route("/")
@@ -72,6 +87,16 @@ def allow_options_requests():
 # Preload embeddings 
 def preload_embeddings():
     try:
+        apply_indexes_on_start()
+        start_background_migration()
+        start_student_schema_migration()
+        start_program_key_backfill()
+        start_gallery_version_watcher()
+        start_gallery_warmup(warm_class_caches, evict_class_caches)
+        start_attendance_buffer()
+        start_rollup_job()
+        start_stats_seed()
+        start_job_maintenance()
         print("Embeddings cached successfully!")
     except Exception as e:
         print(f"Failed to preload embeddings: {e}")
@@ -86,10 +111,14 @@ else:
 # Connectivity check
 def check_reachability():
     urls = {
-        "Hugging Face Space": "http://127.0.0.1:7860",
         "Frontend (Vercel)": "https://face-recognition-attendance-monitor.vercel.app",
     }
     print("\nChecking external service connectivity...")
+    try:
+        res = ai_client.get("/healthz", timeout=5)
+        print(f"AI service reachable → {ai_client.base_url}" if res.status_code == 200 else f"⚠️ AI service responded {res.status_code}")
+    except Exception as e:
+        print(f"AI service unreachable → {e}")
     for name, url in urls.items():
         try:
             res = requests.get(url, timeout=5)
@@ -4,15 +4,6 @@ from pymongo.errors import DuplicateKeyError
 
 admins_collection = db["admins"]
 
-def _ensure_indexes():
-    try:
-        admins_collection.create_index("user_id", unique=True, name="uniq_user_id")
-        admins_collection.create_index("email", unique=True, name="uniq_email")
-    except Exception:
-        pass
-
-_ensure_indexes()
-
 def find_admin_by_user_id(user_id):
     return admins_collection.find_one({"user_id": user_id})
 
@@ -1,5 +1,6 @@
 from config.db_config import db
 from datetime import datetime, timedelta, timezone
+from utils.programs import program_key
 
 attendance_logs_collection = db["attendance_logs"]
 classes_collection = db["classes"]
@@ -99,6 +100,7 @@ def log_attendance(class_data, student_data, status="Present", class_start_time=
         "instructor_first_name": class_data.get("instructor_first_name"),
         "instructor_last_name": class_data.get("instructor_last_name"),
         "course": class_data.get("course"),
+        "program_key": program_key(class_data.get("course")),
         "section": class_data.get("section"),
         "date": today_date, 
         "students": []
@@ -231,6 +233,7 @@ def mark_absent_bulk(class_data, date_val, student_list):
             "instructor_first_name": class_data.get("instructor_first_name"),
             "instructor_last_name": class_data.get("instructor_last_name"),
             "course": class_data.get("course"),
+            "program_key": program_key(class_data.get("course")),
             "section": class_data.get("section"),
             "date": date_val,
             "students": []
@@ -252,8 +255,3 @@ def mark_absent_bulk(class_data, date_val, student_list):
                 "time_logged": now
             }}}
         )
-
-
-def ensure_indexes():
-    attendance_logs_collection.create_index([("class_id", 1), ("date", 1)], unique=False)
-    attendance_logs_collection.create_index([("students.student_id", 1), ("date", 1)])
@@ -1,5 +1,14 @@
 from config.db_config import db
 from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo import ReturnDocument
+from utils.attendance_buffer import attendance_buffer
+from utils.programs import program_key
+from utils.attendance_events import (
+    attendance_events_collection,
+    hydrate_sessions,
+    record_events,
+)
 
 attendance_logs_collection = db["attendance_logs"]
 
@@ -63,81 +72,47 @@ def log_attendance(class_data, student_data, status="Present", date_val=None, cl
         print(f"⚠️ {student_data['student_id']} already logged today — skipping.")
         return None
 
-    base_filter = {"class_id": class_data["class_id"], "date": date_val}
-
-    attendance_logs_collection.update_one(
-        base_filter,
-        {
-            "$setOnInsert": {
-                "class_id": class_data["class_id"],
-                "subject_code": class_data.get("subject_code"),
-                "subject_title": class_data.get("subject_title"),
-                "instructor_id": class_data.get("instructor_id"),
-                "instructor_first_name": class_data.get("instructor_first_name"),
-                "instructor_last_name": class_data.get("instructor_last_name"),
-                "course": class_data.get("course"),
-                "section": class_data.get("section"),
-                "school_year": class_data.get("school_year"),
-                "semester": class_data.get("semester"),
-                "date": date_val,
-                "students": [],
-                "start_time": _now_time_str(),    
-                "end_time": None                   
-            }
-        },
-        upsert=True
-    )
-
-    res = attendance_logs_collection.update_one(
-        {**base_filter, "students.student_id": student_data["student_id"]},
-        {
-            "$set": {
-                "students.$.first_name": student_data["first_name"],
-                "students.$.last_name": student_data["last_name"],
-                "students.$.status": status,
-                "students.$.time": _now_time_str(),
-                "students.$.time_logged": now,
-                "end_time": _now_time_str()   
-            }
-        }
-    )
-
-    if res.modified_count == 0:
-        attendance_logs_collection.update_one(
-            base_filter,
-            {
-                "$push": {
-                    "students": {
-                        "student_id": student_data["student_id"],
-                        "first_name": student_data["first_name"],
-                        "last_name": student_data["last_name"],
-                        "status": status,
-                        "time": _now_time_str(),
-                        "time_logged": now
-                    }
-                },
-                "$set": {
-                    "end_time": _now_time_str()   
-                }
-            }
-        )
-
-    return True
+    # Upsert of the day's log + set-or-push of the entry, written behind.
+    attendance_buffer.add_daily_entry(class_data, date_val, {
+        "student_id": student_data["student_id"],
+        "first_name": student_data["first_name"],
+        "last_name": student_data["last_name"],
+        "status": status,
+        "time": _now_time_str(),
+        "time_logged": now
+    })
+
+    return {
+        "class_id": class_data["class_id"],
+        "student_id": student_data["student_id"],
+        "date": date_val,
+        "status": status
+    }
 
 def already_logged_today(student_id, class_id, date_val=None):
 
     date_val = _parse_date_str(date_val) if date_val else _today_date_str()
+    if attendance_buffer.is_pending_daily(student_id, class_id, date_val):
+        return True
+    base = {"class_id": class_id, "date": date_val, "student_id": student_id}
+    if attendance_events_collection.find_one(base, {"_id": 1}) is not None:
+        return True
+    # Logs written before attendance_events, not yet migrated.
     return attendance_logs_collection.find_one({
         "class_id": class_id,
         "date": date_val,
         "students.student_id": student_id
-    }) is not None
+    }, {"_id": 1}) is not None
 
 def has_logged_attendance(student_id, class_id, date_val=None):
     return already_logged_today(student_id, class_id, date_val)
 
 def get_attendance_by_student(student_id):
-    docs = attendance_logs_collection.find({"students.student_id": student_id}).sort("date", -1)
+    session_ids = attendance_events_collection.distinct("session_id", {"student_id": student_id})
+    docs = hydrate_sessions(attendance_logs_collection.find({"$or": [
+        {"_id": {"$in": [ObjectId(sid) for sid in session_ids]}},
+        {"students.student_id": student_id},
+    ]}).sort("date", -1))
     out = []
     for d in docs:
         s = next((x for x in d.get("students", []) if x.get("student_id") == student_id), None)
@@ -162,7 +137,7 @@ def get_attendance_by_student(student_id):
     return out
 
 def get_attendance_by_class(class_id):
-    docs = attendance_logs_collection.find({"class_id": class_id}).sort("date", 1)
+    docs = hydrate_sessions(attendance_logs_collection.find({"class_id": class_id}).sort("date", 1))
     out = []
     for d in docs:
         out.append({
@@ -175,9 +150,9 @@ def get_attendance_by_class(class_id):
 def get_attendance_logs_by_class_and_date(class_id, start_date, end_date):
     start = _parse_date_str(start_date)
     end = _parse_date_str(end_date)
-    docs = attendance_logs_collection.find(
+    docs = hydrate_sessions(attendance_logs_collection.find(
         {"class_id": class_id, "date": {"$gte": start, "$lte": end}}
-    ).sort("date", 1)
+    ).sort("date", 1))
 
     out = []
     for d in docs:
@@ -203,7 +178,7 @@ def mark_absent_bulk(class_data, date_val, student_list):
 
     base_filter = {"class_id": class_data["class_id"], "date": date_val}
 
-    attendance_logs_collection.update_one(
+    log = attendance_logs_collection.find_one_and_update(
         base_filter,
         {
             "$setOnInsert": {
@@ -214,42 +189,29 @@ def mark_absent_bulk(class_data, date_val, student_list):
                 "instructor_first_name": class_data.get("instructor_first_name"),
                 "instructor_last_name": class_data.get("instructor_last_name"),
                 "course": class_data.get("course"),
+                "program_key": program_key(class_data.get("course")),
                 "section": class_data.get("section"),
                 "school_year": class_data.get("school_year"),
                 "semester": class_data.get("semester"),
                 "date": date_val,
                 "students": [],
-                "start_time": now_time_str, 
-                "end_time": None             
-            }
+                "start_time": now_time_str
+            },
+            "$max": {"end_time": now_time_str}
         },
-        upsert=True
+        upsert=True,
+        return_document=ReturnDocument.AFTER
     )
 
-    for s in student_list:
-        attendance_logs_collection.update_one(
-            {
-                **base_filter,
-                "students.student_id": {"$ne": s["student_id"]}
-            },
-            {
-                "$push": {
-                    "students": {
-                        "student_id": s["student_id"],
-                        "first_name": s["first_name"],
-                        "last_name": s["last_name"],
-                        "status": "Absent",
-                        "time": now_time_str,
-                        "time_logged": now
-                    }
-                },
-                "$set": {
-                    "end_time": now_time_str  
-                }
-            }
-        )
-
-# Maintenance
-def ensure_indexes():
-    attendance_logs_collection.create_index([("class_id", 1), ("date", 1)], unique=False)
-    attendance_logs_collection.create_index([("students.student_id", 1), ("date", 1)])
+    # Absent only where the student has no entry yet (first write wins).
+    record_events(log, [
+        {
+            "student_id": s["student_id"],
+            "first_name": s["first_name"],
+            "last_name": s["last_name"],
+            "status": "Absent",
+            "time": now_time_str,
+            "time_logged": now
+        }
+        for s in student_list
+    ])
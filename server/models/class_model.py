@@ -1,6 +1,8 @@
 from config.db_config import db
 from datetime import datetime
 from bson import ObjectId
+from utils.gallery_versions import bump_class
+from utils.programs import program_key
 
 classes_collection = db["classes"]
 students_collection = db["students"]
@@ -21,12 +23,7 @@ def normalize_schedule_blocks(blocks):
 
 # Assign student to a class (manual/admin or auto)
 def assign_student_to_subject(student_id, subject_id, course=None, year_level=None, section=None, semester=None):
-    student = students_collection.find_one({
-        "$or": [
-            {"student_id": student_id},
-            {"Student_ID": student_id}
-        ]
-    })
+    student = students_collection.find_one({"student_id": student_id})
     if not student:
         return {"error": "Student not found"}
 
@@ -39,11 +36,11 @@ def assign_student_to_subject(student_id, subject_id, course=None, year_level=No
     })
 
     student_info = {
-        "student_id": student.get("student_id") or student.get("Student_ID"),
-        "first_name": student.get("first_name") or student.get("First_Name"),
-        "last_name": student.get("last_name") or student.get("Last_Name"),
-        "course": course or student.get("course") or student.get("Course"),
-        "section": section or student.get("section") or student.get("Section"),
+        "student_id": student.get("student_id"),
+        "first_name": student.get("First_Name"),
+        "last_name": student.get("Last_Name"),
+        "course": course or student.get("Course"),
+        "section": section or student.get("Section"),
         "year_level": year_level or subject.get("year_level"),
         "semester": semester or subject.get("semester")
     }
@@ -63,6 +60,7 @@ def assign_student_to_subject(student_id, subject_id, course=None, year_level=No
                 {"_id": class_doc["_id"]},
                 {"$push": {"students": student_info}}
             )
+            bump_class(class_doc["_id"])
     else:
         new_class = {
             "subject_id": str(subject_id),
@@ -72,6 +70,7 @@ def assign_student_to_subject(student_id, subject_id, course=None, year_level=No
             "instructor_first_name": instructor.get("first_name", "N/A") if instructor else "N/A",
             "instructor_last_name": instructor.get("last_name", "N/A") if instructor else "N/A",
             "course": student_info["course"],
+            "program_key": program_key(student_info["course"]),
             "section": student_info["section"],
             "year_level": str(student_info["year_level"]),
             "semester": student_info["semester"],
@@ -89,11 +88,11 @@ def assign_student_from_cor(student, subject_doc, section, year_level, semester)
     subject_id = str(subject_doc["_id"])
 
     student_info = {
-        "student_id": student.get("student_id") or student.get("Student_ID"),
-        "first_name": student.get("first_name") or student.get("First_Name"),
-        "last_name": student.get("last_name") or student.get("Last_Name"),
-        "course": student.get("course") or student.get("Course"),
-        "section": section or student.get("section") or student.get("Section"),
+        "student_id": student.get("student_id"),
+        "first_name": student.get("First_Name"),
+        "last_name": student.get("Last_Name"),
+        "course": student.get("Course"),
+        "section": section or student.get("Section"),
         "year_level": year_level,
         "semester": semester
     }
@@ -112,12 +111,14 @@ def assign_student_from_cor(student, subject_doc, section, year_level, semester)
                 {"_id": class_doc["_id"]},
                 {"$push": {"students": student_info}}
             )
+            bump_class(class_doc["_id"])
     else:
         new_class = {
             "subject_id": subject_id,
             "subject_code": subject_doc.get("subject_code"),
             "subject_title": subject_doc.get("subject_title"),
             "course": student_info["course"],
+            "program_key": program_key(student_info["course"]),
             "section": student_info["section"],
             "year_level": str(year_level),
             "semester": semester,
@@ -131,18 +132,22 @@ def assign_student_from_cor(student, subject_doc, section, year_level, semester)
 
 
 # Auto-assign matching students to subject (bulk for same block)
-def auto_assign_matching_students(subject_id, course, year_level, section, semester):
-    matching_students = students_collection.find({
-        "$or": [
-            {"course": course, "year_level": str(year_level), "section": section, "semester": semester},
-            {"Course": course, "Year_Level": str(year_level), "Section": section, "Semester": semester}
-        ]
-    })
-
-    for student in matching_students:
-        student_id = student.get("student_id") or student.get("Student_ID")
+# Pass a job handle (utils/jobs.py) to run it as a background job with progress.
+def auto_assign_matching_students(subject_id, course, year_level, section, semester, job=None):
+    query = {"Course": course, "Year_Level": str(year_level), "Section": section, "Semester": semester}
+    if job:
+        job.progress(0, total=students_collection.count_documents(query))
+
+    assigned = 0
+    for i, student in enumerate(students_collection.find(query, {"student_id": 1}), 1):
+        student_id = student.get("student_id")
         if student_id:
             assign_student_to_subject(student_id, subject_id, course, year_level, section, semester)
+            assigned += 1
+        if job and i % 50 == 0:
+            job.progress(i)
+
+    return {"assigned": assigned}
 
 
 # Get all student-class entries for a subject
@@ -1,11 +1,32 @@
 from config.db_config import db
 from datetime import datetime  
+from pymongo import ReturnDocument
+from utils.embedding_codec import encode_embedding, decode_embeddings, compute_centroid
+from utils.gallery_versions import bump_student, bump_instructor
+from utils.programs import program_key
 
 # Collections
 students_collection = db["students"]
 attendance_collection = db["attendance_logs"]
 instructors_collection = db["instructors"]
 
+CENTROID_PROJECTION = {"embeddings": 1, "embeddings_updated_at": 1}
+
+# Keep the per-user centroid in sync with its angle embeddings
+def update_embedding_centroid(collection, doc):
+    if not doc:
+        return False
+    centroid = compute_centroid(doc.get("embeddings"))
+    if centroid is None:
+        return False
+    # Only write if no newer angle landed since `doc` was read; that
+    # writer recomputes the centroid from the fuller document itself.
+    result = collection.update_one(
+        {"_id": doc["_id"], "embeddings_updated_at": doc.get("embeddings_updated_at")},
+        {"$set": {"embedding_centroid": encode_embedding(centroid)}},
+    )
+    return result.modified_count == 1
+
 # Save / Update student face data
 def save_face_data(student_id, update_fields):
     try:
@@ -26,22 +47,29 @@ def save_face_data(student_id, update_fields):
 
         if update_fields.get("Course"):
             set_ops["Course"] = update_fields["Course"]
+            set_ops["program_key"] = program_key(update_fields["Course"])
 
         if embeddings and isinstance(embeddings, dict):
             for angle, vector in embeddings.items():
-                if vector and isinstance(vector, list):
-                    set_ops[f"embeddings.{angle}"] = vector
+                if vector is not None and len(vector):
+                    set_ops[f"embeddings.{angle}"] = encode_embedding(vector)
+                    set_ops["embeddings_updated_at"] = datetime.utcnow()
 
         update_ops = {
             "$set": set_ops,
             "$setOnInsert": {"created_at": datetime.utcnow()},
         }
 
-        result = students_collection.update_one(
+        doc = students_collection.find_one_and_update(
             {"student_id": student_id},
             update_ops,
-            upsert=True
+            projection=CENTROID_PROJECTION,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
         )
+        if "embeddings_updated_at" in set_ops:
+            update_embedding_centroid(students_collection, doc)
+        bump_student(student_id)
 
         updated_angles = list(embeddings.keys()) if embeddings else []
         print(f"✅ Face data saved for {student_id}. Updated angles: {updated_angles}")
@@ -68,19 +96,25 @@ def save_face_data_for_instructor(instructor_id, update_fields):
 
         if embeddings and isinstance(embeddings, dict):
             for angle, vector in embeddings.items():
-                if vector and isinstance(vector, list):
-                    set_ops[f"embeddings.{angle}"] = vector
+                if vector is not None and len(vector):
+                    set_ops[f"embeddings.{angle}"] = encode_embedding(vector)
+                    set_ops["embeddings_updated_at"] = datetime.utcnow()
 
         update_ops = {
             "$set": set_ops,
             "$setOnInsert": {"created_at": datetime.utcnow()},
         }
 
-        result = instructors_collection.update_one(
+        doc = instructors_collection.find_one_and_update(
             {"instructor_id": instructor_id},
             update_ops,
-            upsert=True  
+            projection=CENTROID_PROJECTION,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
         )
+        if "embeddings_updated_at" in set_ops:
+            update_embedding_centroid(instructors_collection, doc)
+        bump_instructor(instructor_id)
 
         updated_angles = list(embeddings.keys()) if embeddings else []
         print(f"Face data saved for instructor {instructor_id}. Updated angles: {updated_angles}")
@@ -92,20 +126,20 @@ def save_face_data_for_instructor(instructor_id, update_fields):
         print(traceback.format_exc())
         return False
 
-# Normalize student document
+# Student document (canonical fields, utils/student_schema.py) -> API shape
 def normalize_student(doc):
     if not doc:
         return None
     return {
-        "student_id": doc.get("student_id") or doc.get("Student_ID", ""),
-        "first_name": doc.get("first_name") or doc.get("First_Name", ""),
-        "last_name": doc.get("last_name") or doc.get("Last_Name", ""),
-        "middle_name": doc.get("middle_name") or doc.get("Middle_Name", ""),
-        "course": doc.get("course") or doc.get("Course", ""),
-        "section": doc.get("section") or doc.get("Section", ""),
-        "email": doc.get("email") or doc.get("Email", ""),
-        "contact_number": doc.get("contact_number") or doc.get("Contact_Number", ""),
-        "subjects": doc.get("subjects") or doc.get("Subjects", []),
+        "student_id": doc.get("student_id", ""),
+        "first_name": doc.get("First_Name", ""),
+        "last_name": doc.get("Last_Name", ""),
+        "middle_name": doc.get("Middle_Name", ""),
+        "course": doc.get("Course", ""),
+        "section": doc.get("Section", ""),
+        "email": doc.get("Email", ""),
+        "contact_number": doc.get("Contact_Number", ""),
+        "subjects": doc.get("Subjects", []),
         "created_at": doc.get("created_at"),
         "embeddings": doc.get("embeddings", {})
     }
@@ -119,6 +153,7 @@ def load_registered_faces():
         for doc in cursor:
             student = normalize_student(doc)
             if student and student["student_id"]:
+                student["embeddings"] = decode_embeddings(student["embeddings"])
                 registered_faces.append(student)
 
         print(f"📥 Loaded {len(registered_faces)} registered students with embeddings.")
@@ -130,12 +165,8 @@ def load_registered_faces():
 # Lookup student by ID
 def get_student_by_id(student_id):
     try:
-        student = students_collection.find_one({
-            "$or": [
-                {"student_id": student_id},
-                {"Student_ID": student_id}
-            ]
-        })
+        # Profile only: the live path never needs the embeddings here.
+        student = students_collection.find_one({"student_id": student_id}, {"embeddings": 0})
         return normalize_student(student)
     except Exception as e:
         print("❌ MongoDB lookup error:", str(e))
@@ -154,6 +185,7 @@ def save_attendance_log(student_id, subject_id, timestamp=None, confidence=None)
             "first_name": student["first_name"],
             "last_name": student["last_name"],
             "course": student["course"],
+            "program_key": program_key(student["course"]),
             "section": student["section"],
             "subject_id": subject_id,
             "timestamp": timestamp or datetime.utcnow(),
@@ -1,30 +1,92 @@
 from config.db_config import db
+from utils.attendance_stats import student_stats_many
+from utils.programs import with_program_key
+from utils.student_schema import canonical_student
 
 # Reference to the MongoDB 'students' collection
 students_collection = db["students"]
 
-# Create a new student (expects lowercase keys ideally)
+# Create a new student (legacy key names are renamed to the canonical ones)
 def create_student(student_data):
-    return students_collection.insert_one(student_data)
+    return students_collection.insert_one(with_program_key(canonical_student(student_data)))
 
-# Find one student by student_id (supports both student_id and legacy Student_ID)
+# Find one student by student_id (unique index; see utils/student_schema.py)
 def find_student_by_student_id(student_id):
-    return students_collection.find_one({
-        "$or": [
-            {"student_id": student_id},
-            {"Student_ID": student_id}
-        ]
-    })
-
-# Get one student by ID (same as above, fallback support)
+    return students_collection.find_one({"student_id": student_id})
+
+# Get one student by ID (same as above)
 def get_student_by_id(student_id):
-    return students_collection.find_one({
-        "$or": [
-            {"student_id": student_id},
-            {"Student_ID": student_id}
-        ]
-    })
+    return students_collection.find_one({"student_id": student_id})
 
 # Get all students in the system
 def get_all_students():
     return list(students_collection.find({}))
+
+
+# Admin students list
+STUDENT_LIST_PROJECTION = {
+    "_id": 0,
+    "student_id": 1,
+    "First_Name": 1,
+    "Last_Name": 1,
+    "Middle_Name": 1,
+    "Course": 1,
+    "Section": 1,
+    "created_at": 1,
+}
+STUDENT_SORT_FIELDS = {
+    "name": ["Last_Name", "First_Name"],
+    "student_id": ["student_id"],
+    "created_at": ["created_at"],
+}
+
+
+def list_students_with_rates(query, sort=None, page=None, per_page=50):
+    """(rows, total) for the admin students list, attendance rate included.
+
+    sort is one of STUDENT_SORT_FIELDS or "rate", "-" prefixed for
+    descending. Rates come from the attendance_stats counters in one read:
+    just the page's, unless sorting by rate needs all of them.
+    """
+    descending = bool(sort) and sort.startswith("-")
+    key = (sort or "").lstrip("-")
+
+    cursor = students_collection.find(query, STUDENT_LIST_PROJECTION)
+    order = [(f, -1 if descending else 1) for f in STUDENT_SORT_FIELDS.get(key, [])]
+    if page:
+        # _id breaks ties so pages neither repeat nor skip students
+        # (the rate sort below is stable over this order).
+        order.append(("_id", 1))
+    if order:
+        cursor = cursor.sort(order)
+    page_in_db = bool(page) and key != "rate"
+    if page_in_db:
+        total = students_collection.count_documents(query)
+        cursor = cursor.skip((page - 1) * per_page).limit(per_page)
+    students = list(cursor)
+
+    rates = student_stats_many(s.get("student_id") for s in students)
+    rows = [
+        {
+            "student_id": s.get("student_id"),
+            "first_name": s.get("First_Name"),
+            "last_name": s.get("Last_Name"),
+            "middle_name": s.get("Middle_Name"),
+            "course": s.get("Course"),
+            "section": s.get("Section"),
+            "created_at": s.get("created_at"),
+            "attendance_rate": rates.get(s.get("student_id"), {}).get("rate"),
+        }
+        for s in students
+    ]
+
+    if key == "rate":
+        # Students without any attendance yet go last either way.
+        rated = [r for r in rows if r["attendance_rate"] is not None]
+        rated.sort(key=lambda r: r["attendance_rate"], reverse=descending)
+        rows = rated + [r for r in rows if r["attendance_rate"] is None]
+    if not page_in_db:
+        total = len(rows)
+        if page:
+            rows = rows[(page - 1) * per_page:page * per_page]
+    return rows, total
@@ -1,6 +1,7 @@
 from config.db_config import db
 from bson import ObjectId
 from datetime import datetime
+from utils.programs import with_program_key
 
 subjects_collection = db["subjects"]
 
@@ -9,6 +10,7 @@ def create_subject(subject_data):
     subject_data["created_at"] = datetime.utcnow()
     subject_data.setdefault("year_level", None)
     subject_data.setdefault("semester", None)
+    with_program_key(subject_data)
     return subjects_collection.insert_one(subject_data)
 
 # Find a subject by subject_code (avoid duplicates / match COR)
@@ -1,8 +1,16 @@
 from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from datetime import datetime
 from config.db_config import db
 from bson import ObjectId
+from utils.attendance_events import attendance_logs_archive, iter_sessions
+from utils.pagination import include_archived, keyset_page, page_args, session_filters, stream_json
+from utils.programs import NO_PROGRAM_ERROR, admin_scope
+from utils.report_export import export_response, submit_export_job, wants_stream
+from utils.attendance_stats import rebuild_stats, sessions_live
+from utils.attendance_rollups import finalize_closed_days
+from utils.jobs import active_job, submit_job
+from utils.auth_roles import admin_required
 from . import admin_bp
 
 attendance_logs_col = db["attendance_logs"]
@@ -12,32 +20,99 @@ attendance_logs_col = db["attendance_logs"]
 def get_attendance_logs():
     try: 
         claims = get_jwt()
-        admin_program = claims.get("program", "").upper()
-        all_sessions = []
-        query = {"course": admin_program}
-        cursor = attendance_logs_col.find(query).sort("date", -1)
-
-        for doc in cursor:
-            session = {
-                "_id": str(doc.get("_id")),
-                "class_id": str(doc.get("class_id")),
-                "date": doc.get("date"),
-                "course": doc.get("course", ""),
-                "section": doc.get("section", ""),
-                "subject_code": doc.get("subject_code", ""),
-                "subject_title": doc.get("subject_title", ""),
-                "instructor_first_name": doc.get("instructor_first_name", ""),
-                "instructor_last_name": doc.get("instructor_last_name", ""),
-                "instructor_id": doc.get("instructor_id", ""),
-                "semester": doc.get("semester", ""),
-                "school_year": doc.get("school_year", ""),
-                "created_by": doc.get("created_by", ""),
-                "students": doc.get("students", [])
-            }
-            all_sessions.append(session)
-
-        return jsonify({ "attendance_logs": all_sessions, "message": f"Successfully Fetch all the logs for {admin_program}"})
+        admin_program = (claims.get("program") or "").upper()
+        scope = admin_scope(claims)
+        if scope is None:
+            return jsonify({"error": NO_PROGRAM_ERROR}), 403
+        try:
+            limit, after = page_args(request.args)
+            query = session_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query.update(scope)
+
+        archive = attendance_logs_archive if include_archived(request.args) else None
+        cursor, next_cursor = keyset_page(attendance_logs_col, query, limit, after, archive=archive)
+        sessions = (_session_payload(doc) for doc in iter_sessions(cursor))
+        return stream_json(
+            sessions,
+            key="attendance_logs",
+            extra={"message": f"Successfully Fetch all the logs for {admin_program}"},
+            next_cursor=next_cursor,
+        )
         
     except Exception:
         return jsonify({"error": "Failed to load attendance logs"}), 500
 
+
+def _session_payload(doc):
+    return {
+        "_id": str(doc.get("_id")),
+        "class_id": str(doc.get("class_id")),
+        "date": doc.get("date"),
+        "course": doc.get("course", ""),
+        "section": doc.get("section", ""),
+        "subject_code": doc.get("subject_code", ""),
+        "subject_title": doc.get("subject_title", ""),
+        "instructor_first_name": doc.get("instructor_first_name", ""),
+        "instructor_last_name": doc.get("instructor_last_name", ""),
+        "instructor_id": doc.get("instructor_id", ""),
+        "semester": doc.get("semester", ""),
+        "school_year": doc.get("school_year", ""),
+        "created_by": doc.get("created_by", ""),
+        "students": doc.get("students", [])
+    }
+
+
+# Attendance export for the admin's program (CSV / XLSX job; ?stream=true streams CSV directly)
+# ?format=csv|xlsx&class_id=&start=YYYY-MM-DD&end=YYYY-MM-DD&semester=&school_year=
+@admin_bp.route("/api/admin/attendance/export", methods=["GET"])
+@jwt_required()
+def export_attendance_logs():
+    claims = get_jwt()
+    scope = admin_scope(claims)
+    if scope is None:
+        return jsonify({"error": NO_PROGRAM_ERROR}), 403
+    try:
+        query = session_filters(request.args)
+        query.update(scope)
+        filename = f"attendance-{scope['program_key'].lower()}"
+        fmt = request.args.get("format", "csv").lower()
+        if wants_stream(request.args):
+            return export_response(query, fmt, filename, include_archived(request.args))
+        job_id = submit_export_job(query, fmt, filename, include_archived(request.args),
+                                   params=request.args.to_dict(), created_by=get_jwt_identity())
+        return jsonify({"message": "Export started", "job_id": job_id}), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+# Maintenance rebuilds (background jobs, poll /api/jobs/<job_id>)
+def _rebuild_stats_job(job):
+    return rebuild_stats()
+
+def _finalize_rollups_job(job):
+    return finalize_closed_days()
+
+MAINTENANCE_JOBS = {
+    "rebuild-stats": ("rebuild_attendance_stats", _rebuild_stats_job),
+    "finalize-rollups": ("finalize_attendance_rollups", _finalize_rollups_job),
+}
+
+@admin_bp.route("/api/admin/attendance/<operation>", methods=["POST"])
+@admin_required
+def start_attendance_maintenance(operation):
+    if operation not in MAINTENANCE_JOBS:
+        return jsonify({"error": "Unknown operation"}), 404
+    kind, fn = MAINTENANCE_JOBS[operation]
+
+    # A stats rebuild drops increments made while it runs.
+    if operation == "rebuild-stats" and sessions_live():
+        return jsonify({"error": "Attendance sessions are live; rebuild when none are running"}), 409
+
+    running = active_job(kind)
+    if running:
+        return jsonify({"error": "Already running", "job_id": str(running["_id"])}), 409
+
+    job_id = submit_job(kind, fn, created_by=get_jwt_identity())
+    return jsonify({"message": f"{operation} started", "job_id": job_id}), 202
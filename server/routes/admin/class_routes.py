@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from bson import ObjectId
 from datetime import datetime
 import pandas as pd
@@ -8,6 +8,10 @@ import pdfplumber
 from io import BytesIO
 from . import admin_bp
 from config.db_config import db
+from utils.gallery_versions import bump_class
+from utils.attendance_stats import class_stats, class_stats_many
+from utils.programs import NO_PROGRAM_ERROR, admin_scope, program_key
+from utils.jobs import submit_job
 
 students_col = db["students"]
 instructors_col = db["instructors"]
@@ -41,17 +45,13 @@ def serialize_class(cls):
         "created_at": cls.get("created_at"),
     }
 
-def calculate_attendance_rate(class_id: str):
-    stats = list(attendance_logs_col.aggregate([
-        {"$match": {"class_id": class_id}},
-        {"$unwind": "$students"},
-        {"$group": {"_id": "$students.status", "count": {"$sum": 1}}}
-    ]))
-
-    total_logs = sum(s["count"] for s in stats)
-    present_count = sum(s["count"] for s in stats if s["_id"] == "Present")
-    late_count = sum(s["count"] for s in stats if s["_id"] == "Late")
-    absent_count = sum(s["count"] for s in stats if s["_id"] == "Absent")
+def calculate_attendance_rate(class_id: str, counts=None):
+    counts = counts or class_stats(class_id)
+
+    total_logs = counts["total"]
+    present_count = counts["present"]
+    late_count = counts["late"]
+    absent_count = counts["absent"]
     attendance_rate = round(((present_count + late_count) / total_logs) * 100, 2) if total_logs > 0 else 0
 
     return attendance_rate, {"present": present_count, "late": late_count, "absent": absent_count, "total": total_logs}
@@ -60,21 +60,24 @@ def calculate_attendance_rate(class_id: str):
 @admin_bp.route("/api/admin/classes", methods=["GET"])
 @jwt_required()
 def get_all_classes():
-    admin_program = _admin_program()
+    scope = admin_scope(get_jwt())
+    if scope is None:
+        return jsonify({"error": NO_PROGRAM_ERROR}), 403
     active_sem = semesters_col.find_one({"is_active": True})
     if not active_sem:
         return jsonify({"error": "No active semester found"}), 400
     
     classes = list(classes_col.find({
-        "course": {"$regex": f"^{admin_program}$", "$options": "i"},
+        **scope,
         "semester": active_sem["semester_name"],
         "school_year": active_sem["school_year"]
     }).sort("created_at", -1))
 
     output = []
+    stats = class_stats_many([str(cls["_id"]) for cls in classes])
     for cls in classes:
         class_id = str(cls["_id"])
-        attendance_rate, breakdown = calculate_attendance_rate(class_id)
+        attendance_rate, breakdown = calculate_attendance_rate(class_id, stats.get(class_id))
         cls_data = serialize_class(cls)
         cls_data["attendance_rate"] = attendance_rate
         cls_data["attendance_breakdown"] = breakdown
@@ -115,6 +118,7 @@ def create_class():
         "subject_code": data["subject_code"],
         "subject_title": data["subject_title"],
         "course": data["course"],
+        "program_key": program_key(data["course"]),
         "year_level": data["year_level"],
         "semester": active_sem["semester_name"],
         "school_year": active_sem["school_year"],
@@ -177,6 +181,7 @@ def update_class(id):
     
     if result.matched_count == 0:
         return jsonify({"error": "Class not found"}), 404
+    bump_class(id)
     
     return jsonify({"message": "Class updated successfully"}), 200
 
@@ -202,12 +207,13 @@ def delete_class(id):
         result = classes_col.delete_one({"_id": class_id})
         if result.deleted_count == 0:
             return jsonify({"error": "Failed to delete class"}), 500
+        bump_class(id)
         
         return jsonify({"message": f"Class '{cls.get('name', id)}' deleted successfully"}), 200
     except Exception as e:
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
     
-#Upload Student List via PDF (University Format)
+#Upload Student List via PDF (University Format) — runs as a job, poll /api/jobs/<job_id>
 @admin_bp.route("/api/admin/<class_id>/upload-students", methods=["POST"])
 @jwt_required()
 def upload_students_to_class(class_id):
@@ -225,136 +231,160 @@ def upload_students_to_class(class_id):
         file = request.files.get("file")
         if not file:
             return jsonify({"error": "No file uploaded"}), 400
-        
-        file_bytes = BytesIO(file.read())
 
-        with pdfplumber.open(file_bytes) as pdf:
-            full_text = "\n".join([ page.extract_text() or "" for page in pdf.pages ])
+        job_id = submit_job(
+            "class_roster_upload", ingest_class_roster, class_id, admin_program, file.read(),
+            params={"class_id": class_id, "filename": file.filename}, created_by=get_jwt_identity(),
+        )
+        return jsonify({"message": "Student list upload started", "job_id": job_id}), 202
 
-        lines = full_text.split("\n")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        header_line = next(line for line in lines if "Class List (" in line)
-        inside = re.search(r"\((.*?)\)", header_line).group(1)
+def ingest_class_roster(job, class_id, admin_program, pdf_bytes):
+    """Job body: parse a class list PDF and set the class roster from it.
 
-        school_year, semester_raw = [x.strip() for x in inside.split("/")]
+    Problems with the file raise ValueError, which becomes the job's error.
+    """
+    with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
+        full_text = "\n".join([ page.extract_text() or "" for page in pdf.pages ])
+    job.check_cancelled(every=0)
 
-        semester_map = {
-            "First Semester": "1st Sem",
-            "Second Semester": "2nd Sem",
-            "Summer": "Mid Year"
-        }
-        semester = semester_map.get(semester_raw, semester_raw)
-        header_idx = next(i for i, l in enumerate(lines) if "Class List (" in l)
-        instructor_raw = lines[header_idx + 1].strip().title()
-        name_parts = instructor_raw.split(" ")
-        instructor_last_name = name_parts[-1]
-        instructor_first_name = " ".join(name_parts[:-1])
-        instructor_doc = instructors_col.find_one({ "first_name": instructor_first_name, "last_name": instructor_last_name })
+    lines = full_text.split("\n")
 
-        if not instructor_doc:
-            return jsonify({"error": f"Instructor '{instructor_raw}' not found"}), 404
-        
-        instructor_id = instructor_doc["instructor_id"]
-
-        class_code = None
-        for line in lines:
-            for line in lines:
-                if "Class:" in line:
-                    m = re.search(r"Class:\s*([A-Za-z0-9]+)", line)
-                    if m:
-                        class_code = m.group(1) 
-                    break
-
-        course_section = None
-        for line in lines:
-            if "Class:" in line and "::" in line:
-                parts = [p.strip() for p in line.split("::")]
-                if len(parts) > 1:
-                    course_section = parts[1] 
-                break
-
-        if not course_section:
-            return jsonify({"error": "Unable to extract course & section"}), 400
-        
-        course, section = course_section.rsplit(" ", 1)
+    header_line = next((line for line in lines if "Class List (" in line), None)
+    if not header_line:
+        raise ValueError("Unable to find the class list header")
+    inside = re.search(r"\((.*?)\)", header_line).group(1)
 
-        if course.upper() != admin_program:
-            return jsonify({ "error": f"Course '{course}' does NOT match your program '{admin_program}'" }), 403
-        
-        subject_code = None
-        for line in lines:
-            if "Class:" in line and "::" in line:
-                parts = [p.strip() for p in line.split("::")]
-                if len(parts) > 2:
-                    subject_code = parts[2]
-                break
-
-        if not subject_code:
-            return jsonify({"error": "Unable to extract subject code"}), 400
-        
-        subject_doc = subjects_col.find_one({"subject_code": subject_code})
-        if not subject_doc:
-            return jsonify({"error": f"Subject '{subject_code}' not found"}), 404
-        
-        subject_title = subject_doc["subject_title"]
-        year_level = subject_doc["year_level"]
-        student_ids = re.findall(r"\b\d{2}-\d-\d-\d{4}\b", full_text)
-        if not student_ids:
-            return jsonify({"error": "No student IDs found in PDF"}), 400
-        
-        students_list = []
-        skipped_ids = []
+    school_year, semester_raw = [x.strip() for x in inside.split("/")]
 
-        for sid in student_ids:
-            stu = students_col.find_one({"student_id": sid})
-            if not stu:
-                skipped_ids.append(sid)
-                continue
-
-            students_list.append({
-                "student_id": sid,
-                "first_name": stu.get("First_Name", "").strip(),
-                "last_name": stu.get("Last_Name", "").strip(),
-                "course": stu.get("Course") or course,
-                "section": stu.get("Section") or section
-            })
-
-        classes_col.update_one(
-            {"_id": ObjectId(class_id)},
-            {"$set": {
-            "class_code": class_code,
-            "subject_code": subject_code,
-            "subject_title": subject_title,
-            "course": course,
-            "section": section,
-            "year_level": year_level,
-            "semester": semester,
-            "school_year": school_year,
-            "instructor_id": instructor_id,
-            "instructor_first_name": instructor_first_name,
-            "instructor_last_name": instructor_last_name,
-            "students": students_list,
-            "schedule_blocks": []
-            }}
+    semester_map = {
+        "First Semester": "1st Sem",
+        "Second Semester": "2nd Sem",
+        "Summer": "Mid Year"
+    }
+    semester = semester_map.get(semester_raw, semester_raw)
+    header_idx = next(i for i, l in enumerate(lines) if "Class List (" in l)
+    instructor_raw = lines[header_idx + 1].strip().title()
+    name_parts = instructor_raw.split(" ")
+    instructor_last_name = name_parts[-1]
+    instructor_first_name = " ".join(name_parts[:-1])
+    instructor_doc = instructors_col.find_one({ "first_name": instructor_first_name, "last_name": instructor_last_name })
+
+    if not instructor_doc:
+        raise ValueError(f"Instructor '{instructor_raw}' not found")
+    
+    instructor_id = instructor_doc["instructor_id"]
+
+    class_code = None
+    for line in lines:
+        if "Class:" in line:
+            m = re.search(r"Class:\s*([A-Za-z0-9]+)", line)
+            if m:
+                class_code = m.group(1) 
+            break
+
+    course_section = None
+    for line in lines:
+        if "Class:" in line and "::" in line:
+            parts = [p.strip() for p in line.split("::")]
+            if len(parts) > 1:
+                course_section = parts[1] 
+            break
+
+    if not course_section:
+        raise ValueError("Unable to extract course & section")
+    
+    course, section = course_section.rsplit(" ", 1)
+
+    if course.upper() != admin_program:
+        raise ValueError(f"Course '{course}' does NOT match your program '{admin_program}'")
+    
+    subject_code = None
+    for line in lines:
+        if "Class:" in line and "::" in line:
+            parts = [p.strip() for p in line.split("::")]
+            if len(parts) > 2:
+                subject_code = parts[2]
+            break
+
+    if not subject_code:
+        raise ValueError("Unable to extract subject code")
+    
+    subject_doc = subjects_col.find_one({"subject_code": subject_code})
+    if not subject_doc:
+        raise ValueError(f"Subject '{subject_code}' not found")
+    
+    subject_title = subject_doc["subject_title"]
+    year_level = subject_doc["year_level"]
+    student_ids = re.findall(r"\b\d{2}-\d-\d-\d{4}\b", full_text)
+    if not student_ids:
+        raise ValueError("No student IDs found in PDF")
+    job.progress(0, total=len(student_ids), message="Matching students")
+
+    # One lookup for the whole list instead of one per student.
+    found = {
+        stu["student_id"]: stu
+        for stu in students_col.find(
+            {"student_id": {"$in": student_ids}},
+            {"student_id": 1, "First_Name": 1, "Last_Name": 1, "Course": 1, "Section": 1},
         )
+    }
 
-        return jsonify({
-            "message": f"{len(students_list)} students uploaded successfully",
-            "uploaded_count": len(students_list),
-            "skipped_count": len(skipped_ids),
-            "skipped_ids": skipped_ids,
-            "class_code": class_code,
-            "subject_code": subject_code,
-            "subject_title": subject_title,
-            "course": course,
-            "section": section,
-            "school_year": school_year,
-            "semester": semester,
-            "instructor": f"{instructor_first_name} {instructor_last_name}"
-        }), 200
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    students_list = []
+    skipped_ids = []
+
+    for sid in student_ids:
+        stu = found.get(sid)
+        if not stu:
+            skipped_ids.append(sid)
+            continue
+
+        students_list.append({
+            "student_id": sid,
+            "first_name": (stu.get("First_Name") or "").strip(),
+            "last_name": (stu.get("Last_Name") or "").strip(),
+            "course": stu.get("Course") or course,
+            "section": stu.get("Section") or section
+        })
+    job.progress(len(student_ids), message="Saving roster")
+
+    classes_col.update_one(
+        {"_id": ObjectId(class_id)},
+        {"$set": {
+        "class_code": class_code,
+        "subject_code": subject_code,
+        "subject_title": subject_title,
+        "course": course,
+        "program_key": program_key(course),
+        "section": section,
+        "year_level": year_level,
+        "semester": semester,
+        "school_year": school_year,
+        "instructor_id": instructor_id,
+        "instructor_first_name": instructor_first_name,
+        "instructor_last_name": instructor_last_name,
+        "students": students_list,
+        "schedule_blocks": []
+        }}
+    )
+    bump_class(class_id)
+
+    return {
+        "message": f"{len(students_list)} students uploaded successfully",
+        "uploaded_count": len(students_list),
+        "skipped_count": len(skipped_ids),
+        "skipped_ids": skipped_ids,
+        "class_code": class_code,
+        "subject_code": subject_code,
+        "subject_title": subject_title,
+        "course": course,
+        "section": section,
+        "school_year": school_year,
+        "semester": semester,
+        "instructor": f"{instructor_first_name} {instructor_last_name}"
+    }
     
 #Preview Class List PDF
 @admin_bp.route("/api/admin/class/preview-pdf", methods=["POST"])
@@ -4,6 +4,8 @@ from datetime import datetime
 from config.db_config import db
 from bson import ObjectId
 from . import admin_bp
+from utils.gallery_versions import bump_class
+from utils.programs import NO_PROGRAM_ERROR, admin_scope, program_filter
 
 instructors_col = db["instructors"]
 classes_col = db["classes"]
@@ -55,12 +57,13 @@ def get_all_instructors():
 @admin_bp.route("/api/admin/instructors/<instructor_id>/classes", methods=["GET"])
 @jwt_required()
 def get_classes_by_instructor(instructor_id):
-    claims = get_jwt()
-    admin_program = claims.get("program", "").upper()
+    scope = admin_scope(get_jwt())
+    if scope is None:
+        return jsonify({"error": NO_PROGRAM_ERROR}), 403
 
     classes = list(classes_col.find({
         "instructor_id": instructor_id,
-        "course": {"$regex": f"^{admin_program}$", "$options": "i"}
+        **scope,
     }))
 
     serialize = [serialize_class(cls) for cls in classes]
@@ -103,6 +106,7 @@ def assign_instructor_to_class(class_id):
             {"_id": ObjectId(class_id)},
             {"$set": update_data}
         )
+        bump_class(class_id)
 
         return jsonify({
             "message": "Instructor assigned successfully",
@@ -126,7 +130,7 @@ def get_free_class():
          return jsonify([]), 200
      
      free_classes = list(classes_col.find({
-         "course": {"$regex": f"^{admin_program}$", "$options": "i"},
+         **program_filter(admin_program),
          "$or": [
              {"instructor_id": {"$exists": False}},
              {"instructor_id": ""},
@@ -164,6 +168,7 @@ def remove_instructor_from_class(class_id):
                 }
             }
         )
+        bump_class(class_id)
 
         updated_class = classes_col.find_one({ "_id": ObjectId(obj_id) })
         return jsonify({ "message": "Instructor unassigned successfully", "updated_class": serialize_class(updated_class) }), 200
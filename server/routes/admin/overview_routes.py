@@ -1,6 +1,10 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from config.db_config import db
+from utils.attendance_events import attendance_events_collection as attendance_events_col, hydrate_sessions
+from utils.attendance_rollups import attendance_trend, trend_params
+from utils.pagination import include_archived
+from utils.programs import program_filter
 from . import admin_bp
 
 students_col = db["students"]
@@ -14,56 +18,40 @@ def get_stats():
     program = request.args.get("program")  
     today = datetime.utcnow().strftime("%Y-%m-%d")
 
-    attendance_today = 0
-    query = {"date": today}
-    if program:
-        query["$or"] = [
-            {"course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"Course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"students.course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"students.Course": {"$regex": f"^{program}$", "$options": "i"}}
-        ]
-
-    for log in attendance_logs_col.find(query):
-        attendance_today += len(log.get("students", []))
-
-    student_filter = {"$or": [
-        {"course": {"$regex": f"^{program}$", "$options": "i"}},
-        {"Course": {"$regex": f"^{program}$", "$options": "i"}}
-    ]} if program else {}
-
-    class_filter = {"$or": [
-        {"course": {"$regex": f"^{program}$", "$options": "i"}},
-        {"Course": {"$regex": f"^{program}$", "$options": "i"}}
-    ]} if program else {}
+    program_match = program_filter(program)
+    attendance_today = attendance_events_col.count_documents({"date": today, **program_match})
 
     total_instructors = instructors_col.count_documents({})
 
     return jsonify(
         {
-            "total_students": students_col.count_documents(student_filter),
+            "total_students": students_col.count_documents(program_match),
             "total_instructors": total_instructors,
-            "total_classes": classes_col.count_documents(class_filter),
+            "total_classes": classes_col.count_documents(program_match),
             "attendance_today": attendance_today,
         }
     ), 200
 
+#Attendance Trend (?start=&end=&granularity=day|week|month)
+@admin_bp.route("/api/admin/overview/attendance-trend", methods=["GET"])
+def attendance_trend_overview():
+    program = request.args.get("program")
+    try:
+        start, end, granularity = trend_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(attendance_trend(
+        program_filter(program), start, end, granularity, include_archived(request.args)
+    )), 200
+
 #Recent Attendance Logs
 @admin_bp.route("/api/admin/overview/recent-logs", methods=["GET"])
 def recent_logs():
     program = request.args.get("program")
     limit = int(request.args.get("limit", 5))
 
-    query = {}
-    if program:
-        query["$or"] = [
-            {"course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"Course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"students.course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"students.Course": {"$regex": f"^{program}$", "$options": "i"}},
-        ]
-
-    docs = list(attendance_logs_col.find(query).sort("date", -1).limit(20))
+    docs = hydrate_sessions(attendance_logs_col.find(program_filter(program)).sort("date", -1).limit(20))
     flattened = []
 
     for log in docs:
@@ -95,20 +83,15 @@ def recent_logs():
 @admin_bp.route("/api/admin/overview/last-student", methods=["GET"])
 def last_student():
     program = request.args.get("program")
-    query = {"$or": [
-        {"course": {"$regex": f"^{program}$", "$options": "i"}},
-        {"Course": {"$regex": f"^{program}$", "$options": "i"}}
-    ]} if program else {}
-
-    student = students_col.find_one(query, sort=[("created_at", -1)])
+    student = students_col.find_one(program_filter(program), sort=[("created_at", -1)])
     if not student:
         return jsonify(None)
     
     return jsonify(
         {
             "student_id": student.get("student_id"),
-            "first_name": student.get("First_Name") or student.get("first_name"),
-            "last_name": student.get("Last_Name") or student.get("last_name"),
+            "first_name": student.get("First_Name"),
+            "last_name": student.get("Last_Name"),
             "created_at": student.get("created_at"),
         }
     ), 200
\ No newline at end of file
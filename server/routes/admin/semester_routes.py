@@ -1,9 +1,12 @@
 from flask import request, jsonify
 from datetime import datetime, date
 from config.db_config import db
-from flask_jwt_extended import jwt_required
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from utils.auth_roles import admin_required
+from utils.attendance_archive import archive_runs, start_semester_archive
 from . import admin_bp
 import os
+import re
 
 subjects_col = db["subjects"]
 semesters_col = db["semesters"]
@@ -57,8 +60,9 @@ def get_current_semester():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
-#Update Semester
+#Update Semester (pass "archive": true to also archive the term being replaced)
 @admin_bp.route("/api/admin/semester", methods=["PUT"])
+@admin_required
 def update_single_semester():
     try:
         data = request.get_json() or {}
@@ -80,11 +84,20 @@ def update_single_semester():
             "is_active": True,
         }
 
+        previous = semesters_col.find_one() or {}
         semesters_col.update_one({}, {"$set": update_data})
         sem = semesters_col.find_one()
         sem["_id"] = str(sem["_id"])
 
-        return jsonify({ "message": "Semester updated successfully", "semester": sem }), 200
+        # Archiving is never a side effect of an edit; the caller asks for it.
+        archive_job_id = None
+        if data.get("archive") is True and (
+            (previous.get("semester_name"), previous.get("school_year")) != (normalized_semester, school_year)
+        ):
+            archive_job_id = start_semester_archive(previous.get("semester_name"), previous.get("school_year"),
+                                                    get_jwt_identity())
+
+        return jsonify({ "message": "Semester updated successfully", "semester": sem, "archive_job_id": archive_job_id }), 200
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -101,7 +114,7 @@ def activate_single_semester():
         semesters_col.update_one({"_id": sem["_id"]}, {"$set": {"semester_name": normalized_sem, "is_active": True}})
 
         result = subjects_col.update_many(
-            {"semester": {"$regex": f"^{normalized_sem}$", "$options": "i"}},
+            {"semester": {"$regex": f"^{re.escape(normalized_sem)}$", "$options": "i"}},
             {"$set": {"school_year": sem["school_year"]}}
         )
 
@@ -117,3 +130,30 @@ def activate_single_semester():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
         
+
+#Deactivate Semester (archives its attendance)
+@admin_bp.route("/api/admin/semester/deactivate", methods=["PUT"])
+@admin_required
+def deactivate_single_semester():
+    try:
+        sem = semesters_col.find_one()
+        if not sem:
+            return jsonify({"error": "No semester exists"}), 404
+
+        semesters_col.update_one({"_id": sem["_id"]}, {"$set": {"is_active": False}})
+        job_id = start_semester_archive(sem.get("semester_name"), sem.get("school_year"), get_jwt_identity())
+
+        return jsonify({
+            "message": "Semester deactivated, attendance archiving started" if job_id
+            else "Semester deactivated",
+            "job_id": job_id,
+        }), 202 if job_id else 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#Attendance Archive Runs
+@admin_bp.route("/api/admin/semester/archives", methods=["GET"])
+@jwt_required()
+def get_semester_archives():
+    return jsonify(archive_runs()), 200
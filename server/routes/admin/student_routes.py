@@ -3,120 +3,54 @@ from flask_jwt_extended import jwt_required, get_jwt
 from datetime import datetime
 from bson import ObjectId
 from config.db_config import db
+from utils.gallery_versions import bump_student
+from utils.attendance_stats import student_stats
+from utils.programs import NO_PROGRAM_ERROR, admin_scope, program_key
+from utils.pagination import include_archived
+from models.student_model import list_students_with_rates
 from . import admin_bp
 
 students_col = db["students"]
 attendance_logs_col = db["attendance_logs"]
 
+MAX_PER_PAGE = 500
+
 #Get All Students
 @admin_bp.route("/api/admin/students", methods=["GET"])
 @jwt_required()
 def get_all_students():
-     claims = get_jwt()
-     program = claims.get("program")
-
-     course_filter = {}
-     if program:
-          course_filter["$or"] = [
-            {"Course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"course": {"$regex": f"^{program}$", "$options": "i"}},
-        ]
-          
-     students = list(
-          students_col.find(
-               course_filter, {
-                    "_id": 0,
-                    "student_id": 1,
-                    "First_Name": 1,
-                    "Last_Name": 1,
-                    "Middle_Name": 1,
-                    "Course": 1,
-                    "Section": 1,
-                    "created_at": 1,
-               }    
-          )
+     course_filter = admin_scope(get_jwt())
+     if course_filter is None:
+          return jsonify({"error": NO_PROGRAM_ERROR}), 403
+
+     page = request.args.get("page", type=int)
+     per_page = min(max(request.args.get("per_page", 50, type=int), 1), MAX_PER_PAGE)
+     rows, total = list_students_with_rates(
+          course_filter,
+          sort=request.args.get("sort"),
+          page=max(page, 1) if page else None,
+          per_page=per_page,
      )
 
-     normalized = []
-     for s in students:
-          sid = s.get("student_id") 
-
-          pipeline = [
-               {"$unwind": "$students"},
-               {"$match": {"students.student_id": sid}},
-               {
-                    "$group": {
-                         "_id": "$students.student_id",
-                         "present": { "$sum": {"$cond": [{"$eq": ["$students.status", "Present"]}, 1, 0]} },
-                         "late": { "$sum": {"$cond": [{"$eq": ["$students.status", "Late"]}, 1, 0]} },
-                         "total": { "$sum": 1 }
-                    }
-               }
-          ]
-          agg = list(attendance_logs_col.aggregate(pipeline))
-
-          if agg:
-               present = agg[0]["present"]
-               late = agg[0]["late"]
-               total = agg[0]["total"]
-               attendance_rate = (round(((present + late) / total) * 100, 2) if total > 0 else None)
-          else:
-               attendance_rate = None  
-
-          normalized.append(
-               {
-                    "student_id": s.get("student_id"),
-                    "first_name": s.get("First_Name"),
-                    "last_name": s.get("Last_Name"),
-                    "middle_name": s.get("Middle_Name"),
-                    "course": s.get("Course"),
-                    "section": s.get("Section"),
-                    "created_at": s.get("created_at"),
-                    "attendance_rate": attendance_rate,
-               }
-          )
-
-     return jsonify(normalized), 200
+     response = jsonify(rows)
+     response.headers["X-Total-Count"] = str(total)
+     return response, 200
 
 # Get Single Student via student_id
 @admin_bp.route("/api/admin/students/<student_id>", methods=["GET"])
 @jwt_required()
 def get_student(student_id):
-     claims = get_jwt()
-     program = claims.get("program")
+     scope = admin_scope(get_jwt())
+     if scope is None:
+          return jsonify({"error": NO_PROGRAM_ERROR}), 403
 
-     query = { "student_id": student_id }
-     if program:
-          query["$or"] = [
-               {"Course": {"$regex": f"^{program}$", "$options": "i"}},
-               {"course": {"$regex": f"^{program}$", "$options": "i"}},
-          ]
+     query = { "student_id": student_id, **scope }
 
      student = students_col.find_one(query)
      if not student:
           return jsonify({"error": "Student not found or not in your program"}), 404
      
-     pipeline = [
-          {"$unwind": "$students"},
-          {"$match": {"students.student_id": student_id}},
-          {
-               "$group": {
-                    "_id": "$students.student_id",
-                    "present": { "$sum": {"$cond": [{"$eq": ["$students.status", "Present"]}, 1, 0]} },
-                    "late": { "$sum": {"$cond": [{"$eq": ["$students.status", "Late"]}, 1, 0]} },
-                    "total": {"$sum": 1},
-               }
-          }
-     ]
-     agg = list(attendance_logs_col.aggregate(pipeline))
-
-     if agg:
-          present = agg[0]["present"]
-          late = agg[0]["late"]
-          total = agg[0]["total"]
-          attendance_rate = (round(((present + late) / total) * 100, 2) if total > 0 else None)
-     else:
-          attendance_rate = None
+     attendance_rate = student_stats(student_id, include_archived(request.args))["rate"]
 
      return jsonify (
           {
@@ -145,6 +79,7 @@ def update_student(student_id):
           update_data["Middle_Name"] = data["middle_name"]
      if "course" in data:
           update_data["Course"] = data["course"]
+          update_data["program_key"] = program_key(data["course"])
      
      if not update_data:
           return jsonify({ "error": "No valid fields provided" }), 400
@@ -152,6 +87,7 @@ def update_student(student_id):
      result = students_col.update_one({"student_id": student_id}, {"$set": update_data})
      if result.matched_count == 0:
           return jsonify({ "error": "Student not found" }), 404
+     bump_student(student_id)
     
      return jsonify({ "message": "Student updated successfully" }), 200
 
@@ -162,6 +98,7 @@ def delete_student(student_id):
           result = students_col.delete_one({"student_id": student_id})
           if result.deleted_count == 0:
                return jsonify({"error": "Student not found"}), 404
+          bump_student(student_id)
           
           return jsonify({ "message": f"Student {student_id} deleted successfully." }), 200
      
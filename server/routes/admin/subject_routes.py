@@ -2,6 +2,7 @@ from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt
 from datetime import datetime
 from config.db_config import db
+from utils.programs import program_filter, program_key
 from bson import ObjectId
 from . import admin_bp
 
@@ -60,6 +61,7 @@ def create_subject():
         "subject_code": data["subject_code"],
         "subject_title": data["subject_title"],
         "course": data["course"],
+        "program_key": program_key(data["course"]),
         "year_level": data["year_level"],
         "semester": data["semester"],
         "curriculum": data["curriculum"],
@@ -90,7 +92,7 @@ def get_active_subjects():
 
         subjects = list(subjects_col.find({
             "semester": normalized_sem,
-            "course": {"$regex": f"^{admin_program}$", "$options": "i"}
+            **program_filter(admin_program),
         }).sort("year_level", 1))
 
         for subj in subjects:
@@ -118,6 +120,8 @@ def update_subject(id):
     for field in [ "subject_code", "subject_title", "course", "year_level", "semester", "curriculum" ]:
         if field in data:
             update_data[field] = data[field]
+    if "course" in update_data:
+        update_data["program_key"] = program_key(update_data["course"])
 
     result = subjects_col.update_one({"_id": ObjectId(id)}, {"$set": update_data})
     if result.matched_count == 0:
@@ -2,11 +2,17 @@ from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta, date
 import os
+import re
 import pandas as pd
 from bson import ObjectId
 from config.db_config import db
 from models.admin_model import find_admin_by_user_id, find_admin_by_email, create_admin
-from flask_jwt_extended import jwt_required, get_jwt, create_access_token
+from models.student_model import list_students_with_rates
+from utils.attendance_events import attendance_logs_archive, iter_sessions
+from utils.pagination import include_archived, keyset_page, page_args, session_filters, stream_json
+from utils.programs import NO_PROGRAM_ERROR, admin_scope, program_filter, program_key
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, create_access_token
+from utils.jobs import submit_job
 
 
 admin_bp = Blueprint("admin_bp", __name__)
@@ -185,35 +191,17 @@ def get_stats():
     today = datetime.utcnow().strftime("%Y-%m-%d")
 
     attendance_today = 0
-    query = {"date": today}
-    if program:
-        query["$or"] = [
-            {"course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"Course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"students.course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"students.Course": {"$regex": f"^{program}$", "$options": "i"}}
-        ]
-
-    for log in attendance_logs_col.find(query):
+    program_match = program_filter(program)
+    for log in attendance_logs_col.find({"date": today, **program_match}):
         attendance_today += len(log.get("students", []))
 
-    student_filter = {"$or": [
-        {"course": {"$regex": f"^{program}$", "$options": "i"}},
-        {"Course": {"$regex": f"^{program}$", "$options": "i"}}
-    ]} if program else {}
-
-    class_filter = {"$or": [
-        {"course": {"$regex": f"^{program}$", "$options": "i"}},
-        {"Course": {"$regex": f"^{program}$", "$options": "i"}}
-    ]} if program else {}
-
     total_instructors = instructors_col.count_documents({})
 
     return jsonify(
         {
-            "total_students": students_col.count_documents(student_filter),
+            "total_students": students_col.count_documents(program_match),
             "total_instructors": total_instructors,
-            "total_classes": classes_col.count_documents(class_filter),
+            "total_classes": classes_col.count_documents(program_match),
             "attendance_today": attendance_today,
         }
     )
@@ -223,16 +211,7 @@ def recent_logs():
     program = request.args.get("program")
     limit = int(request.args.get("limit", 5))
 
-    query = {}
-    if program:
-        query["$or"] = [
-            {"course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"Course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"students.course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"students.Course": {"$regex": f"^{program}$", "$options": "i"}},
-        ]
-
-    docs = list(attendance_logs_col.find(query).sort("date", -1).limit(20))
+    docs = list(attendance_logs_col.find(program_filter(program)).sort("date", -1).limit(20))
     flattened = []
 
     for log in docs:
@@ -264,20 +243,15 @@ def recent_logs():
 @admin_bp.route("/api/admin/overview/last-student", methods=["GET"])
 def last_student():
     program = request.args.get("program")
-    query = {"$or": [
-        {"course": {"$regex": f"^{program}$", "$options": "i"}},
-        {"Course": {"$regex": f"^{program}$", "$options": "i"}}
-    ]} if program else {}
-
-    student = students_col.find_one(query, sort=[("created_at", -1)])
+    student = students_col.find_one(program_filter(program), sort=[("created_at", -1)])
     if not student:
         return jsonify(None)
 
     return jsonify(
         {
             "student_id": student.get("student_id"),
-            "first_name": student.get("First_Name") or student.get("first_name"),
-            "last_name": student.get("Last_Name") or student.get("last_name"),
+            "first_name": student.get("First_Name"),
+            "last_name": student.get("Last_Name"),
             "created_at": student.get("created_at"),
         }
     )
@@ -290,92 +264,32 @@ from datetime import datetime, timezone
 @admin_bp.route("/api/admin/students", methods=["GET"])
 @jwt_required()
 def get_all_students():
-    claims = get_jwt()
-    program = claims.get("program")
-
-    course_filter = {}
-    if program:
-        course_filter["$or"] = [
-            {"Course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"course": {"$regex": f"^{program}$", "$options": "i"}},
-        ]
-
-    students = list(
-        students_col.find(
-            course_filter,
-            {
-                "_id": 0,
-                "student_id": 1,
-                "First_Name": 1,
-                "Last_Name": 1,
-                "Middle_Name": 1,
-                "Course": 1,
-                "Section": 1,
-                "created_at": 1,
-            },
-        )
+    course_filter = admin_scope(get_jwt())
+    if course_filter is None:
+        return jsonify({"error": NO_PROGRAM_ERROR}), 403
+
+    page = request.args.get("page", type=int)
+    per_page = min(max(request.args.get("per_page", 50, type=int), 1), 500)
+    rows, total = list_students_with_rates(
+        course_filter,
+        sort=request.args.get("sort"),
+        page=max(page, 1) if page else None,
+        per_page=per_page,
     )
 
-    normalized = []
-    for s in students:
-        sid = s.get("student_id")
-
-        pipeline = [
-            {"$unwind": "$students"},
-            {"$match": {"students.student_id": sid}},
-            {
-                "$group": {
-                    "_id": "$students.student_id",
-                    "present": {
-                        "$sum": {"$cond": [{"$eq": ["$students.status", "Present"]}, 1, 0]}
-                    },
-                    "late": {
-                        "$sum": {"$cond": [{"$eq": ["$students.status", "Late"]}, 1, 0]}
-                    },
-                    "total": {"$sum": 1},
-                }
-            },
-        ]
-        agg = list(attendance_logs_col.aggregate(pipeline))
-
-        if agg:
-            present = agg[0]["present"]
-            late = agg[0]["late"]
-            total = agg[0]["total"]
-            attendance_rate = (
-                round(((present + late) / total) * 100, 2) if total > 0 else None
-            )
-        else:
-            attendance_rate = None
-
-        normalized.append(
-            {
-                "student_id": sid,
-                "first_name": s.get("First_Name"),
-                "last_name": s.get("Last_Name"),
-                "middle_name": s.get("Middle_Name"),
-                "course": s.get("Course"),
-                "section": s.get("Section"),
-                "created_at": s.get("created_at"),
-                "attendance_rate": attendance_rate,
-            }
-        )
-
-    return jsonify(normalized), 200
+    response = jsonify(rows)
+    response.headers["X-Total-Count"] = str(total)
+    return response, 200
 
 #  GET SINGLE STUDENT — Filtered by Admin’s Program
 @admin_bp.route("/api/admin/students/<student_id>", methods=["GET"])
 @jwt_required()
 def get_student(student_id):
-    claims = get_jwt()
-    program = claims.get("program")
+    scope = admin_scope(get_jwt())
+    if scope is None:
+        return jsonify({"error": NO_PROGRAM_ERROR}), 403
 
-    query = {"student_id": student_id}
-    if program:
-        query["$or"] = [
-            {"Course": {"$regex": f"^{program}$", "$options": "i"}},
-            {"course": {"$regex": f"^{program}$", "$options": "i"}},
-        ]
+    query = {"student_id": student_id, **scope}
 
     student = students_col.find_one(query)
     if not student:
@@ -435,6 +349,7 @@ def update_student(student_id):
         update_data["Middle_Name"] = data["middle_name"]
     if "course" in data:
         update_data["Course"] = data["course"]
+        update_data["program_key"] = program_key(data["course"])
     if "section" in data:
         update_data["Section"] = data["section"]
 
@@ -458,9 +373,9 @@ def delete_student(student_id):
 
         print(f"🗑️ Student {student_id} deleted — refreshing face cache...")
 
-        from server.routes.face_routes import refresh_face_cache
+        from utils.gallery_versions import bump_student
 
-        refresh_face_cache() 
+        bump_student(student_id)
 
         return jsonify({
             "message": f"Student {student_id} deleted successfully and cache refreshed."
@@ -495,6 +410,7 @@ def create_subject():
         "subject_code": data["subject_code"],
         "subject_title": data["subject_title"],
         "course": data["course"],
+        "program_key": program_key(data["course"]),
         "year_level": data["year_level"],
         "semester": data["semester"],
         "created_at": datetime.utcnow(),
@@ -513,6 +429,8 @@ def update_subject(id):
     for field in ["subject_code", "subject_title", "course", "year_level", "semester"]:
         if field in data:
             update_data[field] = data[field]
+    if "course" in update_data:
+        update_data["program_key"] = program_key(update_data["course"])
 
     result = subjects_col.update_one({"_id": ObjectId(id)}, {"$set": update_data})
     if result.matched_count == 0:
@@ -641,7 +559,7 @@ def activate_single_semester():
         school_year = sem["school_year"]
 
         result = db.subjects.update_many(
-            {"semester": {"$regex": f"^{normalized_sem}$", "$options": "i"}},
+            {"semester": {"$regex": f"^{re.escape(normalized_sem)}$", "$options": "i"}},
             {"$set": {"school_year": school_year}}
         )
 
@@ -688,7 +606,7 @@ def get_active_subjects():
         subjects = list(
             db.subjects.find({
                 "semester": normalized_sem,
-                "course": {"$regex": f"^{admin_program}$", "$options": "i"}
+                **program_filter(admin_program),
             }).sort("year_level", 1)
         )
 
@@ -746,6 +664,7 @@ def create_class():
         "subject_code": data["subject_code"],
         "subject_title": data["subject_title"],
         "course": data["course"],
+        "program_key": program_key(data["course"]),
         "year_level": data["year_level"],
         "semester": active_sem["semester_name"],
         "school_year": active_sem["school_year"],
@@ -770,7 +689,9 @@ def create_class():
 @admin_bp.route("/api/classes", methods=["GET"])
 @jwt_required()
 def get_all_classes():
-    admin_program = _admin_program()
+    scope = admin_scope(get_jwt())
+    if scope is None:
+        return jsonify({"error": NO_PROGRAM_ERROR}), 403
 
     active_sem = semesters_col.find_one({"is_active": True})
     if not active_sem:
@@ -780,7 +701,7 @@ def get_all_classes():
     active_school_year = active_sem["school_year"]
 
     classes = list(classes_col.find({
-        "course": {"$regex": f"^{admin_program}$", "$options": "i"},
+        **scope,
         "semester": active_semester,
         "school_year": active_school_year
     }).sort("created_at", -1))
@@ -911,13 +832,11 @@ def update_class(id):
 
     return jsonify({"message": "Class updated successfully"}), 200
 
-# Upload students via PDF + Program Restriction 
+# Upload students via PDF + Program Restriction (background job, poll /api/jobs/<job_id>)
 @admin_bp.route("/api/classes/<class_id>/upload-students", methods=["POST"])
 @jwt_required()
 def upload_students_to_class(class_id):
-    import re
-    import pdfplumber
-    from io import BytesIO
+    from routes.admin.class_routes import ingest_class_roster
 
     try:
         admin = get_jwt()
@@ -936,147 +855,11 @@ def upload_students_to_class(class_id):
         if not file:
             return jsonify({"error": "No file uploaded"}), 400
 
-        file_bytes = BytesIO(file.read())
-
-        with pdfplumber.open(file_bytes) as pdf:
-            full_text = "\n".join([
-                page.extract_text() or "" for page in pdf.pages
-            ])
-
-        lines = full_text.split("\n")
-
-        header_line = next(line for line in lines if "Class List (" in line)
-        inside = re.search(r"\((.*?)\)", header_line).group(1)
-
-        school_year, semester_raw = [x.strip() for x in inside.split("/")]
-
-        semester_map = {
-            "First Semester": "1st Sem",
-            "Second Semester": "2nd Sem",
-            "Summer": "Mid Year"
-        }
-        semester = semester_map.get(semester_raw, semester_raw)
-
-        header_idx = next(i for i, l in enumerate(lines) if "Class List (" in l)
-
-        instructor_raw = lines[header_idx + 1].strip().title()
-        name_parts = instructor_raw.split(" ")
-
-        instructor_last_name = name_parts[-1]
-        instructor_first_name = " ".join(name_parts[:-1])
-
-        instructor_doc = instructors_col.find_one({
-            "first_name": instructor_first_name,
-            "last_name": instructor_last_name
-        })
-
-        if not instructor_doc:
-            return jsonify({"error": f"Instructor '{instructor_raw}' not found"}), 404
-
-        instructor_id = instructor_doc["instructor_id"]
-
-        class_code = None
-        for line in lines:
-            if "Class:" in line:
-                m = re.search(r"Class:\s*([A-Za-z0-9]+)", line)
-                if m:
-                    class_code = m.group(1) 
-                break
-
-        course_section = None
-
-        for line in lines:
-            if "Class:" in line and "::" in line:
-                parts = [p.strip() for p in line.split("::")]
-                if len(parts) > 1:
-                    course_section = parts[1]  
-                break
-
-        if not course_section:
-            return jsonify({"error": "Unable to extract course & section"}), 400
-
-        course, section = course_section.rsplit(" ", 1)
-
-        if course.upper() != admin_program:
-            return jsonify({
-                "error": f"Course '{course}' does NOT match your program '{admin_program}'"
-            }), 403
-
-        subject_code = None
-
-        for line in lines:
-            if "Class:" in line and "::" in line:
-                parts = [p.strip() for p in line.split("::")]
-                if len(parts) > 2:
-                    subject_code = parts[2]  # "SA 101"
-                break
-
-        if not subject_code:
-            return jsonify({"error": "Unable to extract subject code"}), 400
-
-        subject_doc = subjects_col.find_one({"subject_code": subject_code})
-        if not subject_doc:
-            return jsonify({"error": f"Subject '{subject_code}' not found"}), 404
-
-        subject_title = subject_doc["subject_title"]
-        year_level = subject_doc["year_level"]
-
-        student_ids = re.findall(r"\b\d{2}-\d-\d-\d{4}\b", full_text)
-
-        if not student_ids:
-            return jsonify({"error": "No student IDs found in PDF"}), 400
-
-        students_list = []
-        skipped_ids = []
-
-        for sid in student_ids:
-            stu = students_col.find_one({"student_id": sid})
-
-            if not stu:
-                skipped_ids.append(sid)
-                continue  
-
-            students_list.append({
-                "student_id": sid,
-                "first_name": stu.get("First_Name", "").strip(),
-                "last_name": stu.get("Last_Name", "").strip(),
-                "course": stu.get("Course") or course,
-                "section": stu.get("Section") or section
-            })
-
-        classes_col.update_one(
-            {"_id": ObjectId(class_id)},
-            {"$set": {
-                "class_code": class_code,
-                "subject_code": subject_code,
-                "subject_title": subject_title,
-                "course": course,
-                "section": section,
-                "year_level": year_level,
-                "semester": semester,
-                "school_year": school_year,
-                "instructor_id": instructor_id,
-                "instructor_first_name": instructor_first_name,
-                "instructor_last_name": instructor_last_name,
-                "students": students_list,
-                "schedule_blocks": []
-            }}
+        job_id = submit_job(
+            "class_roster_upload", ingest_class_roster, class_id, admin_program, file.read(),
+            params={"class_id": class_id, "filename": file.filename}, created_by=get_jwt_identity(),
         )
-
-        return jsonify({
-            "message": f"{len(students_list)} students uploaded successfully",
-            "uploaded_count": len(students_list),
-            "skipped_count": len(skipped_ids),
-            "skipped_ids": skipped_ids,
-            "class_code": class_code,
-            "subject_code": subject_code,
-            "subject_title": subject_title,
-            "course": course,
-            "section": section,
-            "school_year": school_year,
-            "semester": semester,
-            "instructor": f"{instructor_first_name} {instructor_last_name}"
-        }), 200
+        return jsonify({"message": "Student list upload started", "job_id": job_id}), 202
 
     except Exception as e:
         import traceback
@@ -1239,7 +1022,7 @@ def get_free_classes():
         return jsonify([]), 200
 
     free_classes = list(classes_col.find({
-        "course": {"$regex": f"^{admin_program}$", "$options": "i"},
+        **program_filter(admin_program),
         "$or": [
             {"instructor_id": {"$exists": False}},
             {"instructor_id": ""},
@@ -1333,13 +1116,14 @@ def assign_instructor_to_class(class_id):
 @admin_bp.route("/api/instructors/<instructor_id>/classes", methods=["GET"])
 @jwt_required()
 def get_classes_by_instructor(instructor_id):
-    claims = get_jwt()
-    admin_program = claims.get("program", "").upper()
+    scope = admin_scope(get_jwt())
+    if scope is None:
+        return jsonify({"error": NO_PROGRAM_ERROR}), 403
 
     # Get classes assigned to instructor
     classes = list(classes_col.find({
         "instructor_id": instructor_id,
-        "course": {"$regex": f"^{admin_program}$", "$options": "i"}
+        **scope,
     }))
 
     serialized = [_serialize_class(cls) for cls in classes]
@@ -1350,53 +1134,57 @@ def get_classes_by_instructor(instructor_id):
 @admin_bp.route("/api/attendance/logs", methods=["GET"])
 def get_attendance_logs():
     try:
-        logs = []
-
-        # Fetch ALL documents from attendance_logs (sorted newest to oldest)
-        cursor = attendance_logs_col.find().sort("date", -1)
-
-        for doc in cursor:
-
-            # Extract class-level fields from the document
-            class_id = str(doc.get("class_id"))
-            subject_code = doc.get("subject_code", "")
-            subject_title = doc.get("subject_title", "")
-            instructor_first_name = doc.get("instructor_first_name", "")
-            instructor_last_name = doc.get("instructor_last_name", "")
-            instructor_name = f"{instructor_first_name} {instructor_last_name}".strip()
-            section = doc.get("section", "")
-            course = doc.get("course", "")
-            semester = doc.get("semester", "")
-            school_year = doc.get("school_year", "")
-            year_level = doc.get("year_level", "")
-            date = doc.get("date")
-            start_time = doc.get("start_time")
-            end_time = doc.get("end_time")
-
-            students = doc.get("students", [])
-            for s in students:
-                logs.append({
-                    # Student details
-                    "student_id": s.get("student_id"),
-                    "first_name": s.get("first_name", ""),
-                    "last_name": s.get("last_name", ""),
-                    "status": s.get("status", ""),
-                    "time": s.get("time", ""),
-                    "date": date,
-                    "start_time": start_time,
-                    "end_time": end_time,
-                    "class_id": class_id,
-                    "subject_code": subject_code,
-                    "subject_title": subject_title,
-                    "section": section,
-                    "course": course,
-                    "year_level": year_level,
-                    "instructor_name": instructor_name,
-                    "semester": semester,
-                    "school_year": school_year
-                })
-
-        return jsonify(logs), 200
+        # Newest first; ?limit= pages by session, ?cursor= continues. Streamed.
+        try:
+            limit, after = page_args(request.args)
+            query = session_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        archive = attendance_logs_archive if include_archived(request.args) else None
+        cursor, next_cursor = keyset_page(attendance_logs_col, query, limit, after, archive=archive)
+
+        def rows():
+            for doc in iter_sessions(cursor):
+                # Extract class-level fields from the document
+                class_id = str(doc.get("class_id"))
+                subject_code = doc.get("subject_code", "")
+                subject_title = doc.get("subject_title", "")
+                instructor_first_name = doc.get("instructor_first_name", "")
+                instructor_last_name = doc.get("instructor_last_name", "")
+                instructor_name = f"{instructor_first_name} {instructor_last_name}".strip()
+                section = doc.get("section", "")
+                course = doc.get("course", "")
+                semester = doc.get("semester", "")
+                school_year = doc.get("school_year", "")
+                year_level = doc.get("year_level", "")
+                date = doc.get("date")
+                start_time = doc.get("start_time")
+                end_time = doc.get("end_time")
+
+                students = doc.get("students", [])
+                for s in students:
+                    yield {
+                        # Student details
+                        "student_id": s.get("student_id"),
+                        "first_name": s.get("first_name", ""),
+                        "last_name": s.get("last_name", ""),
+                        "status": s.get("status", ""),
+                        "time": s.get("time", ""),
+                        "date": date,
+                        "start_time": start_time,
+                        "end_time": end_time,
+                        "class_id": class_id,
+                        "subject_code": subject_code,
+                        "subject_title": subject_title,
+                        "section": section,
+                        "course": course,
+                        "year_level": year_level,
+                        "instructor_name": instructor_name,
+                        "semester": semester,
+                        "school_year": school_year
+                    }
+
+        return stream_json(rows(), next_cursor=next_cursor)
 
     except Exception as e:
         print("❌ Error loading attendance logs:", e)
@@ -3,6 +3,20 @@ from bson import ObjectId
 from datetime import datetime, timedelta, timezone
 import traceback
 from config.db_config import db
+from utils.gallery_versions import bump_class
+from utils.gallery_warmup import request_warmup
+from utils.attendance_buffer import attendance_buffer
+from utils.session_state import session_state
+from utils.attendance_events import (
+    attendance_logs_archive,
+    hydrate_sessions,
+    iter_sessions,
+    migrate_log_events,
+    record_events,
+    update_events,
+)
+from utils.pagination import include_archived, keyset_page, page_args, session_filters, stream_json
+from utils.programs import program_key
 
 classes_collection = db["classes"]
 attendance_collection = db["attendance_logs"]
@@ -19,11 +33,8 @@ attendance_bp = Blueprint("attendance", __name__)
 
 attendance_logs_col = db["attendance_logs"]
 
-# SESSION MEMORY
-SESSION_INSTRUCTOR_DETECTED = {}
-SESSION_LOGGED_STUDENTS = {}
-
 PH_TZ = timezone(timedelta(hours=8)) 
+SESSION_MINUTES = 30
 
 # Utilities
 def _today_date():
@@ -94,9 +105,6 @@ def start_session():
             }
         )
 
-        SESSION_LOGGED_STUDENTS[class_id] = {}
-        SESSION_INSTRUCTOR_DETECTED[class_id] = False
-
         now = datetime.now(PH_TZ)
         today_str = now.strftime("%Y-%m-%d")
         start_time_str = now.strftime("%H:%M:%S")
@@ -105,6 +113,7 @@ def start_session():
             "date": today_str,
             "class_id": class_id,
             "course": cls.get("course"),
+            "program_key": program_key(cls.get("course")),
             "end_time": None,
             "instructor_id": instructor_id,
             "instructor_first_name": instructor.get("first_name"),
@@ -122,7 +131,7 @@ def start_session():
         inserted = attendance_collection.insert_one(log_doc)
         new_log_id = str(inserted.inserted_id)
 
-        end_time = now + timedelta(minutes=30)
+        end_time = now + timedelta(minutes=SESSION_MINUTES)
 
         update_res = classes_collection.update_one(
             {"_id": class_oid},
@@ -136,6 +145,10 @@ def start_session():
                 }
             }
         )
+        # instructor_id may have changed, so the gallery goes stale too.
+        bump_class(class_id)
+        # Off-schedule sessions get warmed too; the first frame is seconds away.
+        request_warmup(class_id, minutes=SESSION_MINUTES)
 
         return jsonify({
             "success": True,
@@ -193,10 +206,15 @@ def stop_session():
                 "active_session_log_id": None
             }}
         )
+        bump_class(class_id, gallery=False)
+
+        # Absent-marking must see every sighting still in the write-behind buffer.
+        attendance_buffer.flush()
 
         att_log = attendance_collection.find_one({"_id": log_id})
         if not att_log:
             return jsonify({"error": "Attendance log not found"}), 404
+        att_log = hydrate_sessions([att_log])[0]
 
         attendance_collection.update_one(
             {"_id": log_id},
@@ -210,6 +228,9 @@ def stop_session():
         class_student_ids = {
             str(s.get("student_id")): s for s in class_students
         }
+        # flush() only drains this worker; sightings still buffered in other
+        # workers were claimed in the shared session state.
+        already_marked_ids.update(session_state.logged_students(log_id, class_student_ids))
 
         if not class_student_ids:
             return jsonify({
@@ -232,16 +253,10 @@ def stop_session():
                 })
 
         if absent_students:
-            attendance_collection.update_one(
-                {"_id": log_id},
-                {"$push": {"students": {"$each": absent_students}}}
-            )
-
-        if class_id in SESSION_LOGGED_STUDENTS:
-            SESSION_LOGGED_STUDENTS[class_id] = {}
+            # First write wins: a sighting that lands concurrently is kept.
+            record_events(att_log, absent_students)
 
-        if class_id in SESSION_INSTRUCTOR_DETECTED:
-            SESSION_INSTRUCTOR_DETECTED[class_id] = False
+        session_state.end_session(log_id)
 
         return jsonify({
             "success": True,
@@ -411,7 +426,7 @@ def get_all_logs_grouped():
 
         print("LOG QUERY:", query)
 
-        raw_logs = list(
+        raw_logs = hydrate_sessions(
             attendance_logs_col
             .find(query)
             .sort("start_time", -1)
@@ -509,25 +524,27 @@ def mark_excused():
         date_val = _parse_date(date_str)
         date_str = date_val.strftime("%Y-%m-%d")
 
-        attendance_logs = db["attendance_logs"]
-
-        result = attendance_logs.update_one(
-            {
-                "class_id": class_id,
-                "students.student_id": student_id,
-                "date": date_str,
-            },
-            {
-                "$set": {
-                    "students.$.status": "Excused",
-                    "students.$.excuse_reason": reason,
-                    "students.$.updated_by": instructor_id,
-                    "students.$.updated_at": datetime.now(PH_TZ),
-                }
-            }
+        excuse = {
+            "status": "Excused",
+            "excuse_reason": reason,
+            "updated_by": instructor_id,
+            "updated_at": datetime.now(PH_TZ),
+        }
+        matched = update_events(
+            {"class_id": class_id, "student_id": student_id, "date": date_str},
+            excuse
         )
 
-        if result.modified_count == 0:
+        if matched == 0:
+            # Logs written before attendance_events, not yet migrated: move
+            # them over first so the edit goes through (and counts) as an event.
+            if migrate_log_events({"class_id": class_id, "students.student_id": student_id, "date": date_str}):
+                matched = update_events(
+                    {"class_id": class_id, "student_id": student_id, "date": date_str},
+                    excuse
+                )
+
+        if matched == 0:
             return jsonify({"error": "No matching record found"}), 404
 
         return jsonify({
@@ -547,7 +564,7 @@ def mark_excused():
 @attendance_bp.route("/sessions/<class_id>", methods=["GET"])
 def get_sessions_by_class(class_id):
     try:
-        logs = list(attendance_logs_col.find({"class_id": str(class_id)}))
+        logs = hydrate_sessions(attendance_logs_col.find({"class_id": str(class_id)}))
 
         sessions = []
 
@@ -577,37 +594,40 @@ def get_sessions_by_class(class_id):
         print("Error in /sessions/<class_id>:", traceback.format_exc())
         return jsonify({"error": "Internal server error"}), 500
 
+def _session_payload(log):
+    return {
+        "_id": str(log["_id"]),
+        "class_id": log.get("class_id"),
+        "date": log.get("date"),
+        "start_time": log.get("start_time"),
+        "end_time": log.get("end_time"),
+        "students": log.get("students", []),
+        "subject_code": log.get("subject_code"),
+        "subject_title": log.get("subject_title"),
+        "course": log.get("course"),
+        "section": log.get("section"),
+        "semester": log.get("semester"),
+        "school_year": log.get("school_year"),
+        "instructor_first_name": log.get("instructor_first_name", ""),
+        "instructor_last_name": log.get("instructor_last_name", ""),
+    }
+
+# All sessions with a term, newest first: ?limit=&cursor= plus header filters
 @attendance_bp.route("/sessions", methods=["GET"])
 def get_all_valid_sessions():
     try:
-        logs = attendance_logs_col.find({
-            "semester": {"$exists": True, "$ne": ""},
-            "school_year": {"$exists": True, "$ne": ""}
-        })
-
-        sessions = []
-        for log in logs:
-            sessions.append({
-                "_id": str(log["_id"]),
-                "class_id": log.get("class_id"),
-                "date": log.get("date"),
-                "start_time": log.get("start_time"),
-                "end_time": log.get("end_time"),
-                "students": log.get("students", []),
-                "subject_code": log.get("subject_code"),
-                "subject_title": log.get("subject_title"),
-                "course": log.get("course"),
-                "section": log.get("section"),
-                "semester": log.get("semester"),
-                "school_year": log.get("school_year"),
-                "instructor_first_name": log.get("instructor_first_name", ""),
-                "instructor_last_name": log.get("instructor_last_name", ""),
-            })
-
-        return jsonify({
-            "success": True,
-            "sessions": sessions
-        }), 200
+        try:
+            limit, after = page_args(request.args)
+            query = session_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query.setdefault("semester", {"$exists": True, "$ne": ""})
+        query.setdefault("school_year", {"$exists": True, "$ne": ""})
+
+        archive = attendance_logs_archive if include_archived(request.args) else None
+        cursor, next_cursor = keyset_page(attendance_logs_col, query, limit, after, archive=archive)
+        sessions = (_session_payload(log) for log in iter_sessions(cursor))
+        return stream_json(sessions, key="sessions", extra={"success": True}, next_cursor=next_cursor)
 
     except Exception:
         import traceback
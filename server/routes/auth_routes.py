@@ -3,6 +3,7 @@ from models.student_model import create_student, find_student_by_student_id
 from models.instructor_model import create_instructor, find_instructor_by_email, find_instructor_by_id
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token
+from pymongo.errors import DuplicateKeyError
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -19,14 +20,17 @@ def register():
         hashed_password = generate_password_hash(data['password'])
         student_data = {
             "student_id": data['student_id'],
-            "first_name": data['first_name'],
-            "last_name": data['last_name'],
-            "course": data['course'],
-            "section": data['section'],
+            "First_Name": data['first_name'],
+            "Last_Name": data['last_name'],
+            "Course": data['course'],
+            "Section": data['section'],
             "password": hashed_password
         }
 
-        create_student(student_data)
+        try:
+            create_student(student_data)
+        except DuplicateKeyError:
+            return jsonify({"error": "Student ID already registered"}), 400
         return jsonify({"message": "Student registered successfully"}), 201
 
     elif role == 'instructor':
@@ -74,10 +78,10 @@ def login():
             "token": token,
             "role": "student",
             "student_id": user["student_id"],
-            "first_name": user["first_name"],
-            "last_name": user["last_name"],
-            "course": user["course"],
-            "section": user["section"]
+            "first_name": user.get("First_Name"),
+            "last_name": user.get("Last_Name"),
+            "course": user.get("Course"),
+            "section": user.get("Section")
         }), 200
 
     elif role == 'instructor':
@@ -6,24 +6,46 @@ from flask_limiter.util import get_remote_address
 from pymongo import ReturnDocument
 import numpy as np
 import requests
+import math
+import os
 import time
 import traceback
 from bson import ObjectId
 
 from config.db_config import db
+from utils.admission import ai_gate, live_frames
+from utils.attendance_buffer import attendance_buffer
+from utils.session_state import session_state
+from utils.ai_client import ai_client, AIServiceUnavailable, LocalTransportLost
+from utils.local_transport import packed_recognize_payload
+from utils.gallery import Gallery, match_faces
+from utils.embedding_codec import encode_embedding, decode_embeddings
+from utils.gallery_snapshot import load_snapshot, write_snapshot
+from utils.gallery_warmup import warmup_stats
+from utils.gallery_versions import (
+    versions as gallery_versions,
+    bump_class,
+    bump_student,
+    class_key,
+    gallery_key,
+    student_key,
+)
+from utils.attendance_events import HEADER_FIELDS, session_statuses
+from utils.programs import program_key
 from models.face_db_model import (
     save_face_data,
     get_student_by_id,
-    save_face_data_for_instructor
+    save_face_data_for_instructor,
+    update_embedding_centroid,
+    CENTROID_PROJECTION,
 )
 
 # CONFIGURATION
 face_bp = Blueprint("face_bp", __name__)
 executor = ThreadPoolExecutor(max_workers=4)
 limiter = Limiter(key_func=get_remote_address, default_limits=[])
+MULTI_RECOGNIZE_RATE_LIMIT = "10 per second"
 
-# Hugging Face microservice endpoint
-HF_AI_URL = "http://127.0.0.1:7860"
 students_collection = db["students"]
 classes_collection = db["classes"]
 attendance_collection = db["attendance_logs"]
@@ -33,93 +55,264 @@ instructors_collection = db['instructors']
 PH_TZ = timezone(timedelta(hours=8))
 CACHE_TTL = 300 
 
-SESSION_INSTRUCTOR_DETECTED = {}
-SESSION_LOGGED_STUDENTS = {}
+# Entries are dropped as soon as their gallery_versions key moves; the
+# TTLs are only a backstop for writes that bypass the bump helpers.
 FACES_CACHE = {}
-FACES_CACHE_TTL = 120 
+FACES_CACHE_TTL = int(os.getenv("FACES_CACHE_TTL", 3600))
 CLASS_CACHE = {}
-CLASS_CACHE_TTL = 60
+CLASS_CACHE_TTL = int(os.getenv("CLASS_CACHE_TTL", 3600))
 STUDENT_CACHE = {}
-STUDENT_CACHE_TTL = 300
+STUDENT_CACHE_TTL = int(os.getenv("STUDENT_CACHE_TTL", 3600))
+
+# "match": the AI service matches against the gallery we send each frame.
+# "embed": it only returns embeddings + liveness; we match against the
+# cached per-class Gallery matrix (same thresholds).
+AI_PIPELINE_MODE = os.getenv("AI_PIPELINE_MODE", "match").lower()
+
+# Deadline propagation: the browser tells us how long it will wait, we
+# forward whatever is left of that budget so the AI service can drop
+# frames nobody is waiting for any more.
+CLIENT_BUDGET_HEADER = "X-Client-Timeout-Ms"
+AI_BUDGET_HEADER = "X-Request-Budget-Ms"
+AI_DEFAULT_BUDGET_MS = 60000
+AI_BUDGET_MARGIN_MS = 100
+DEADLINE_STATS = {"expired_before_ai": 0, "ai_timeouts": 0, "ai_deadline_exceeded": 0}
+
+# Helper: Request budget
+def remaining_budget_ms(start_time, default_ms=AI_DEFAULT_BUDGET_MS):
+    try:
+        budget = float(request.headers.get(CLIENT_BUDGET_HEADER, default_ms))
+    except (TypeError, ValueError):
+        budget = default_ms
+    budget = min(budget, default_ms)
+    elapsed_ms = (time.time() - start_time) * 1000
+    return budget - elapsed_ms - AI_BUDGET_MARGIN_MS
+
+# The AI endpoints only compute (no writes), so callers that can afford
+# it pass idempotent=True to get retries on connection failures.
+def post_to_ai(path, payload, start_time, cls, idempotent=False, local_only=False):
+    budget_ms = remaining_budget_ms(start_time)
+    if budget_ms <= 0:
+        DEADLINE_STATS["expired_before_ai"] += 1
+        raise requests.exceptions.Timeout(f"Budget exhausted before calling {path}")
+
+    try:
+        with ai_gate.track(cls):
+            res = ai_client.post(
+                path,
+                payload,
+                timeout=budget_ms / 1000.0,
+                budget_header=AI_BUDGET_HEADER,
+                idempotent=idempotent,
+                local_only=local_only,
+            )
+    except requests.exceptions.Timeout:
+        DEADLINE_STATS["ai_timeouts"] += 1
+        raise
+
+    if res.status_code == 504:
+        DEADLINE_STATS["ai_deadline_exceeded"] += 1
+    return res
+
+def post_frame_to_ai(path, faces, registered_faces, start_time, snapshot=None):
+    # Co-located AI service: pass shared-memory handles, not megabytes of JSON.
+    res = None
+    if ai_client.local:
+        with packed_recognize_payload(faces, registered_faces, snapshot) as shm_payload:
+            if shm_payload:
+                try:
+                    res = post_to_ai(path, shm_payload, start_time, "live", local_only=True)
+                except LocalTransportLost:
+                    # Socket gone; handles mean nothing over TCP, resend inline.
+                    res = None
+    if res is not None and res.status_code != 409:
+        return res
+    # No handles sent, or a slot/snapshot went stale before it was read; resend inline.
+
+    payload = {"faces": faces}
+    if registered_faces:
+        # Cached embeddings are float32 arrays; JSON needs plain lists.
+        payload["registered_faces"] = [
+            {**f, "embedding": f["embedding"].tolist()} for f in registered_faces
+        ]
+    return post_to_ai(path, payload, start_time, "live")
+
+# Helper: Fast "busy, retry after" response
+def busy_response(retry_after_ms, error="AI service busy, retry later"):
+    resp = jsonify({
+        "success": False,
+        "busy": True,
+        "error": error,
+        "retry_after_ms": retry_after_ms,
+    })
+    resp.headers["Retry-After"] = str(max(1, math.ceil(retry_after_ms / 1000)))
+    return resp, 503
+
+# Helper: AI circuit open, fail fast until the breaker probes again
+def breaker_open_response():
+    return busy_response(int(ai_client.breaker.reset_seconds * 1000), "AI service unavailable, retry later")
 
 # Helper: Cache Management
-def get_cached_faces(class_id):
-    now = time.time()
-    entry = FACES_CACHE.get(class_id)
-    
-    if entry and (now - entry["ts"]) < FACES_CACHE_TTL:
-        print(f"Cache hit for class {class_id} ({len(entry['data'])} embeddings)")
-        return entry["data"]
+def _cache_entry_valid(entry, key, ttl, now):
+    return entry is not None and (now - entry["ts"]) < ttl and gallery_versions.is_fresh(entry, key)
 
-    # Cache miss — fetch from DB
+def load_class_faces(class_id):
+    """Fetch a class's embeddings from Mongo: (registered, centroids) or None."""
     cls = classes_collection.find_one({"_id": ObjectId(class_id)})
     if not cls:
-        print("Class not found for embeddings.")
-        return []
+        return None
 
     registered = []
+    centroids = {}
     student_ids = [s["student_id"] for s in cls.get("students", [])]
 
     if student_ids:
         students = list(students_collection.find(
-            {"student_id": {"$in": student_ids}, "embeddings": {"$exists": True}}
+            {"student_id": {"$in": student_ids}, "embeddings": {"$exists": True}},
+            {"student_id": 1, "embeddings": 1, "embedding_centroid": 1},
         ))
         for s in students:
             sid = s.get("student_id")
-            for angle, vec in s.get("embeddings", {}).items():
-                if isinstance(vec, list) and len(vec) == 512:
-                    registered.append({
-                        "user_id": sid,
-                        "embedding": vec,
-                        "angle": angle,
-                        "is_instructor": False
-                    })
+            centroids[sid] = s.get("embedding_centroid")
+            for angle, vec in decode_embeddings(s.get("embeddings")).items():
+                registered.append({
+                    "user_id": sid,
+                    "embedding": vec,
+                    "angle": angle,
+                    "is_instructor": False
+                })
 
     instructor_id = cls.get("instructor_id")
     if instructor_id:
         instructor = instructors_collection.find_one(
-            {"instructor_id": instructor_id, "embeddings": {"$exists": True}}
+            {"instructor_id": instructor_id, "embeddings": {"$exists": True}},
+            {"embeddings": 1, "embedding_centroid": 1},
         )
         if instructor:
-            for angle, vec in instructor.get("embeddings", {}).items():
-                if isinstance(vec, list) and len(vec) == 512:
-                    registered.append({
-                        "user_id": instructor_id,
-                        "embedding": vec,
-                        "angle": angle,
-                        "is_instructor": True
-                    })
-
-    FACES_CACHE[class_id] = {"data": registered, "ts": now}
-    print(f"Cache refreshed: {len(registered)} embeddings for class {class_id}")
+            centroids[instructor_id] = instructor.get("embedding_centroid")
+            for angle, vec in decode_embeddings(instructor.get("embeddings")).items():
+                registered.append({
+                    "user_id": instructor_id,
+                    "embedding": vec,
+                    "angle": angle,
+                    "is_instructor": True
+                })
+
+    return registered, centroids
+
+def get_cached_faces(class_id):
+    now = time.time()
+    key = gallery_key(class_id)
+    entry = FACES_CACHE.get(class_id)
+
+    if _cache_entry_valid(entry, key, FACES_CACHE_TTL, now):
+        print(f"Cache hit for class {class_id} ({len(entry['data'])} embeddings)")
+        return entry["data"]
+
+    # Read the version before the data: a bump landing mid-build then
+    # simply triggers another rebuild on the next frame.
+    version = gallery_versions.version(key)
+
+    # Another worker may already have published this version's snapshot.
+    snapshot = load_snapshot(class_id, version)
+    if snapshot is not None:
+        source = "snapshot"
+    else:
+        # Cache miss — fetch from DB
+        loaded = load_class_faces(class_id)
+        if loaded is None:
+            print("Class not found for embeddings.")
+            return []
+        registered, centroids = loaded
+        gallery = Gallery(registered, centroids)
+        snapshot = write_snapshot(class_id, version, gallery) if len(gallery) else None
+        source = "db"
+
+    if snapshot is not None:
+        # Mapped rows, shared with every other worker on this host.
+        gallery = snapshot.gallery
+        registered = gallery.registered_faces()
+
+    FACES_CACHE[class_id] = {
+        "data": registered,
+        "gallery": gallery,
+        "snapshot": snapshot,
+        "ts": now,
+        "version": version,
+    }
+    print(f"Cache refreshed from {source}: {len(registered)} embeddings for class {class_id}")
     return registered
 
+def get_cached_gallery(class_id):
+    registered = get_cached_faces(class_id)
+    entry = FACES_CACHE.get(class_id)
+    if entry is None:
+        return Gallery(registered)
+    return entry["gallery"]
+
+def get_cached_snapshot(class_id, registered_faces):
+    """The snapshot backing `registered_faces`, if that list is still cached."""
+    entry = FACES_CACHE.get(class_id)
+    if entry is None or entry["data"] is not registered_faces:
+        return None
+    snapshot = entry.get("snapshot")
+    if snapshot is not None and not os.path.exists(snapshot.path):
+        # Pruned or removed: our mapping still works, but the AI service
+        # can't open the file, so send the gallery through the ring instead.
+        entry["snapshot"] = snapshot = None
+    return snapshot
+
 def invalidate_faces_cache(class_id):
+    # Drops the entry in every worker, not just this one.
     FACES_CACHE.pop(class_id, None)
+    bump_class(class_id)
 
 def get_cached_class(class_id):
     now = time.time()
+    key = class_key(class_id)
     entry = CLASS_CACHE.get(class_id)
-    if entry and (now - entry["ts"]) < CLASS_CACHE_TTL:
+    if _cache_entry_valid(entry, key, CLASS_CACHE_TTL, now):
         return entry["data"]
+    version = gallery_versions.version(key)
     try:
         cls = classes_collection.find_one({"_id": ObjectId(class_id)})
     except Exception:
         return None
     if cls:
-        CLASS_CACHE[class_id] = {"data": cls, "ts": now}
+        CLASS_CACHE[class_id] = {"data": cls, "ts": now, "version": version}
     return cls
 
 def get_student_cached(user_id):
     now = time.time()
+    key = student_key(user_id)
     entry = STUDENT_CACHE.get(user_id)
-    if entry and (now - entry["ts"]) < STUDENT_CACHE_TTL:
+    if _cache_entry_valid(entry, key, STUDENT_CACHE_TTL, now):
         return entry["data"]
+    version = gallery_versions.version(key)
     student = get_student_by_id(user_id)  # your existing imported function
     if student:
-        STUDENT_CACHE[user_id] = {"data": student, "ts": now}
+        STUDENT_CACHE[user_id] = {"data": student, "ts": now, "version": version}
     return student
 
+# Predictive warm-up hooks (utils.gallery_warmup)
+def warm_class_caches(class_id):
+    """Build everything the first live frame of `class_id` would miss on."""
+    get_cached_faces(class_id)
+    cls = get_cached_class(class_id)
+    for s in (cls or {}).get("students", []):
+        if s.get("student_id"):
+            get_student_cached(s["student_id"])
+
+def evict_class_caches(class_id):
+    cls = get_cached_class(class_id) or {}
+    if cls.get("is_attendance_active"):
+        return False
+    FACES_CACHE.pop(class_id, None)
+    CLASS_CACHE.pop(class_id, None)
+    for s in cls.get("students", []):
+        STUDENT_CACHE.pop(s.get("student_id"), None)
+    return True
+
 # REGISTER FACE
 @face_bp.route("/register-auto", methods=["POST"])
 def register_auto():
@@ -134,12 +327,19 @@ def register_auto():
                 "error": "Missing student_id or image"
             }), 400
 
+        admitted, retry_after_ms = ai_gate.try_admit("registration")
+        if not admitted:
+            return busy_response(retry_after_ms)
+
         course = (data.get("Course") or data.get("course") or "").strip().upper() or "UNKNOWN"
         data["course"] = course
         current_app.logger.info(f"Preserved course for {student_id}: {course}")
 
         hf_start = time.time()
-        res = requests.post(f"{HF_AI_URL}/register-auto", json=data, timeout=60)
+        try:
+            res = post_to_ai("/register-auto", data, start_time, "registration", idempotent=True)
+        finally:
+            ai_gate.release("registration")
         hf_elapsed = time.time() - hf_start
 
         if res.status_code != 200:
@@ -171,7 +371,7 @@ def register_auto():
             }), 200
 
         embedding_for_angle = embeddings[angle]
-        students_collection.find_one_and_update(
+        doc = students_collection.find_one_and_update(
             {"student_id": student_id},
             {
                 "$setOnInsert": {
@@ -184,13 +384,19 @@ def register_auto():
                     "Last_Name": data.get("Last_Name"),
                     "Suffix": data.get("Suffix"),
                     "Course": course,
+                    "program_key": program_key(course),
                     "registered": True,
-                    f"embeddings.{angle}": embedding_for_angle,  # merge per angle, not full overwrite
+                    f"embeddings.{angle}": encode_embedding(embedding_for_angle),  # merge per angle, not full overwrite
+                    "embeddings_updated_at": datetime.utcnow(),
                     "updated_at": datetime.utcnow(),
                 }
             },
-            upsert=True
+            projection=CENTROID_PROJECTION,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
         )
+        update_embedding_centroid(students_collection, doc)
+        bump_student(student_id)
 
         total_elapsed = time.time() - start_time
         current_app.logger.info(
@@ -212,6 +418,9 @@ def register_auto():
             "error": "AI service timeout"
         }), 504
 
+    except AIServiceUnavailable:
+        return breaker_open_response()
+
     except Exception as e:
         current_app.logger.error(
             f"/register-auto error: {str(e)}\n{traceback.format_exc()}"
@@ -234,8 +443,15 @@ def register_instructor():
                 "error": "Missing instructor_id or image"
             }), 400
 
+        admitted, retry_after_ms = ai_gate.try_admit("registration")
+        if not admitted:
+            return busy_response(retry_after_ms)
+
         hf_start = time.time()
-        res = requests.post(f"{HF_AI_URL}/register-instructor", json=data, timeout=60)
+        try:
+            res = post_to_ai("/register-instructor", data, start_time, "registration", idempotent=True)
+        finally:
+            ai_gate.release("registration")
         hf_elapsed = time.time() - hf_start
 
         if res.status_code != 200:
@@ -296,6 +512,9 @@ def register_instructor():
             "error": "AI service timeout"
         }), 504
 
+    except AIServiceUnavailable:
+        return breaker_open_response()
+
     except Exception as e:
         current_app.logger.error(
             f"/register-instructor error: {str(e)}\n{traceback.format_exc()}"
@@ -307,17 +526,59 @@ def register_instructor():
 
 # MULTI-FACE ATTENDANCE
 @face_bp.route("/multi-recognize", methods=["POST"])
+@limiter.limit(MULTI_RECOGNIZE_RATE_LIMIT)
 def multi_face_recognize():
     start_time = time.time()
 
-    try:
-        data = request.get_json(silent=True) or {}
-        faces = data.get("faces") or []
-        class_id = str(data.get("class_id") or "").strip()
+    data = request.get_json(silent=True) or {}
+    faces = data.get("faces") or []
+    class_id = str(data.get("class_id") or "").strip()
 
-        if not faces or not class_id:
-            return jsonify({"error": "Missing faces or class_id"}), 400
+    if not faces or not class_id:
+        return jsonify({"error": "Missing faces or class_id"}), 400
 
+    # One in-flight frame per session; a frame arriving meanwhile is turned
+    # away at once with the session's last completed result.
+    if not live_frames.enter(class_id):
+        return jsonify({
+            "success": True,
+            "superseded": True,
+            "logged": [],
+            "count": 0,
+            "latest": live_frames.latest(class_id),
+        }), 409
+
+    result = None
+    try:
+        admitted, retry_after_ms = ai_gate.try_admit("live")
+        if not admitted:
+            return busy_response(retry_after_ms)
+        try:
+            resp, code = recognize_and_log_frame(faces, class_id, start_time)
+        finally:
+            ai_gate.release("live")
+        if code == 200:
+            result = resp.get_json()
+        return resp, code
+    finally:
+        live_frames.leave(class_id, result)
+
+def find_session_header(log_id, student_ids):
+    """Session header, plus legacy embedded entries for these students."""
+    return attendance_collection.find_one(
+        {"_id": log_id},
+        {
+            **{f: 1 for f in HEADER_FIELDS},
+            "start_time": 1,
+            "students": {"$filter": {
+                "input": {"$ifNull": ["$students", []]},
+                "cond": {"$in": ["$$this.student_id", list(student_ids)]},
+            }},
+        },
+    )
+
+def recognize_and_log_frame(faces, class_id, start_time):
+    try:
         # Fix 1 — cached, no DB hit if fresh
         registered_faces = get_cached_faces(class_id)
         if not registered_faces:
@@ -328,21 +589,32 @@ def multi_face_recognize():
                 "instructor_detected": False
             }), 200
 
-        payload = {"faces": faces, "registered_faces": registered_faces}
+        embed_only = AI_PIPELINE_MODE == "embed"
 
         try:
-            hf_res = requests.post(
-                f"{HF_AI_URL}/recognize-multi",
-                json=payload,
-                timeout=60
-            )
+            if embed_only:
+                hf_res = post_frame_to_ai("/embed-multi", faces, [], start_time)
+            else:
+                hf_res = post_frame_to_ai(
+                    "/recognize-multi", faces, registered_faces, start_time,
+                    snapshot=get_cached_snapshot(class_id, registered_faces),
+                )
+            if hf_res.status_code == 504:
+                return jsonify({"error": "AI service deadline exceeded"}), 504
             if hf_res.status_code != 200:
                 return jsonify({"error": "AI service failed"}), 500
             hf_result = hf_res.json()
+        except requests.exceptions.Timeout:
+            return jsonify({"error": "AI service timeout"}), 504
+        except AIServiceUnavailable:
+            return breaker_open_response()
         except Exception:
             return jsonify({"error": "AI service unreachable"}), 500
 
-        recognized = hf_result.get("recognized") or []
+        if embed_only:
+            recognized = match_faces(get_cached_gallery(class_id), hf_result.get("faces") or [])
+        else:
+            recognized = hf_result.get("recognized") or []
 
         # Fix 3 — use cached class doc
         cls = get_cached_class(class_id)
@@ -360,7 +632,17 @@ def multi_face_recognize():
         except Exception:
             return jsonify({"error": "Invalid log id"}), 500
 
-        att_log = attendance_collection.find_one({"_id": log_id})
+        # One read for the whole frame: the session header plus only the
+        # entries of students seen in it (instead of a find_one per face).
+        frame_ids = {
+            str(f.get("user_id") or "") for f in recognized
+            if f.get("type") != "instructor" and not f.get("is_instructor")
+        }
+        frame_ids.discard("")
+        # Students any worker already logged in this session need no lookup.
+        known_status = session_state.logged_students(log_id, frame_ids)
+        unknown_ids = frame_ids - known_status.keys()
+        att_log = find_session_header(log_id, unknown_ids)
 
         if not att_log:
             now = datetime.now(PH_TZ)
@@ -368,6 +650,7 @@ def multi_face_recognize():
                 "date": now.strftime("%Y-%m-%d"),
                 "class_id": class_id,
                 "course": cls.get("course"),
+                "program_key": program_key(cls.get("course")),
                 "end_time": None,
                 "instructor_id": instructor_id,
                 "instructor_first_name": cls.get("instructor_first_name"),
@@ -385,7 +668,7 @@ def multi_face_recognize():
                 inserted = attendance_collection.insert_one(new_log)  # Fix 5
                 new_log_id = str(inserted.inserted_id)
             except Exception:
-                att_log = attendance_collection.find_one({"_id": log_id})
+                att_log = find_session_header(log_id, unknown_ids)
                 if not att_log:
                     return jsonify({"error": "Failed to create attendance log"}), 500
             else:
@@ -393,30 +676,21 @@ def multi_face_recognize():
                     {"_id": ObjectId(class_id)},
                     {"$set": {"active_session_log_id": new_log_id}}
                 )
-                SESSION_LOGGED_STUDENTS[class_id] = {}
-                SESSION_INSTRUCTOR_DETECTED[class_id] = {
-                    "log_id": new_log_id,
-                    "detected": False
-                }
+                bump_class(class_id, gallery=False)
                 att_log = new_log
                 log_id = ObjectId(new_log_id)
+                known_status = {}
 
         now = datetime.now(PH_TZ)
         now_time = now.strftime("%H:%M:%S")
         now_readable = now.strftime("%I:%M %p")
 
-        if class_id not in SESSION_LOGGED_STUDENTS:
-            SESSION_LOGGED_STUDENTS[class_id] = {}
-
-        instr_state = SESSION_INSTRUCTOR_DETECTED.get(class_id)
-        if not instr_state or instr_state.get("log_id") != str(log_id):
-            SESSION_INSTRUCTOR_DETECTED[class_id] = {
-                "log_id": str(log_id),
-                "detected": False
-            }
-
-        instructor_detected = SESSION_INSTRUCTOR_DETECTED[class_id]["detected"]
+        instructor_detected = session_state.instructor_detected(log_id)
         results = []
+        logged_status = {s["student_id"]: s["status"] for s in att_log.get("students") or []}
+        if unknown_ids:
+            logged_status.update(session_statuses(log_id, unknown_ids))
+        new_entries = []
 
         if not recognized:
             return jsonify({
@@ -449,10 +723,7 @@ def multi_face_recognize():
                 if spoof_status == "Spoof" or (spoof_confidence is not None and spoof_confidence < 0.70):
                     print(f"Instructor SPOOF BLOCKED: {instructor_id} | confidence={spoof_confidence}")
                     continue
-                SESSION_INSTRUCTOR_DETECTED[class_id] = {
-                    "log_id": str(log_id),
-                    "detected": True
-                }
+                session_state.mark_instructor(log_id)
                 instructor_detected = True
                 continue
 
@@ -462,41 +733,25 @@ def multi_face_recognize():
                 continue
 
             stud_id = str(student.get("student_id"))
-            first = student.get("first_name") or student.get("First_Name", "")
-            last = student.get("last_name") or student.get("Last_Name", "")
+            first = student.get("first_name", "")
+            last = student.get("last_name", "")
             student_data = {"student_id": stud_id, "first_name": first, "last_name": last}
 
-            cache_entry = SESSION_LOGGED_STUDENTS[class_id].get(user_id)
-            if cache_entry and cache_entry.get("log_id") == str(log_id):
-                results.append({
-                    **student_data,
-                    "status": cache_entry["status"],
-                    "time": now_readable,
-                    "bbox": bbox,
-                    "match_score": match_score,
-                    "spoof_status": spoof_status,
-                    "spoof_confidence": spoof_confidence,
-                    "real_prob": real_prob,
-                    "spoof_prob": spoof_prob
-                })
-                continue
+            result = {
+                **student_data, "time": now_readable,
+                "bbox": bbox, "match_score": match_score,
+                "spoof_status": spoof_status, "spoof_confidence": spoof_confidence,
+                "real_prob": real_prob, "spoof_prob": spoof_prob
+            }
 
-            existing = attendance_collection.find_one(
-                {"_id": log_id, "students.student_id": stud_id},
-                {"students.$": 1}
-            )
+            if stud_id in known_status:
+                results.append({**result, "status": known_status[stud_id]})
+                continue
 
-            if existing and existing.get("students"):
-                status = existing["students"][0]["status"]
-                SESSION_LOGGED_STUDENTS[class_id][user_id] = {
-                    "status": status, "log_id": str(log_id)
-                }
-                results.append({
-                    **student_data, "status": status, "time": now_readable,
-                    "bbox": bbox, "match_score": match_score,
-                    "spoof_status": spoof_status, "spoof_confidence": spoof_confidence,
-                    "real_prob": real_prob, "spoof_prob": spoof_prob
-                })
+            if stud_id in logged_status:
+                status = logged_status[stud_id]
+                session_state.remember_student(log_id, stud_id, status)
+                results.append({**result, "status": status})
                 continue
 
             try:
@@ -507,26 +762,20 @@ def multi_face_recognize():
             except Exception:
                 status = "Present"
 
-            attendance_collection.update_one(
-                {"_id": log_id},
-                {
-                    "$push": {"students": {
-                        "student_id": stud_id, "first_name": first,
-                        "last_name": last, "status": status, "time": now_time
-                    }},
-                    "$set": {"end_time": now_time}
-                }
-            )
+            # Atomic across workers: only the first claim writes an entry.
+            status, claimed = session_state.claim_student(log_id, stud_id, status)
+            logged_status[stud_id] = status
+            if claimed:
+                new_entries.append({
+                    "student_id": stud_id, "first_name": first,
+                    "last_name": last, "status": status, "time": now_time
+                })
+            results.append({**result, "status": status})
 
-            SESSION_LOGGED_STUDENTS[class_id][user_id] = {
-                "status": status, "log_id": str(log_id)
-            }
-            results.append({
-                **student_data, "status": status, "time": now_readable,
-                "bbox": bbox, "match_score": match_score,
-                "spoof_status": spoof_status, "spoof_confidence": spoof_confidence,
-                "real_prob": real_prob, "spoof_prob": spoof_prob
-            })
+        # Students first seen in this frame go to the write-behind buffer;
+        # its flush guards each push as well, for claims that expired.
+        if new_entries:
+            attendance_buffer.add_session_entries(att_log, new_entries)
 
         duration = time.time() - start_time
         current_app.logger.info(
@@ -547,4 +796,18 @@ def multi_face_recognize():
 
     except Exception:
         current_app.logger.error(traceback.format_exc())
-        return jsonify({"error": "Internal server error"}), 500
\ No newline at end of file
+        return jsonify({"error": "Internal server error"}), 500
+
+@face_bp.route("/metrics", methods=["GET"])
+def face_metrics():
+    return jsonify({
+        "deadlines": DEADLINE_STATS,
+        "admission": ai_gate.stats(),
+        "live_frames": live_frames.stats(),
+        "ai_client": ai_client.stats(),
+        "gallery_versions": gallery_versions.stats(),
+        "gallery_snapshots": sum(1 for e in FACES_CACHE.values() if e.get("snapshot") is not None),
+        "gallery_warmup": warmup_stats(),
+        "attendance_buffer": attendance_buffer.stats(),
+        "session_state": session_state.stats(),
+    }), 200
@@ -10,6 +10,12 @@ from models.instructor_model import (
     create_instructor
 )
 from models.class_model import get_all_classes_with_details
+from utils.embedding_codec import embeddings_to_json
+from utils.attendance_events import attendance_logs_archive, find_events, hydrate_sessions, iter_sessions
+from utils.pagination import include_archived, keyset_page, page_args, session_filters, stream_json
+from utils.attendance_rollups import attendance_trend, trend_params
+from utils.attendance_stats import class_stats_many, combined_stats
+from utils.report_export import export_response, submit_export_job, wants_stream
 
 instructor_bp = Blueprint("instructor", __name__)
 
@@ -155,23 +161,19 @@ def attendance_report(class_id):
 
         query["date"] = {"$gte": start, "$lt": end}
 
-    logs = list(attendance_collection.find(query).sort("date", 1))
-
     results = []
-    for log in logs:
-        date_str = str(log.get("date"))
-        for s in log.get("students", []):
-            results.append({
-                "date": date_str,
-                "class_id": log.get("class_id"),
-                "subject_code": log.get("subject_code"),
-                "subject_title": log.get("subject_title"),
-                "student_id": s.get("student_id"),
-                "first_name": s.get("first_name"),
-                "last_name": s.get("last_name"),
-                "status": s.get("status"),
-                "time": s.get("time"),
-            })
+    for e in find_events(query, include_archived=include_archived(request.args)):
+        results.append({
+            "date": str(e.get("date")),
+            "class_id": e.get("class_id"),
+            "subject_code": e.get("subject_code"),
+            "subject_title": e.get("subject_title"),
+            "student_id": e.get("student_id"),
+            "first_name": e.get("first_name"),
+            "last_name": e.get("last_name"),
+            "status": e.get("status"),
+            "time": e.get("time"),
+        })
 
     return jsonify({
         "class_id": class_id,
@@ -206,25 +208,38 @@ def attendance_report_all():
             start, end = start_date, end_date
         query["date"] = {"$gte": start, "$lt": end}
 
-    logs = list(attendance_collection.find(query).sort("date", 1))
-
     results = []
-    for log in logs:
-        date_str = str(log.get("date"))
-        for s in log.get("students", []):
-            results.append({
-                "class_id": log.get("class_id"),
-                "subject_code": log.get("subject_code"),
-                "subject_title": log.get("subject_title"),
-                "date": date_str,
-                "student_id": s.get("student_id"),
-                "first_name": s.get("first_name"),
-                "last_name": s.get("last_name"),
-                "status": s.get("status"),
-                "time": s.get("time"),
-            })
+    for e in find_events(query, include_archived=include_archived(request.args)):
+        results.append({
+            "class_id": e.get("class_id"),
+            "subject_code": e.get("subject_code"),
+            "subject_title": e.get("subject_title"),
+            "date": str(e.get("date")),
+            "student_id": e.get("student_id"),
+            "first_name": e.get("first_name"),
+            "last_name": e.get("last_name"),
+            "status": e.get("status"),
+            "time": e.get("time"),
+        })
     return jsonify(results), 200
 
+# Attendance Report export (CSV / XLSX job; ?stream=true streams CSV directly)
+# ?format=csv|xlsx&class_id=&start=YYYY-MM-DD&end=YYYY-MM-DD&semester=&school_year=
+@instructor_bp.route("/attendance-report/export", methods=["GET"])
+@jwt_required()
+def export_attendance_report():
+    try:
+        query = session_filters(request.args)
+        query["instructor_id"] = get_jwt_identity()
+        fmt = request.args.get("format", "csv").lower()
+        if wants_stream(request.args):
+            return export_response(query, fmt, "attendance-report", include_archived(request.args))
+        job_id = submit_export_job(query, fmt, "attendance-report", include_archived(request.args),
+                                   params=request.args.to_dict(), created_by=get_jwt_identity())
+        return jsonify({"message": "Export started", "job_id": job_id}), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
 #  Instructor Overview Endpoints
 @instructor_bp.route("/<string:instructor_id>/overview", methods=["GET"])
 @jwt_required()
@@ -249,26 +264,11 @@ def instructor_overview(instructor_id):
 
         # Attendance stats
         class_ids = [str(cls["_id"]) for cls in classes]
-        pipeline = [
-            {"$match": {"class_id": {"$in": class_ids}}},
-            {"$unwind": "$students"},
-            {"$group": {
-                "_id": None,
-                "total_records": {"$sum": 1},
-                "present": {"$sum": {"$cond": [{"$eq": ["$students.status", "Present"]}, 1, 0]}},
-                "late": {"$sum": {"$cond": [{"$eq": ["$students.status", "Late"]}, 1, 0]}},
-                "absent": {"$sum": {"$cond": [{"$eq": ["$students.status", "Absent"]}, 1, 0]}}
-            }}
-        ]
-
-        agg = list(attendance_collection.aggregate(pipeline))
-        if agg:
-            total_records = agg[0]["total_records"]
-            present_count = agg[0]["present"]
-            late_count = agg[0]["late"]
-            absent_count = agg[0]["absent"]
-        else:
-            total_records = present_count = late_count = absent_count = 0
+        counts = combined_stats(class_stats_many(class_ids).values())
+        total_records = counts["total"]
+        present_count = counts["present"]
+        late_count = counts["late"]
+        absent_count = counts["absent"]
 
         attendance_rate = (
             round(((present_count + late_count) / total_records) * 100, 2)
@@ -294,37 +294,15 @@ def instructor_overview(instructor_id):
 @jwt_required()
 def instructor_attendance_trend(instructor_id):
     try:
-        pipeline = [
-            {"$match": {"instructor_id": instructor_id}},
-            {"$unwind": "$students"},
-            {"$group": {
-                "_id": "$date",  # group by date string (same as student)
-                "present": {
-                    "$sum": {"$cond": [{"$eq": ["$students.status", "Present"]}, 1, 0]}
-                },
-                "late": {
-                    "$sum": {"$cond": [{"$eq": ["$students.status", "Late"]}, 1, 0]}
-                },
-                "absent": {
-                    "$sum": {"$cond": [{"$eq": ["$students.status", "Absent"]}, 1, 0]}
-                }
-            }},
-            {"$sort": {"_id": 1}}
-        ]
-
-        trend = list(attendance_collection.aggregate(pipeline))
-
-        formatted = [
-            {
-                "date": t["_id"],  # keep same key as student
-                "present": t.get("present", 0),
-                "late": t.get("late", 0),
-                "absent": t.get("absent", 0)
-            }
-            for t in trend
-        ]
-
-        return jsonify(formatted), 200
+        # ?start=YYYY-MM-DD&end=YYYY-MM-DD&granularity=day|week|month
+        try:
+            start, end, granularity = trend_params(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        trend = attendance_trend({"instructor_id": instructor_id}, start, end, granularity,
+                                 include_archived(request.args))
+        return jsonify(trend), 200
     except Exception as e:
         print(f"❌ Error in instructor_attendance_trend: {e}")
         return jsonify({"error": str(e)}), 500
@@ -395,7 +373,7 @@ def get_class_sessions(class_id):
         if not instructor_id:
             return jsonify({"error": "Unauthorized"}), 403
 
-        sessions = list(attendance_collection.find({
+        sessions = hydrate_sessions(attendance_collection.find({
             "class_id": class_id,
             "instructor_id": instructor_id
         }).sort("date", -1))
@@ -423,15 +401,11 @@ def get_instructor_by_id(instructor_id):
     inst["_id"] = str(inst["_id"])
 
     inst.setdefault("registered", False)
-    inst.setdefault("embeddings", {})
+    # Stored as packed Binary (or legacy lists); the client expects lists.
+    inst["embeddings"] = embeddings_to_json(inst.get("embeddings"))
 
     required_angles = ["front", "left", "right", "up", "down"]
-    has_all = all(
-        angle in inst["embeddings"] 
-        and isinstance(inst["embeddings"][angle], list)
-        and len(inst["embeddings"][angle]) == 512
-        for angle in required_angles
-    )
+    has_all = all(angle in inst["embeddings"] for angle in required_angles)
 
     inst["fully_registered"] = has_all
 
@@ -445,17 +419,17 @@ def get_all_instructor_sessions(instructor_id):
         if current_id != instructor_id:
             return jsonify({"error": "Unauthorized"}), 403
 
-        sessions = list(attendance_collection.find(
-            {"instructor_id": instructor_id}
-        ).sort("date", -1))
-
-        for s in sessions:
-            s["_id"] = str(s["_id"])
-
-        return jsonify({
-            "success": True,
-            "sessions": sessions
-        }), 200
+        try:
+            limit, after = page_args(request.args)
+            query = session_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query["instructor_id"] = instructor_id
+
+        archive = attendance_logs_archive if include_archived(request.args) else None
+        cursor, next_cursor = keyset_page(attendance_collection, query, limit, after, archive=archive)
+        sessions = ({**s, "_id": str(s["_id"])} for s in iter_sessions(cursor))
+        return stream_json(sessions, key="sessions", extra={"success": True}, next_cursor=next_cursor)
 
     except Exception as e:
         print("❌ ERROR /all-sessions:", e)
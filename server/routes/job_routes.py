@@ -0,0 +1,60 @@
+from flask import Blueprint, Response, jsonify
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from utils.auth_roles import is_admin
+from utils.jobs import FINISHED, cancel_job, get_job, open_job_file, serialize_job
+
+job_bp = Blueprint("jobs", __name__)
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+
+def _visible_job(job_id):
+    """A job the caller may see: their own; jobs without an owner only for admins."""
+    job = get_job(job_id)
+    if not job:
+        return None
+    owner = job.get("created_by")
+    if owner is None:
+        return job if is_admin() else None
+    return job if owner == get_jwt_identity() else None
+
+# Job status / progress / result
+@job_bp.route("/<job_id>", methods=["GET"])
+@jwt_required()
+def get_job_status(job_id):
+    job = _visible_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(serialize_job(job)), 200
+
+# Cancel: queued jobs stop at once, running ones at their next step
+@job_bp.route("/<job_id>/cancel", methods=["POST"])
+@jwt_required()
+def cancel_job_route(job_id):
+    job = _visible_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job.get("status") in FINISHED:
+        return jsonify({"error": f"Job already {job['status']}", "job": serialize_job(job)}), 409
+    return jsonify(serialize_job(cancel_job(job_id))), 202
+
+# File result of a finished job (exports)
+@job_bp.route("/<job_id>/download", methods=["GET"])
+@jwt_required()
+def download_job_file(job_id):
+    job = _visible_job(job_id)
+    f = open_job_file(job)
+    if not f:
+        return jsonify({"error": "No file for this job"}), 404
+
+    def generate():
+        while True:
+            chunk = f.read(DOWNLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+    response = Response(generate(), mimetype=f.content_type or "application/octet-stream")
+    response.headers["Content-Disposition"] = f'attachment; filename="{f.filename}"'
+    response.headers["Content-Length"] = str(f.length)
+    return response
@@ -0,0 +1,37 @@
+"""Move a past semester's attendance to the archive collections.
+
+Run from the server directory. Resumable: re-run to finish an interrupted
+archive. Without arguments, lists archive runs.
+    python scripts/archive_semester.py
+    python scripts/archive_semester.py --semester "1st Sem" --school-year 2024-2025
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.db_config import db
+from utils.attendance_archive import ARCHIVE_BATCH_SIZE, archive_runs, archive_semester
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--semester")
+    parser.add_argument("--school-year")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if not (args.semester and args.school_year):
+        print(json.dumps(archive_runs(), indent=2, default=str))
+        return
+
+    active = db["semesters"].find_one({"is_active": True}) or {}
+    if (active.get("semester_name"), active.get("school_year")) == (args.semester, args.school_year):
+        sys.exit("Refusing to archive the active semester")
+    print(json.dumps(archive_semester(args.semester, args.school_year, args.batch_size), indent=2))
+
+
+if __name__ == "__main__":
+    main()
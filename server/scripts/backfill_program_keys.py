@@ -0,0 +1,30 @@
+"""Set program_key (normalized course) on documents written before it existed.
+
+Run from the server directory once at deploy, before relying on program
+filters; re-running only touches documents still missing the key:
+    python scripts/backfill_program_keys.py
+    python scripts/backfill_program_keys.py --collections students classes
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.programs import PROGRAM_KEY_COLLECTIONS, backfill_program_keys
+from utils.db_indexes import apply_indexes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--collections", nargs="+", choices=PROGRAM_KEY_COLLECTIONS,
+                        default=list(PROGRAM_KEY_COLLECTIONS))
+    args = parser.parse_args()
+
+    apply_indexes(args.collections)
+    print(json.dumps(backfill_program_keys(args.collections), indent=2))
+
+
+if __name__ == "__main__":
+    main()
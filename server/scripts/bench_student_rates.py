@@ -0,0 +1,139 @@
+"""Benchmark the admin students list: per-student vs grouped vs stats reads.
+
+Seeds a scratch database (never the app's) with N students and M
+attendance rows, both as attendance_events and as legacy embedded
+attendance_logs arrays, then times:
+  per-student  one $unwind aggregation over attendance_logs per student
+               (the original endpoint), timed on a sample and extrapolated
+  grouped      one $in + $group aggregation over attendance_events
+  stats        one _id $in read of attendance_stats student counters
+
+Run from the server directory against a local mongod:
+    MONGO_URI=mongodb://localhost:27017 python scripts/bench_student_rates.py
+    MONGO_URI=mongodb://localhost:27017 python scripts/bench_student_rates.py --students 5000 --rows 100000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import ASCENDING
+
+from config.db_config import client
+
+STATUSES = ["Present"] * 7 + ["Late"] * 2 + ["Absent"]
+SESSION_SIZE = 50
+
+
+def seed(database, students, rows):
+    database.students.drop()
+    database.attendance_events.drop()
+    database.attendance_logs.drop()
+
+    ids = [f"BENCH-{i:06d}" for i in range(students)]
+    database.students.insert_many([
+        {"student_id": sid, "First_Name": "F", "Last_Name": f"L{i}", "Course": "BSIT", "Section": "A"}
+        for i, sid in enumerate(ids)
+    ])
+
+    rnd = random.Random(42)
+    sessions = max(1, rows // SESSION_SIZE)
+    logs, events = [], []
+    for n in range(sessions):
+        date = f"2025-{1 + n % 12:02d}-{1 + n % 28:02d}"
+        members = rnd.sample(ids, min(SESSION_SIZE, len(ids)))
+        entries = [{"student_id": sid, "status": rnd.choice(STATUSES)} for sid in members]
+        log_id = f"bench-{n}"
+        logs.append({"_id": log_id, "class_id": f"C{n % 100}", "date": date, "students": entries})
+        events.extend({"session_id": log_id, "class_id": f"C{n % 100}", "date": date, **e} for e in entries)
+        if len(logs) >= 200:
+            database.attendance_logs.insert_many(logs)
+            database.attendance_events.insert_many(events)
+            logs, events = [], []
+    if logs:
+        database.attendance_logs.insert_many(logs)
+        database.attendance_events.insert_many(events)
+
+    database.attendance_events.create_index([("session_id", ASCENDING), ("student_id", ASCENDING)], unique=True)
+    database.attendance_events.create_index([("student_id", ASCENDING), ("date", ASCENDING)])
+    return ids
+
+
+def grouped_pipeline(student_ids):
+    return [
+        {"$match": {"student_id": {"$in": list(student_ids)}}},
+        {"$group": {
+            "_id": "$student_id",
+            "present": {"$sum": {"$cond": [{"$eq": ["$status", "Present"]}, 1, 0]}},
+            "late": {"$sum": {"$cond": [{"$eq": ["$status", "Late"]}, 1, 0]}},
+            "total": {"$sum": 1},
+        }},
+    ]
+
+
+def per_student(database, sid):
+    return list(database.attendance_logs.aggregate([
+        {"$unwind": "$students"},
+        {"$match": {"students.student_id": sid}},
+        {"$group": {
+            "_id": "$students.student_id",
+            "present": {"$sum": {"$cond": [{"$eq": ["$students.status", "Present"]}, 1, 0]}},
+            "late": {"$sum": {"$cond": [{"$eq": ["$students.status", "Late"]}, 1, 0]}},
+            "total": {"$sum": 1},
+        }},
+    ]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="frams_bench", help="scratch database, dropped and reseeded")
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--sample", type=int, default=20,
+                        help="students timed with the per-student query")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.db == "face_attendance_system":
+        sys.exit("Refusing to seed the application database")
+    database = client[args.db]
+
+    start = time.time()
+    ids = seed(database, args.students, args.rows)
+    print(f"Seeded {args.students} students / {args.rows} rows in {time.time() - start:.1f}s")
+
+    sample = ids[:args.sample]
+    start = time.time()
+    for sid in sample:
+        per_student(database, sid)
+    per_call = (time.time() - start) / len(sample)
+    print(f"per-student: {per_call * 1000:.1f} ms/student,"
+          f" ~{per_call * len(ids):.1f}s for the full list (extrapolated)")
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.time()
+        rates = list(database.attendance_events.aggregate(grouped_pipeline(ids)))
+        timings.append(time.time() - start)
+    print(f"grouped:     {min(timings) * 1000:.1f} ms best of {args.repeat}"
+          f" for {len(rates)} students with attendance")
+
+    # Same shape as utils/attendance_stats "student:<id>" documents.
+    database.attendance_stats.insert_many([
+        {**row, "_id": f"student:{row['_id']}", "scope": "student"} for row in rates
+    ])
+    timings = []
+    for _ in range(args.repeat):
+        start = time.time()
+        rows = list(database.attendance_stats.find({"_id": {"$in": [f"student:{sid}" for sid in ids]}}))
+        timings.append(time.time() - start)
+    print(f"stats:       {min(timings) * 1000:.1f} ms best of {args.repeat} for {len(rows)} counters")
+
+    client.drop_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Apply the index registry and check hot queries against it.
+
+Run from the server directory:
+    python scripts/ensure_indexes.py
+    python scripts/ensure_indexes.py --verify
+    MONGO_URI=mongodb://localhost:27017 python scripts/ensure_indexes.py --verify
+
+--verify explains every hot query shape (utils/db_indexes.HOT_QUERIES) and
+exits non-zero if any winning plan contains a COLLSCAN. Point it at a local
+mongod: explain needs the indexes, not the data.
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db_indexes import INDEXES, apply_indexes, verify_query_plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verify", action="store_true",
+                        help="explain hot queries after applying; fail on COLLSCAN")
+    parser.add_argument("--collection", action="append", choices=sorted(INDEXES),
+                        help="only these collections (repeatable)")
+    args = parser.parse_args()
+
+    ensured = apply_indexes(args.collection)
+    print(f"Indexes ensured: {len(ensured)}")
+    for name in ensured:
+        print(f"  {name}")
+
+    if not args.verify:
+        return
+    failures = verify_query_plans()
+    if failures:
+        print(f"{len(failures)} hot quer(ies) fall back to a collection scan")
+        sys.exit(1)
+    print("All hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
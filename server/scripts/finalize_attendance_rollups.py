@@ -0,0 +1,43 @@
+"""Finalize closed days into attendance_daily buckets.
+
+The app does this in the background (ATTENDANCE_ROLLUPS); run it by hand
+to backfill a long history or to rebuild a range after a data fix.
+
+Run from the server directory:
+    python scripts/finalize_attendance_rollups.py
+    python scripts/finalize_attendance_rollups.py --from 2025-06-01 --to 2025-06-30
+"""
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.attendance_rollups import finalize_closed_days, finalize_day
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from", dest="start", help="first day to recompute (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", help="last day to recompute (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    if not args.start:
+        # Catch up in ROLLUP_MAX_DAYS_PER_RUN steps until nothing is left.
+        while True:
+            result = finalize_closed_days()
+            print(result)
+            if not result["finalized"]:
+                return
+
+    day = datetime.strptime(args.start, "%Y-%m-%d")
+    end = datetime.strptime(args.end or args.start, "%Y-%m-%d")
+    while day <= end:
+        finalize_day(day.strftime("%Y-%m-%d"))
+        print(f"Finalized {day:%Y-%m-%d}")
+        day += timedelta(days=1)
+
+
+if __name__ == "__main__":
+    main()
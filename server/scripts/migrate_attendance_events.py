@@ -0,0 +1,36 @@
+"""Copy embedded attendance_logs.students entries into attendance_events.
+
+Run from the server directory (safe to re-run; existing events are kept):
+    python scripts/migrate_attendance_events.py --report
+    python scripts/migrate_attendance_events.py
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.attendance_events import events_report, migrate_logs_to_events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--report", action="store_true",
+                        help="only print log / event counts, don't migrate")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    print("Before:" if not args.report else "Report:")
+    print(json.dumps(events_report(), indent=2))
+    if args.report:
+        return
+
+    migrate_logs_to_events(batch_size=args.batch_size)
+
+    print("After:")
+    print(json.dumps(events_report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Convert stored face embeddings to packed BSON Binary.
+
+Run from the server directory:
+    python scripts/migrate_embeddings.py --report
+    python scripts/migrate_embeddings.py --dtype float16
+    python scripts/migrate_embeddings.py --centroids
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.embedding_codec import EMBEDDING_STORAGE_DTYPE
+from utils.embedding_migration import backfill_centroids, migrate_embeddings, storage_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dtype", choices=["float16", "float32"], default=None,
+                        help=f"storage dtype (default: EMBEDDING_STORAGE_DTYPE={EMBEDDING_STORAGE_DTYPE})")
+    parser.add_argument("--report", action="store_true",
+                        help="only print size / load-time report, don't migrate")
+    parser.add_argument("--centroids", action="store_true",
+                        help="only backfill missing per-user centroid embeddings")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.centroids:
+        backfill_centroids(batch_size=args.batch_size)
+        return
+
+    print("Before:" if not args.report else "Report:")
+    print(json.dumps(storage_report(), indent=2))
+    if args.report:
+        return
+
+    migrate_embeddings(dtype=args.dtype, batch_size=args.batch_size, pause=0)
+    backfill_centroids(batch_size=args.batch_size)
+
+    print("After:")
+    print(json.dumps(storage_report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Rewrite student documents to the canonical field set and make student_id unique.
+
+Run from the server directory. Resumable: an interrupted run is finished
+by running it again.
+    python scripts/migrate_student_schema.py
+    python scripts/migrate_student_schema.py --batch-size 200
+    python scripts/migrate_student_schema.py --skip-index
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.student_schema import (
+    MIGRATION_BATCH_SIZE,
+    ensure_unique_student_id,
+    migrate_student_schema,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--skip-index", action="store_true",
+                        help="only rewrite documents, leave the indexes alone")
+    args = parser.parse_args()
+
+    migrated = migrate_student_schema(args.batch_size)
+    print(f"{migrated} student document(s) rewritten")
+    if args.skip_index:
+        return
+    if not ensure_unique_student_id():
+        sys.exit(1)
+    print("Unique student_id index in place")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Recompute attendance_stats counters from attendance_events.
+
+Run from the server directory, ideally while no session is live
+(increments made during the rebuild are lost):
+    python scripts/rebuild_attendance_stats.py
+    python scripts/rebuild_attendance_stats.py --check
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.attendance_stats import COUNT_FIELDS, attendance_stats_collection, rebuild_stats
+
+
+def snapshot():
+    return {
+        doc["_id"]: {k: doc.get(k, 0) for k in COUNT_FIELDS}
+        for doc in attendance_stats_collection.find({}, {"updated_at": 0})
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--check", action="store_true",
+                        help="report counters that drifted from a rebuild, keep the rebuilt set")
+    args = parser.parse_args()
+
+    before = snapshot() if args.check else None
+    counts = rebuild_stats()
+    print(json.dumps(counts, indent=2))
+    if not args.check:
+        return
+
+    after = snapshot()
+    drifted = sorted(k for k in set(before) | set(after) if before.get(k) != after.get(k))
+    print(f"{len(drifted)} counter(s) differed from the rebuild")
+    for key in drifted[:50]:
+        print(f"  {key}: {before.get(key)} -> {after.get(key)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# CONFIGURATION
+# Outstanding backend→AI calls above which new work is turned away with a
+# "busy, retry after" hint instead of queueing behind everything else.
+AI_QUEUE_BUSY_THRESHOLD = int(os.getenv("AI_QUEUE_BUSY_THRESHOLD", 8))
+CLASS_LIMITS = {
+    "live": int(os.getenv("AI_ADMIT_LIVE", 6)),
+    "registration": int(os.getenv("AI_ADMIT_REGISTRATION", 3)),
+}
+# How many calls the AI service actually runs in parallel (used for the hint).
+AI_EXPECTED_CONCURRENCY = int(os.getenv("INFERENCE_MAX_CONCURRENT", 2))
+# Last completed live-frame result kept per session, for frames turned away.
+LIVE_LATEST_RESULTS = int(os.getenv("LIVE_LATEST_RESULTS", 256))
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class AdmissionGate:
+    """Tracks admitted requests per class and rejects when over threshold.
+
+    try_admit() checks and reserves a slot in one step; the caller gives
+    it back with release() when the request is done.
+    """
+
+    def __init__(self, threshold=AI_QUEUE_BUSY_THRESHOLD, limits=None):
+        self.threshold = threshold
+        self.limits = dict(limits or CLASS_LIMITS)
+        self._lock = threading.Lock()
+        self._outstanding = {}
+        self._latency_ewma = 1.0
+        self._rejected = {}
+
+    def _total(self):
+        return sum(self._outstanding.values())
+
+    def retry_after_ms(self):
+        # Time for the current backlog to drain at the AI service's pace.
+        waves = max(1, math.ceil(self._total() / max(1, AI_EXPECTED_CONCURRENCY)))
+        return int(self._latency_ewma * waves * 1000)
+
+    def try_admit(self, cls):
+        """(True, 0) with a slot reserved, or (False, retry_after_ms)."""
+        with self._lock:
+            over_global = self._total() >= self.threshold
+            over_class = self._outstanding.get(cls, 0) >= self.limits.get(cls, self.threshold)
+            if over_global or over_class:
+                self._rejected[cls] = self._rejected.get(cls, 0) + 1
+                return False, self.retry_after_ms()
+            self._outstanding[cls] = self._outstanding.get(cls, 0) + 1
+            return True, 0
+
+    def release(self, cls):
+        with self._lock:
+            self._outstanding[cls] = max(0, self._outstanding.get(cls, 0) - 1)
+
+    @contextmanager
+    def track(self, cls):
+        """Time one AI call for the retry hint (the slot is held by try_admit)."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self._latency_ewma += LATENCY_EWMA_ALPHA * (elapsed - self._latency_ewma)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "outstanding": dict(self._outstanding),
+                "rejected": dict(self._rejected),
+                "latency_ewma_ms": round(self._latency_ewma * 1000, 1),
+                "retry_after_ms": self.retry_after_ms(),
+            }
+
+
+class FrameCoalescer:
+    """At most one in-flight frame per session; others are turned away at once.
+
+    A frame arriving while its session's previous one is still with the AI
+    service is rejected immediately, so no worker thread waits on it; the
+    caller answers with the last completed result (latest()).
+    """
+
+    def __init__(self, max_sessions=LIVE_LATEST_RESULTS):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._latest = OrderedDict()
+        self._superseded = 0
+
+    def enter(self, key):
+        """True if this frame may go to the AI service (the caller must leave())."""
+        with self._lock:
+            if key in self._in_flight:
+                self._superseded += 1
+                return False
+            self._in_flight.add(key)
+            return True
+
+    def leave(self, key, result=None):
+        with self._lock:
+            self._in_flight.discard(key)
+            if result is not None:
+                self._latest[key] = result
+                self._latest.move_to_end(key)
+                while len(self._latest) > self.max_sessions:
+                    self._latest.popitem(last=False)
+
+    def latest(self, key):
+        with self._lock:
+            return self._latest.get(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_sessions": len(self._in_flight),
+                "superseded": self._superseded,
+            }
+
+
+ai_gate = AdmissionGate()
+live_frames = FrameCoalescer()
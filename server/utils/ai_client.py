@@ -0,0 +1,253 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import local_transport
+from utils.local_transport import UnixSocketAdapter, uds_available
+
+# CONFIGURATION
+AI_BASE_URL = os.getenv("HF_AI_URL", "http://127.0.0.1:7860")
+# One pooled connection per server thread so calls never wait on the pool.
+AI_POOL_SIZE = int(os.getenv("AI_POOL_SIZE", os.getenv("GUNICORN_THREADS", 10)))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", 2))
+AI_RETRY_BACKOFF = float(os.getenv("AI_RETRY_BACKOFF", 0.2))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("AI_BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("AI_BREAKER_RESET_SECONDS", 15))
+LATENCY_WINDOW = 200
+# While the Unix socket is down (or absent at startup), look for it again this often.
+AI_UDS_RECHECK_SECONDS = float(os.getenv("AI_UDS_RECHECK_SECONDS", 30))
+
+# Upstream statuses worth retrying. 504 is deliberately absent: the AI
+# service uses it for "your deadline passed", which a retry can't fix.
+RETRYABLE_STATUS = {502, 503}
+
+
+class AIClientError(Exception):
+    pass
+
+
+class AIServiceUnavailable(AIClientError):
+    """Raised without touching the network while the circuit is open."""
+
+
+class LocalTransportLost(AIClientError):
+    """The Unix socket is gone for a body only it can carry (shared-memory
+    handles); the caller re-sends the data inline."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._probe_thread = None
+        self.open_count = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.time() - self._opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probe_in_flight:
+                # Let exactly one probe through to test recovery.
+                self._probe_in_flight = True
+                self._probe_thread = threading.get_ident()
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """End this thread's probe without a verdict (it raised something unexpected)."""
+        with self._lock:
+            if self._probe_in_flight and self._probe_thread == threading.get_ident():
+                self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probe_in_flight:
+                    self.open_count += 1
+                self._opened_at = time.time()
+            self._probe_in_flight = False
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        n = len(ordered)
+
+        def pct(p):
+            return round(ordered[min(n - 1, int(p * n))] * 1000, 1) if n else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(sum(ordered) / n * 1000, 1) if n else None,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+        }
+
+
+class AIClient:
+    """Shared keep-alive client for every backend→AI service call."""
+
+    def __init__(self, base_url=AI_BASE_URL, pool_size=AI_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Same-host deployments talk over the AI service's Unix socket.
+        if local_transport.AI_UDS_PATH:
+            self.session.mount("http+unix://", UnixSocketAdapter(local_transport.AI_UDS_PATH, pool_size))
+        self._local = uds_available(self.base_url)
+        self._local_checked = time.time()
+        if self._local:
+            print(f"AI client using Unix socket {local_transport.AI_UDS_PATH}", flush=True)
+
+        self.breaker = CircuitBreaker()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    def _endpoint(self, path):
+        with self._stats_lock:
+            return self._stats.setdefault(path, _EndpointStats())
+
+    @property
+    def local(self):
+        """True while calls go over the Unix socket; re-probed every
+        AI_UDS_RECHECK_SECONDS while it is down."""
+        if not self._local and time.time() - self._local_checked >= AI_UDS_RECHECK_SECONDS:
+            self._local_checked = time.time()
+            self._local = uds_available(self.base_url)
+            if self._local:
+                print(f"AI Unix socket {local_transport.AI_UDS_PATH} is back", flush=True)
+        return self._local
+
+    def _send(self, method, path, timeout, local_only=False, **kwargs):
+        if self.local:
+            try:
+                return self.session.request(method, f"http+unix://ai{path}", timeout=timeout, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                if isinstance(e, requests.exceptions.Timeout):
+                    raise
+                # Socket gone (AI service moved or restarted without it).
+                print(f"AI Unix socket unavailable, falling back to HTTP: {e}", flush=True)
+                self._local = False
+                self._local_checked = time.time()
+                if local_only:
+                    raise LocalTransportLost(f"AI Unix socket unavailable ({path})") from e
+        elif local_only:
+            raise LocalTransportLost(f"AI Unix socket unavailable ({path})")
+        return self.session.request(method, f"{self.base_url}{path}", timeout=timeout, **kwargs)
+
+    def request(self, method, path, timeout, idempotent=False, budget_header=None, local_only=False, **kwargs):
+        """budget_header: name of a header set, on every attempt, to the
+        milliseconds left of `timeout` (the AI service's deadline).
+        local_only: the body only makes sense over the Unix socket; raise
+        LocalTransportLost instead of re-sending it over TCP."""
+        stats = self._endpoint(path)
+        deadline = time.time() + timeout
+        attempts = 1 + (AI_MAX_RETRIES if idempotent else 0)
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise AIServiceUnavailable(f"AI service circuit open ({path})")
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise requests.exceptions.Timeout(f"Budget exhausted before calling {path}")
+
+            if budget_header:
+                kwargs["headers"] = {**(kwargs.get("headers") or {}), budget_header: str(int(remaining * 1000))}
+
+            start = time.time()
+            try:
+                res = self._send(method, path, remaining, local_only, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.breaker.record_failure()
+                with self._stats_lock:
+                    stats.calls += 1
+                    stats.errors += 1
+                if attempt + 1 >= attempts:
+                    raise
+            else:
+                elapsed = time.time() - start
+                failed = res.status_code >= 500 and res.status_code != 504
+                if failed:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                with self._stats_lock:
+                    stats.calls += 1
+                    stats.samples.append(elapsed)
+                    if failed:
+                        stats.errors += 1
+                if res.status_code not in RETRYABLE_STATUS or attempt + 1 >= attempts:
+                    return res
+            finally:
+                # Anything else raised leaves no verdict; never strand the probe.
+                self.breaker.release_probe()
+
+            # Exponential backoff with full jitter, never past the deadline.
+            with self._stats_lock:
+                stats.retries += 1
+            backoff = random.uniform(0, AI_RETRY_BACKOFF * (2 ** attempt))
+            time.sleep(max(0.0, min(backoff, deadline - time.time())))
+
+    def post(self, path, payload, timeout, headers=None, idempotent=False, budget_header=None, local_only=False):
+        return self.request("POST", path, timeout, idempotent=idempotent, budget_header=budget_header,
+                            local_only=local_only, json=payload, headers=headers)
+
+    def get(self, path, timeout, headers=None):
+        return self.request("GET", path, timeout, idempotent=True, headers=headers)
+
+    def stats(self):
+        with self._stats_lock:
+            endpoints = {path: s.summary() for path, s in self._stats.items()}
+        return {
+            "base_url": self.base_url,
+            "pool_size": AI_POOL_SIZE,
+            "local_transport": {"active": self.local, **local_transport.stats()},
+            "breaker": {
+                "state": self.breaker.state,
+                "open_count": self.breaker.open_count,
+                "short_circuited": self.breaker.short_circuited,
+            },
+            "endpoints": endpoints,
+        }
+
+
+ai_client = AIClient()
@@ -0,0 +1,160 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from config.db_config import db
+from utils.db_indexes import apply_indexes
+from utils.attendance_events import (
+    attendance_events_archive,
+    attendance_events_collection,
+    attendance_logs_archive,
+    attendance_logs_collection,
+)
+from utils.attendance_stats import apply_stat_changes, attendance_stats_archive, attendance_stats_collection
+from utils.attendance_rollups import attendance_daily_archive, attendance_daily_collection, finalize_pending_days
+from utils.jobs import FINISHED, get_job, submit_job
+
+# CONFIGURATION
+# Hot/cold split by semester. When a semester is deactivated, its
+# sessions, their events and its daily buckets move in bulk to the
+# *_archive collections (same documents plus archived_at), and the
+# events' counters move to attendance_stats_archive. The hot collections
+# then hold roughly one semester. Reads opt back in with
+# ?include_archived=true.
+ARCHIVE_ON_DEACTIVATE = os.getenv("ATTENDANCE_ARCHIVE_ON_DEACTIVATE", "true").lower() == "true"
+ARCHIVE_BATCH_SIZE = int(os.getenv("ATTENDANCE_ARCHIVE_BATCH_SIZE", 200))   # sessions per batch
+
+archive_runs_collection = db["attendance_archives"]   # {_id: "<school_year>:<semester>", status, counts}
+ARCHIVE_COLLECTIONS = [
+    attendance_logs_archive.name, attendance_events_archive.name,
+    attendance_daily_archive.name, attendance_stats_archive.name,
+]
+
+
+def _run_id(semester, school_year):
+    return f"{school_year}:{semester}"
+
+
+def _move(source, target, ids, now):
+    """Copy `ids` into target (replacing copies left by an interrupted run), then delete them."""
+    if not ids:
+        return 0
+    source.aggregate([
+        {"$match": {"_id": {"$in": ids}}},
+        {"$addFields": {"archived_at": now}},
+        {"$merge": {"into": target.name, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ])
+    return source.delete_many({"_id": {"$in": ids}}).deleted_count
+
+
+def _move_events(session_ids, now):
+    events = list(attendance_events_collection.find(
+        {"session_id": {"$in": session_ids}}, {"class_id": 1, "student_id": 1, "status": 1}
+    ))
+    moved = _move(attendance_events_collection, attendance_events_archive, [e["_id"] for e in events], now)
+    changes = [(e.get("class_id"), e.get("student_id"), e.get("status")) for e in events]
+    apply_stat_changes([(*c, -1) for c in changes])
+    apply_stat_changes([(*c, 1) for c in changes], collection=attendance_stats_archive)
+    return moved
+
+
+def archive_semester(semester, school_year, batch_size=ARCHIVE_BATCH_SIZE, job=None):
+    """Move one semester's sessions, events, daily buckets and counters to the archive.
+
+    Works a batch of sessions at a time, events before their session, so
+    an interrupted (or cancelled) run is finished by running it again. A crash between a
+    batch's delete and its counter update leaves the hot counters off;
+    scripts/rebuild_attendance_stats.py repairs them.
+    """
+    apply_indexes(ARCHIVE_COLLECTIONS)
+    run_id = _run_id(semester, school_year)
+    now = datetime.now(timezone.utc)
+    archive_runs_collection.update_one(
+        {"_id": run_id},
+        {"$set": {"semester": semester, "school_year": school_year, "status": "running", "started_at": now},
+         "$unset": {"error": ""}},
+        upsert=True,
+    )
+
+    match = {"semester": semester, "school_year": school_year}
+    counts = {"sessions": 0, "events": 0, "daily": 0}
+    try:
+        # Trends read archived days from their buckets only, so every day
+        # of the semester needs one before its events move.
+        finalize_pending_days(attendance_events_collection.distinct("date", match))
+        while True:
+            ids = [d["_id"] for d in attendance_logs_collection.find(match, {"_id": 1}).limit(batch_size)]
+            if not ids:
+                break
+            counts["events"] += _move_events([str(i) for i in ids], now)
+            counts["sessions"] += _move(attendance_logs_collection, attendance_logs_archive, ids, now)
+            print(f"Archiving {run_id}: {counts}", flush=True)
+            if job:
+                job.progress(counts["sessions"], message=f"{counts['events']} events archived")
+
+        daily_ids = [d["_id"] for d in attendance_daily_collection.find(match, {"_id": 1})]
+        counts["daily"] = _move(attendance_daily_collection, attendance_daily_archive, daily_ids, now)
+        attendance_stats_collection.delete_many({"total": {"$lte": 0}})   # emptied counters
+    except Exception as e:
+        archive_runs_collection.update_one({"_id": run_id}, {"$set": {"status": "failed", "error": str(e), "counts": counts}})
+        raise
+
+    archive_runs_collection.update_one(
+        {"_id": run_id},
+        {"$set": {"status": "done", "counts": counts, "finished_at": datetime.now(timezone.utc)}},
+    )
+    print(f"Archived {run_id}: {counts}", flush=True)
+    return counts
+
+
+def _release_dead_run(run):
+    """Mark a queued/running run failed when its job is finished or gone (e.g. failed as stale)."""
+    if run.get("status") not in ("queued", "running"):
+        return run
+    job = get_job(run["job_id"]) if run.get("job_id") else None
+    if job and job.get("status") not in FINISHED:
+        return run
+    match = {"_id": run["_id"], "status": run["status"]}
+    if not job:
+        # A run claimed moments ago may not have recorded its job id yet.
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=1)
+        match["$or"] = [{"queued_at": {"$lt": cutoff}}, {"queued_at": {"$exists": False}}]
+    error = (job or {}).get("error") or "Archive job stopped before the run finished"
+    if not archive_runs_collection.update_one(match, {"$set": {"status": "failed", "error": error}}).modified_count:
+        return run
+    return {**run, "status": "failed", "error": error}
+
+
+def archive_runs():
+    return [_release_dead_run(run) for run in archive_runs_collection.find({}).sort("started_at", -1)]
+
+
+def _archive_job(job, semester, school_year):
+    return archive_semester(semester, school_year, job=job)
+
+
+def start_semester_archive(semester, school_year, created_by):
+    """Archive a semester as a background job; its job id, or None when disabled, missing or already running."""
+    if not ARCHIVE_ON_DEACTIVATE or not semester or not school_year:
+        return None
+    run_id = _run_id(semester, school_year)
+    run = archive_runs_collection.find_one({"_id": run_id})
+    if run:
+        _release_dead_run(run)
+    try:
+        # Claim: fails with a duplicate key while another run is in progress.
+        archive_runs_collection.update_one(
+            {"_id": run_id, "status": {"$nin": ["queued", "running"]}},
+            {"$set": {"semester": semester, "school_year": school_year, "status": "queued",
+                      "queued_at": datetime.now(timezone.utc)},
+             "$unset": {"job_id": ""}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return None
+
+    job_id = submit_job("archive_semester", _archive_job, semester, school_year,
+                        params={"semester": semester, "school_year": school_year}, created_by=created_by)
+    archive_runs_collection.update_one({"_id": run_id}, {"$set": {"job_id": job_id}})
+    return job_id
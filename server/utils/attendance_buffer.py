@@ -0,0 +1,305 @@
+import os
+import glob
+import fcntl
+import atexit
+import threading
+import time
+
+from bson import ObjectId, json_util
+from pymongo import ReturnDocument, UpdateOne
+
+from config.db_config import db
+from utils.attendance_events import event_ops, sighting_ops, write_event_ops
+from utils.programs import program_key
+
+# CONFIGURATION
+# Write-behind for attendance entries: requests append to an in-process
+# buffer (and an append-only journal), a background thread flushes every
+# ATTENDANCE_FLUSH_MS or ATTENDANCE_FLUSH_EVENTS events as one bulk upsert
+# into attendance_events.
+# ATTENDANCE_WRITE_BEHIND=false writes through synchronously (same ops).
+ATTENDANCE_WRITE_BEHIND = os.getenv("ATTENDANCE_WRITE_BEHIND", "true").lower() == "true"
+ATTENDANCE_FLUSH_MS = int(os.getenv("ATTENDANCE_FLUSH_MS", 500))
+ATTENDANCE_FLUSH_EVENTS = int(os.getenv("ATTENDANCE_FLUSH_EVENTS", 200))
+ATTENDANCE_JOURNAL_DIR = os.getenv(
+    "ATTENDANCE_JOURNAL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "attendance-journal"),
+)
+# fsync each append: survives a host crash, not just a worker crash.
+ATTENDANCE_JOURNAL_FSYNC = os.getenv("ATTENDANCE_JOURNAL_FSYNC", "true").lower() == "true"
+
+attendance_logs_collection = db["attendance_logs"]
+
+# Event kinds:
+#   session  {"log", "entry"}                    live session; log = session header
+#   daily    {"class", "date", "entry"}          /api/attendance/log, by (class_id, date)
+
+
+def _daily_log(event):
+    """Find or create the (class_id, date) session header a daily entry belongs to."""
+    cls, date_val, entry = event["class"], event["date"], event["entry"]
+    return attendance_logs_collection.find_one_and_update(
+        {"class_id": cls["class_id"], "date": date_val},
+        {"$setOnInsert": {
+            "class_id": cls["class_id"],
+            "subject_code": cls.get("subject_code"),
+            "subject_title": cls.get("subject_title"),
+            "instructor_id": cls.get("instructor_id"),
+            "instructor_first_name": cls.get("instructor_first_name"),
+            "instructor_last_name": cls.get("instructor_last_name"),
+            "course": cls.get("course"),
+            "program_key": program_key(cls.get("course")),
+            "section": cls.get("section"),
+            "school_year": cls.get("school_year"),
+            "semester": cls.get("semester"),
+            "date": date_val,
+            "students": [],
+            "start_time": entry["time"],
+            "end_time": None,
+        }},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _same_file(f, path):
+    """True if `path` still names the file open as `f` (not a journal swapped in since)."""
+    try:
+        return os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+    except OSError:
+        return False
+
+
+def _event_key(event):
+    """Events with the same key coalesce: one per student per log."""
+    if event["kind"] == "session":
+        return ("session", event["log"]["_id"], event["entry"]["student_id"])
+    return ("daily", event["class"]["class_id"], event["date"], event["entry"]["student_id"])
+
+
+class AttendanceBuffer:
+    def __init__(self, journal_dir=ATTENDANCE_JOURNAL_DIR):
+        self.journal_dir = journal_dir
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = {}          # event key -> event, insertion ordered
+        self._journal = None
+        self._pid = None
+        self.events = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.replayed = 0
+        self.last_flush_ms = None
+
+    # Journal
+    def _journal_path(self):
+        return os.path.join(self.journal_dir, f"attendance-{os.getpid()}.jsonl")
+
+    def _open_journal(self, events=()):
+        # Lock under a temporary name, then rename into place, so no other
+        # worker can mistake a fresh journal for an orphan. The lock is held
+        # for the life of the worker; a journal nobody holds is orphaned.
+        # `events` are written before the rename, so the swap is atomic.
+        path = self._journal_path()
+        f = open(f"{path}.tmp", "a+b")
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        f.truncate(0)
+        self._append(events, f)
+        os.replace(f"{path}.tmp", path)
+        return f
+
+    def _append(self, events, f=None):
+        f = f or self._journal
+        data = b"".join(json_util.dumps(e).encode() + b"\n" for e in events)
+        if not data:
+            return
+        f.write(data)
+        f.flush()
+        if ATTENDANCE_JOURNAL_FSYNC:
+            os.fsync(f.fileno())
+
+    def _compact_journal(self):
+        """Swap in a journal holding only what is still pending (caller holds _lock)."""
+        old, self._journal = self._journal, self._open_journal(list(self._pending.values()))
+        old.close()
+
+    def replay_orphans(self):
+        """Flush journals left by workers that died before flushing."""
+        for path in glob.glob(os.path.join(self.journal_dir, "attendance-*.jsonl")):
+            try:
+                f = open(path, "r+b")
+            except OSError:
+                continue
+            with f:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue            # owner still alive
+                if not _same_file(f, path):
+                    continue            # owner compacted it; we locked the old file
+                events = []
+                for line in f:
+                    try:
+                        events.append(json_util.loads(line))
+                    except ValueError:
+                        break           # torn last line from the crash
+                if events:
+                    self._write(events, replay=True)
+                    self.replayed += len(events)
+                    print(f"Attendance journal replayed: {len(events)} event(s) from {os.path.basename(path)}")
+                if _same_file(f, path):
+                    os.remove(path)
+
+    # Buffer
+    def start(self):
+        """Open this worker's journal, replay orphans and start the flusher."""
+        if self._pid == os.getpid():
+            return self
+        os.makedirs(self.journal_dir, exist_ok=True)
+        # Before opening our own: a dead worker may have had this pid.
+        try:
+            self.replay_orphans()
+        except Exception as e:
+            print(f"Attendance journal replay failed: {e}")
+            # Keep an unreplayed journal of ours out of the way for next start.
+            own = self._journal_path()
+            if os.path.exists(own):
+                os.replace(own, own.replace(".jsonl", f"-{int(time.time())}.jsonl"))
+        with self._lock:
+            self._journal = self._open_journal()
+            self._pending = {}
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name="attendance-flush", daemon=True).start()
+        atexit.register(self.flush)
+        return self
+
+    def add(self, *events):
+        if not events:
+            return
+        if not ATTENDANCE_WRITE_BEHIND or self._pid != os.getpid():
+            self._write(list(events))
+            return
+
+        with self._lock:
+            self._append(events)
+            for e in events:
+                key = _event_key(e)
+                if key in self._pending:
+                    self.coalesced += 1
+                    if e["kind"] == "session":
+                        continue        # keep the first sighting
+                self._pending[key] = e
+            self.events += len(events)
+            full = len(self._pending) >= ATTENDANCE_FLUSH_EVENTS
+        if full:
+            self._wake.set()
+
+    def add_session_entries(self, log, entries):
+        """`log` is the session header: {"_id", "class_id", "date", ...}."""
+        log = {**log, "_id": str(log["_id"])}
+        self.add(*[{"kind": "session", "log": log, "entry": e} for e in entries])
+
+    def add_daily_entry(self, class_data, date_val, entry):
+        self.add({"kind": "daily", "class": class_data, "date": date_val, "entry": entry})
+
+    def is_pending_daily(self, student_id, class_id, date_val):
+        """True if this worker holds an unflushed daily entry for the student."""
+        with self._lock:
+            return ("daily", class_id, date_val, student_id) in self._pending
+
+    def _write(self, events, replay=False):
+        """Write events; on replay, daily entries are first-wins too, so a
+        journal replayed late cannot revert later edits (Excused)."""
+        ops, end_times, daily_logs = [], {}, {}
+        for e in events:
+            entry = e["entry"]
+            if e["kind"] == "session":
+                log = e["log"]
+                # First sighting wins; replays are no-ops.
+                ops.extend(sighting_ops(log, entry))
+            else:
+                key = (e["class"]["class_id"], e["date"])
+                if key not in daily_logs:
+                    daily_logs[key] = _daily_log(e)
+                log = daily_logs[key]
+                ops.extend(event_ops(log, [entry], overwrite=not replay))
+            log_id = str(log["_id"])
+            end_times[log_id] = max(end_times.get(log_id, ""), entry["time"])
+
+        write_event_ops(ops)
+        if end_times:
+            attendance_logs_collection.bulk_write([
+                UpdateOne({"_id": ObjectId(log_id)}, {"$max": {"end_time": t}})
+                for log_id, t in end_times.items()
+            ], ordered=False)
+
+    def flush(self):
+        """Write everything pending now (stop-session, shutdown)."""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.values())
+                self._pending = {}
+            if not batch:
+                return 0
+
+            start = time.time()
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.flush_errors += 1
+                print(f"Attendance flush failed ({len(batch)} event(s)), will retry: {e}")
+                with self._lock:
+                    # Put the batch back in front; newer sightings keep their slot.
+                    restored = {_event_key(ev): ev for ev in batch}
+                    for key, ev in self._pending.items():
+                        restored.setdefault(key, ev)
+                    self._pending = restored
+                return 0
+
+            self.flushes += 1
+            self.last_flush_ms = round((time.time() - start) * 1000, 1)
+            with self._lock:
+                # The batch is in Mongo now; the journal keeps only newer events.
+                if self._journal is not None:
+                    try:
+                        self._compact_journal()
+                    except OSError as e:
+                        print(f"Attendance journal compaction failed: {e}")
+            return len(batch)
+
+    def _run(self):
+        while True:
+            self._wake.wait(ATTENDANCE_FLUSH_MS / 1000.0)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Attendance flusher error: {e}")
+
+    def stats(self):
+        return {
+            "write_behind": ATTENDANCE_WRITE_BEHIND,
+            "pending": len(self._pending),
+            "events": self.events,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "replayed": self.replayed,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+attendance_buffer = AttendanceBuffer()
+
+
+def start_attendance_buffer():
+    if not ATTENDANCE_WRITE_BEHIND:
+        return None
+    try:
+        return attendance_buffer.start()
+    except Exception as e:
+        # No journal, no write-behind: add() falls back to writing through.
+        print(f"Attendance write-behind disabled: {e}")
+        return None
@@ -0,0 +1,331 @@
+from collections import defaultdict
+from itertools import chain
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from config.db_config import db
+from utils.db_indexes import apply_indexes
+from utils.attendance_stats import apply_stat_changes
+from utils.attendance_rollups import mark_days_dirty
+from utils.programs import program_key
+
+# CONFIGURATION
+# One document per (session, student) instead of an ever-growing `students`
+# array inside each attendance_logs document. attendance_logs keeps the
+# session header (class, date, start/end time); reports query events.
+# Past semesters live in the *_archive twins (utils/attendance_archive.py);
+# archived documents carry archived_at.
+attendance_events_collection = db["attendance_events"]
+attendance_logs_collection = db["attendance_logs"]
+attendance_events_archive = db["attendance_events_archive"]
+attendance_logs_archive = db["attendance_logs_archive"]
+
+# Session fields copied onto every event so reports filter without a join.
+HEADER_FIELDS = (
+    "class_id", "date", "instructor_id", "subject_code", "subject_title",
+    "course", "section", "semester", "school_year",
+)
+# What a session-shaped response shows per student.
+ENTRY_PROJECTION = {
+    "_id": 0, "session_id": 1, "student_id": 1, "first_name": 1, "last_name": 1,
+    "status": 1, "time": 1, "time_logged": 1,
+    "excuse_reason": 1, "updated_by": 1, "updated_at": 1,
+}
+DUPLICATE_KEY = 11000
+
+
+def _header(log):
+    return {**{f: log.get(f) for f in HEADER_FIELDS}, "program_key": program_key(log.get("course"))}
+
+
+# An op is {"filter", "update", "upsert", "session_id", "student_id",
+# "class_id", "status", "mode"}; mode says how it can change a stored
+# status, so write_event_ops can keep attendance_stats in step:
+#   first      only by inserting
+#   overwrite  always
+#   absent     only an existing Absent
+def _op(log, student_id, status, mode, filter, update, upsert=True):
+    return {
+        "filter": filter, "update": update, "upsert": upsert,
+        "session_id": str(log["_id"]), "student_id": student_id,
+        "class_id": log.get("class_id"), "date": log.get("date"), "status": status, "mode": mode,
+    }
+
+
+def event_ops(log, entries, overwrite=False):
+    """Upserts for `entries` in session `log`.
+
+    overwrite=False: first write wins (live sightings, auto-absent).
+    overwrite=True: the entry replaces whatever is stored (manual edits).
+    """
+    session_id = str(log["_id"])
+    header = _header(log)
+    ops = []
+    for entry in entries:
+        key = {"session_id": session_id, "student_id": entry["student_id"]}
+        fields = {k: v for k, v in entry.items() if k != "student_id"}
+        if overwrite:
+            update = {"$set": fields, "$setOnInsert": header}
+        else:
+            update = {"$setOnInsert": {**header, **fields}}
+        ops.append(_op(log, entry["student_id"], entry.get("status"),
+                       "overwrite" if overwrite else "first", key, update))
+    return ops
+
+
+def sighting_ops(log, entry):
+    """A live sighting: first wins, but it replaces an auto-marked Absent."""
+    fields = {k: v for k, v in entry.items() if k != "student_id"}
+    return event_ops(log, [entry]) + [_op(
+        log, entry["student_id"], entry.get("status"), "absent",
+        {"session_id": str(log["_id"]), "student_id": entry["student_id"], "status": "Absent"},
+        {"$set": fields}, upsert=False,
+    )]
+
+
+def _stored_absent(ops):
+    """Keys of `absent` ops whose event is currently Absent (the only ones that can change)."""
+    wanted = defaultdict(set)
+    for o in ops:
+        wanted[o["session_id"]].add(o["student_id"])
+    if not wanted:
+        return set()
+    cursor = attendance_events_collection.find(
+        {"status": "Absent",
+         "$or": [{"session_id": s, "student_id": {"$in": list(ids)}} for s, ids in wanted.items()]},
+        {"_id": 0, "session_id": 1, "student_id": 1},
+    )
+    return {(e["session_id"], e["student_id"]) for e in cursor}
+
+
+def _write_first(ops):
+    """Bulk upsert of first-wins ops; (class_id, student_id, status, +1) per actual insert.
+
+    Concurrent inserts of the same key are retried once; they then match
+    the racing insert and count nothing.
+    """
+    if not ops:
+        return []
+    requests = [UpdateOne(o["filter"], o["update"], upsert=o["upsert"]) for o in ops]
+    try:
+        inserted = set(attendance_events_collection.bulk_write(requests, ordered=False).upserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != DUPLICATE_KEY for err in errors):
+            raise
+        inserted = {u["index"] for u in e.details.get("upserted", [])}
+        attendance_events_collection.bulk_write([requests[err["index"]] for err in errors], ordered=False)
+    return [(ops[i]["class_id"], ops[i]["student_id"], ops[i]["status"], 1) for i in sorted(inserted)]
+
+
+def _write_one(o):
+    """Apply one overwrite / absent op atomically; its counter changes from the stored status it replaced."""
+    kwargs = {"projection": {"_id": 0, "status": 1}, "upsert": o["upsert"],
+              "return_document": ReturnDocument.BEFORE}
+    try:
+        before = attendance_events_collection.find_one_and_update(o["filter"], o["update"], **kwargs)
+    except DuplicateKeyError:
+        # A racing upsert inserted the event first; now the filter matches it.
+        before = attendance_events_collection.find_one_and_update(o["filter"], o["update"], **kwargs)
+
+    after = o["status"]
+    if before is None:
+        # No match: an upsert inserted, an absent op changed nothing.
+        return [(o["class_id"], o["student_id"], after, 1)] if o["upsert"] else []
+    if before.get("status") == after:
+        return []
+    return [(o["class_id"], o["student_id"], before.get("status"), -1),
+            (o["class_id"], o["student_id"], after, 1)]
+
+
+def write_event_ops(ops):
+    """Write event ops, then the matching attendance_stats $inc.
+
+    First-wins ops go out as one unordered bulk upsert and count only the
+    upserts that inserted. Overwrite and absent ops each run as one
+    find_one_and_update and count from the document they replaced, so
+    replays and racing workers never double count. Absent ops are only
+    sent for events that were Absent when read; the update re-checks it.
+    """
+    if not ops:
+        return
+    first = [o for o in ops if o["mode"] == "first"]
+    overwrite = [o for o in ops if o["mode"] == "overwrite"]
+    absent = [o for o in ops if o["mode"] == "absent"]
+
+    changes = _write_first(first)
+    for o in overwrite:
+        changes.extend(_write_one(o))
+    if absent:
+        candidates = _stored_absent(absent)
+        for o in absent:
+            if (o["session_id"], o["student_id"]) in candidates:
+                changes.extend(_write_one(o))
+
+    _after_write(changes, [o["date"] for o in ops])
+
+
+def _after_write(changes, dates):
+    """Stats $inc and rollup dirty flags for events already written.
+
+    Each gets its own try: a failed stats update must not leave finalized
+    days un-flagged, and neither is worth failing the write over (a retry
+    would not count the events again).
+    """
+    try:
+        apply_stat_changes(changes)
+    except Exception as e:
+        print(f"Attendance stats not updated, rebuild to reconcile: {e}")
+    try:
+        mark_days_dirty(dates)
+    except Exception as e:
+        print(f"Rollup days {sorted({d for d in dates if d})} not marked dirty, refinalize them: {e}")
+
+
+def record_events(log, entries, overwrite=False):
+    write_event_ops(event_ops(log, entries, overwrite))
+
+
+def update_events(query, fields):
+    """$set `fields` on every matching event (status edits); returns the match count."""
+    before = list(attendance_events_collection.find(query, {"class_id": 1, "student_id": 1, "date": 1, "status": 1}))
+    if not before:
+        return 0
+    attendance_events_collection.update_many({"_id": {"$in": [e["_id"] for e in before]}}, {"$set": fields})
+    status = fields.get("status")
+    if status:
+        _after_write([
+            change
+            for e in before if e.get("status") != status
+            for change in ((e.get("class_id"), e["student_id"], e.get("status"), -1),
+                           (e.get("class_id"), e["student_id"], status, 1))
+        ], [e.get("date") for e in before])
+    return len(before)
+
+
+def session_statuses(session_id, student_ids):
+    """{student_id: status} for these students in one session."""
+    student_ids = list(student_ids)
+    if not student_ids:
+        return {}
+    cursor = attendance_events_collection.find(
+        {"session_id": str(session_id), "student_id": {"$in": student_ids}},
+        {"_id": 0, "student_id": 1, "status": 1},
+    )
+    return {e["student_id"]: e["status"] for e in cursor}
+
+
+# Compatibility: session-shaped responses
+def hydrate_sessions(logs):
+    """Fill each log's `students` from its events, keeping the legacy
+    embedded entries of students that have no event (unmigrated logs)."""
+    logs = list(logs)
+    if not logs:
+        return logs
+
+    by_session = defaultdict(dict)
+    for collection, archived in ((attendance_events_collection, False), (attendance_events_archive, True)):
+        session_ids = [str(log["_id"]) for log in logs if bool(log.get("archived_at")) == archived]
+        if not session_ids:
+            continue
+        cursor = collection.find(
+            {"session_id": {"$in": session_ids}}, ENTRY_PROJECTION,
+        ).sort("time", ASCENDING)
+        for event in cursor:
+            by_session[event.pop("session_id")][event["student_id"]] = event
+
+    for log in logs:
+        merged = {s.get("student_id"): s for s in log.get("students") or []}
+        merged.update(by_session.get(str(log["_id"]), {}))
+        log["students"] = list(merged.values())
+    return logs
+
+
+def iter_sessions(cursor, batch_size=200):
+    """hydrate_sessions over a cursor, one batch of logs at a time."""
+    batch = []
+    for log in cursor:
+        batch.append(log)
+        if len(batch) >= batch_size:
+            yield from hydrate_sessions(batch)
+            batch = []
+    yield from hydrate_sessions(batch)
+
+
+def find_events(query, sort=(("date", ASCENDING), ("time", ASCENDING)), include_archived=False):
+    """Matching events in `sort` order; archived ones first when included
+    (an archived semester precedes the hot one)."""
+    cursor = attendance_events_collection.find(query, {"_id": 0}).sort(list(sort))
+    if not include_archived:
+        return cursor
+    return chain(attendance_events_archive.find(query, {"_id": 0}).sort(list(sort)), cursor)
+
+
+def status_counts(match):
+    """{"present", "late", "absent", "excused", "total"} over matching events."""
+    counts = {"present": 0, "late": 0, "absent": 0, "excused": 0, "total": 0}
+    for row in attendance_events_collection.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+    ]):
+        key = str(row["_id"] or "").lower()
+        if key in counts:
+            counts[key] = row["count"]
+        counts["total"] += row["count"]
+    return counts
+
+
+# Migration
+def events_report():
+    embedded = list(attendance_logs_collection.aggregate([
+        {"$match": {"students.0": {"$exists": True}}},
+        {"$group": {"_id": None, "logs": {"$sum": 1}, "entries": {"$sum": {"$size": "$students"}}}},
+    ]))
+    embedded = embedded[0] if embedded else {}
+    return {
+        "logs": attendance_logs_collection.estimated_document_count(),
+        "logs_with_embedded_entries": embedded.get("logs", 0),
+        "embedded_entries": embedded.get("entries", 0),
+        "events": attendance_events_collection.estimated_document_count(),
+    }
+
+
+def migrate_log_events(query):
+    """Copy the embedded `students` of the logs matching `query` into events (counted)."""
+    ops = []
+    for log in attendance_logs_collection.find(
+        {**query, "students.0": {"$exists": True}}, {**{f: 1 for f in HEADER_FIELDS}, "students": 1},
+    ):
+        ops.extend(event_ops(log, [s for s in log.get("students") or [] if s.get("student_id")]))
+    write_event_ops(ops)
+    return len(ops)
+
+
+def migrate_logs_to_events(batch_size=500):
+    """Copy embedded `students` entries of every log into attendance_events.
+
+    Idempotent ($setOnInsert on the unique key), so it can run while live
+    sessions write events and be re-run to pick up stragglers.
+    """
+    apply_indexes(["attendance_events"])
+    logs_seen = events_written = 0
+    ops = []
+    cursor = attendance_logs_collection.find(
+        {"students.0": {"$exists": True}},
+        {**{f: 1 for f in HEADER_FIELDS}, "students": 1},
+    ).sort("_id", DESCENDING).batch_size(batch_size)
+
+    for log in cursor:
+        logs_seen += 1
+        entries = [s for s in log.get("students") or [] if s.get("student_id")]
+        ops.extend(event_ops(log, entries))
+        if len(ops) >= batch_size:
+            write_event_ops(ops)
+            events_written += len(ops)
+            ops = []
+    write_event_ops(ops)
+    events_written += len(ops)
+
+    print(f"Attendance events migration: {logs_seen} log(s), {events_written} entr(ies) upserted", flush=True)
+    return {"logs": logs_seen, "entries": events_written}
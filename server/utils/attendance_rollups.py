@@ -0,0 +1,245 @@
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from config.db_config import db
+
+# CONFIGURATION
+# Per-day, per-class attendance buckets for the trend endpoints. A
+# background job finalizes every closed day into attendance_daily; today
+# (and any day the job hasn't reached yet) is aggregated live from
+# attendance_events. Edits to a finalized day mark it dirty and the next
+# run recomputes it.
+ATTENDANCE_ROLLUPS = os.getenv("ATTENDANCE_ROLLUPS", "true").lower() == "true"
+ROLLUP_INTERVAL_SECONDS = int(os.getenv("ATTENDANCE_ROLLUP_INTERVAL_SECONDS", 900))
+# Caps a first run over a long history; the next runs pick up the rest.
+ROLLUP_MAX_DAYS_PER_RUN = int(os.getenv("ATTENDANCE_ROLLUP_MAX_DAYS_PER_RUN", 120))
+
+PH_TZ = timezone(timedelta(hours=8))  # event dates are Philippine local days
+JOB_KEY = "__job__"
+GRANULARITIES = ("day", "week", "month")
+BUCKET_FIELDS = ("class_id", "instructor_id", "course", "program_key", "section", "semester", "school_year")
+COUNT_FIELDS = ("present", "late", "absent", "excused", "total")
+
+attendance_daily_collection = db["attendance_daily"]
+attendance_daily_archive = db["attendance_daily_archive"]   # archived semesters
+rollup_days_collection = db["attendance_rollup_days"]     # {_id: date, dirty} + JOB_KEY
+attendance_events_collection = db["attendance_events"]
+
+
+def _today():
+    return datetime.now(PH_TZ).strftime("%Y-%m-%d")
+
+
+def _day_counts():
+    return {
+        "present": {"$sum": {"$cond": [{"$eq": ["$status", "Present"]}, 1, 0]}},
+        "late": {"$sum": {"$cond": [{"$eq": ["$status", "Late"]}, 1, 0]}},
+        "absent": {"$sum": {"$cond": [{"$eq": ["$status", "Absent"]}, 1, 0]}},
+        "excused": {"$sum": {"$cond": [{"$eq": ["$status", "Excused"]}, 1, 0]}},
+        "total": {"$sum": 1},
+    }
+
+
+# Finalizing
+def finalize_day(date_val):
+    """Recompute every class bucket of one day from attendance_events."""
+    now = datetime.now(timezone.utc)
+    # Clear dirty first: an edit landing mid-run marks the day again.
+    rollup_days_collection.update_one(
+        {"_id": date_val}, {"$set": {"dirty": False, "finalized_at": now}}, upsert=True
+    )
+    attendance_events_collection.aggregate([
+        {"$match": {"date": date_val, "class_id": {"$type": "string"}}},
+        {"$group": {
+            "_id": {"$concat": ["$date", ":", "$class_id"]},
+            "date": {"$first": "$date"},
+            **{f: {"$first": f"${f}"} for f in BUCKET_FIELDS},
+            **_day_counts(),
+        }},
+        {"$addFields": {"finalized_at": now}},
+        {"$merge": {"into": attendance_daily_collection.name,
+                    "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ])
+    # Classes that no longer have any event that day.
+    attendance_daily_collection.delete_many({"date": date_val, "finalized_at": {"$lt": now}})
+
+
+def finalize_closed_days(today=None):
+    """Finalize days after the last finalized one up to yesterday, plus dirty days."""
+    today = today or _today()
+    job = rollup_days_collection.find_one({"_id": JOB_KEY}) or {}
+    through = job.get("finalized_through")
+    if through:
+        first = (datetime.strptime(through, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    else:
+        oldest = attendance_events_collection.find_one(
+            {"date": {"$type": "string"}}, {"date": 1}, sort=[("date", 1)]
+        )
+        first = oldest["date"] if oldest else today
+
+    days = []
+    day = datetime.strptime(first, "%Y-%m-%d")
+    while day.strftime("%Y-%m-%d") < today and len(days) < ROLLUP_MAX_DAYS_PER_RUN:
+        days.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(days=1)
+    dirty = [d["_id"] for d in rollup_days_collection.find({"dirty": True, "_id": {"$lt": first}}, {"_id": 1})]
+
+    for date_val in dirty + days:
+        finalize_day(date_val)
+    if days:
+        rollup_days_collection.update_one(
+            {"_id": JOB_KEY}, {"$set": {"finalized_through": days[-1]}}, upsert=True
+        )
+    return {"finalized": len(days), "refreshed": len(dirty)}
+
+
+def finalize_pending_days(dates):
+    """finalize_day for each of `dates` not finalized yet (or dirty); returns how many ran."""
+    dates = sorted({d for d in dates if d})
+    clean = {d["_id"] for d in rollup_days_collection.find(
+        {"_id": {"$in": dates}, "dirty": False, "finalized_at": {"$exists": True}}, {"_id": 1}
+    )}
+    pending = [d for d in dates if d not in clean]
+    for date_val in pending:
+        finalize_day(date_val)
+    return len(pending)
+
+
+def mark_days_dirty(dates):
+    """Flag finalized days whose events just changed (late edits, excuses)."""
+    today = _today()
+    past = sorted({d for d in dates if d and d < today})
+    if past:
+        rollup_days_collection.update_many(
+            {"_id": {"$in": past}, "finalized_at": {"$exists": True}}, {"$set": {"dirty": True}}
+        )
+
+
+# Reading
+def _period(date_val, granularity):
+    if granularity == "month":
+        return date_val[:7]
+    if granularity == "week":
+        day = datetime.strptime(date_val, "%Y-%m-%d")
+        return (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+    return date_val
+
+
+def trend_params(args):
+    """(start, end, granularity) from request args; ValueError when malformed."""
+    start, end = args.get("start"), args.get("end")
+    for value in (start, end):
+        if value:
+            datetime.strptime(value, "%Y-%m-%d")
+    if start and end and start > end:
+        raise ValueError("start must not be after end")
+    granularity = (args.get("granularity") or "day").lower()
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    return start or None, end or None, granularity
+
+
+def attendance_trend(match, start=None, end=None, granularity="day", include_archived=False):
+    """[{"date", "present", "late", "absent", "excused", "total"}], oldest first.
+
+    match filters on bucket fields (instructor_id, class_id, program_key, ...).
+    Weeks are keyed by their Monday, months by "YYYY-MM". Archived
+    semesters count only with include_archived.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    job = rollup_days_collection.find_one({"_id": JOB_KEY}, {"finalized_through": 1}) or {}
+    through = job.get("finalized_through")
+    days = defaultdict(Counter)
+
+    def add_buckets(collection, dates):
+        for row in collection.aggregate([
+            {"$match": {**match, "date": dates}},
+            {"$group": {"_id": "$date", **{f: {"$sum": f"${f}"} for f in COUNT_FIELDS}}},
+        ]):
+            days[row["_id"]].update({f: row.get(f, 0) for f in COUNT_FIELDS})
+
+    if include_archived:
+        archived = {"$type": "string"}
+        if start:
+            archived["$gte"] = start
+        if end:
+            archived["$lte"] = end
+        add_buckets(attendance_daily_archive, archived)
+
+    if through and (not start or start <= through):
+        rolled = {"$lte": min(end, through) if end else through}
+        if start:
+            rolled["$gte"] = start
+        add_buckets(attendance_daily_collection, rolled)
+
+    if not (through and end and end <= through):
+        live = {"$type": "string"}
+        if through:
+            live["$gt"] = through
+        if start:
+            live["$gte"] = start
+        if end:
+            live["$lte"] = end
+        for row in attendance_events_collection.aggregate([
+            {"$match": {**match, "date": live}},
+            {"$group": {"_id": "$date", **_day_counts()}},
+        ]):
+            days[row["_id"]].update({f: row.get(f, 0) for f in COUNT_FIELDS})
+
+    periods = defaultdict(Counter)
+    for date_val, counts in days.items():
+        periods[_period(date_val, granularity)].update(counts)
+    return [
+        {"date": period, **{f: periods[period].get(f, 0) for f in COUNT_FIELDS}}
+        for period in sorted(periods)
+    ]
+
+
+# Background job
+def _claim_run(interval):
+    """One worker per interval: a lease on the job document."""
+    now = datetime.now(timezone.utc)
+    try:
+        rollup_days_collection.find_one_and_update(
+            {"_id": JOB_KEY, "$or": [{"lease_until": {"$lte": now}}, {"lease_until": {"$exists": False}}]},
+            {"$set": {"lease_until": now + timedelta(seconds=interval)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+_job_pid = None
+
+
+def start_rollup_job(interval=ROLLUP_INTERVAL_SECONDS):
+    global _job_pid
+    if not ATTENDANCE_ROLLUPS or _job_pid == os.getpid():
+        return None
+    _job_pid = os.getpid()
+
+    def run():
+        # Spread workers out; the lease makes all but one skip anyway.
+        time.sleep(random.uniform(0, min(interval, 30)))
+        while True:
+            try:
+                if _claim_run(interval):
+                    result = finalize_closed_days()
+                    if result["finalized"] or result["refreshed"]:
+                        print(f"Attendance rollups: {result}", flush=True)
+            except Exception as e:
+                print(f"Attendance rollup run failed: {e}", flush=True)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="attendance-rollups", daemon=True)
+    thread.start()
+    return thread
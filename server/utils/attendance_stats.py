@@ -0,0 +1,229 @@
+import os
+import time
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from config.db_config import db
+
+# CONFIGURATION
+# Materialized Present / Late / Absent / Excused counters, kept up to date
+# with $inc wherever attendance_events change, so dashboards read a few
+# documents instead of aggregating raw attendance. One document per
+#   class:<class_id>
+#   student:<student_id>
+#   class_student:<class_id>:<student_id>
+# rebuild_stats() recomputes them all from attendance_events. Counters of
+# archived semesters move to attendance_stats_archive with their events.
+# Events that predate the counters are counted by a one-time seed
+# rebuild on the first start after deploy (start_stats_seed), deferred
+# (retried every STATS_SEED_RETRY_SECONDS) while attendance sessions are
+# live, since a rebuild drops increments made while it runs.
+STATS_SEED_RETRY_SECONDS = int(os.getenv("STATS_SEED_RETRY_SECONDS", 300))
+attendance_stats_collection = db["attendance_stats"]
+attendance_stats_archive = db["attendance_stats_archive"]
+attendance_events_collection = db["attendance_events"]
+stats_seed_collection = db["attendance_stats_seed"]   # {_id: "seed", started_at, finished_at}
+
+STATUS_FIELDS = {"Present": "present", "Late": "late", "Absent": "absent", "Excused": "excused"}
+COUNT_FIELDS = ("present", "late", "absent", "excused", "total")
+
+
+def _keys(class_id, student_id):
+    return [
+        (f"class:{class_id}", {"scope": "class", "class_id": class_id}),
+        (f"student:{student_id}", {"scope": "student", "student_id": student_id}),
+        (f"class_student:{class_id}:{student_id}",
+         {"scope": "class_student", "class_id": class_id, "student_id": student_id}),
+    ]
+
+
+def _inc(status, sign):
+    inc = {"total": sign}
+    field = STATUS_FIELDS.get(status)
+    if field:
+        inc[field] = sign
+    return inc
+
+
+def apply_stat_changes(changes, collection=None):
+    """changes: [(class_id, student_id, status, +1 | -1)], one bulk $inc."""
+    collection = collection if collection is not None else attendance_stats_collection
+    incs = defaultdict(Counter)
+    scopes = {}
+    for class_id, student_id, status, sign in changes:
+        if not class_id or not student_id or not status:
+            continue
+        for key, scope in _keys(class_id, student_id):
+            incs[key].update(_inc(status, sign))
+            scopes[key] = scope
+
+    now = datetime.now(timezone.utc)
+    ops = []
+    for key, counter in incs.items():
+        inc = {k: v for k, v in counter.items() if v}
+        if inc:
+            ops.append(UpdateOne(
+                {"_id": key},
+                {"$inc": inc, "$set": {"updated_at": now}, "$setOnInsert": scopes[key]},
+                upsert=True,
+            ))
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+
+
+def _counts(doc):
+    counts = {k: (doc or {}).get(k, 0) for k in COUNT_FIELDS}
+    counts["rate"] = (
+        round(((counts["present"] + counts["late"]) / counts["total"]) * 100, 2)
+        if counts["total"] else None
+    )
+    return counts
+
+
+def _many(prefix, ids):
+    ids = [i for i in ids if i]
+    if not ids:
+        return {}
+    docs = attendance_stats_collection.find({"_id": {"$in": [f"{prefix}:{i}" for i in ids]}})
+    found = {doc["_id"].split(":", 1)[1]: _counts(doc) for doc in docs}
+    return {i: found.get(i, _counts(None)) for i in ids}
+
+
+def class_stats(class_id):
+    """{"present", "late", "absent", "excused", "total", "rate"} for one class."""
+    return _counts(attendance_stats_collection.find_one({"_id": f"class:{class_id}"}))
+
+
+def class_stats_many(class_ids):
+    return _many("class", class_ids)
+
+
+def student_stats(student_id, include_archived=False):
+    key = {"_id": f"student:{student_id}"}
+    if not include_archived:
+        return _counts(attendance_stats_collection.find_one(key))
+    return combined_stats(
+        c.find_one(key) or {} for c in (attendance_stats_collection, attendance_stats_archive)
+    )
+
+
+def student_stats_many(student_ids):
+    return _many("student", student_ids)
+
+
+def class_student_stats(class_id, student_id):
+    return _counts(attendance_stats_collection.find_one({"_id": f"class_student:{class_id}:{student_id}"}))
+
+
+def combined_stats(stats):
+    """Sum several counts dicts (e.g. all classes of an instructor)."""
+    total = {k: 0 for k in COUNT_FIELDS}
+    for s in stats:
+        for k in COUNT_FIELDS:
+            total[k] += s.get(k, 0)
+    return _counts(total)
+
+
+# Rebuild
+def _group_stage(key, scope_fields):
+    return [
+        {"$group": {
+            "_id": key,
+            **{f: {"$first": f"${f}"} for f in scope_fields},
+            "present": {"$sum": {"$cond": [{"$eq": ["$status", "Present"]}, 1, 0]}},
+            "late": {"$sum": {"$cond": [{"$eq": ["$status", "Late"]}, 1, 0]}},
+            "absent": {"$sum": {"$cond": [{"$eq": ["$status", "Absent"]}, 1, 0]}},
+            "excused": {"$sum": {"$cond": [{"$eq": ["$status", "Excused"]}, 1, 0]}},
+            "total": {"$sum": 1},
+        }},
+    ]
+
+
+def rebuild_stats():
+    """Recompute every counter from attendance_events and swap it in.
+
+    Writes a fresh collection and renames it over attendance_stats, so
+    readers never see a half-built set. Increments that land while the
+    rebuild runs are lost; run it when no sessions are live, or run it twice.
+    """
+    tmp = f"{attendance_stats_collection.name}_rebuild"
+    db[tmp].drop()
+    now = datetime.now(timezone.utc)
+    scopes = [
+        ("class", {"$concat": ["class:", "$class_id"]}, ["class_id"]),
+        ("student", {"$concat": ["student:", "$student_id"]}, ["student_id"]),
+        ("class_student", {"$concat": ["class_student:", "$class_id", ":", "$student_id"]},
+         ["class_id", "student_id"]),
+    ]
+    counts = {}
+    for scope, key, fields in scopes:
+        attendance_events_collection.aggregate([
+            {"$match": {f: {"$type": "string"} for f in fields}},
+            *_group_stage(key, fields),
+            {"$addFields": {"scope": scope, "updated_at": now}},
+            {"$merge": {"into": tmp, "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ], allowDiskUse=True)
+        counts[scope] = db[tmp].count_documents({"scope": scope})
+
+    if sum(counts.values()):
+        db[tmp].rename(attendance_stats_collection.name, dropTarget=True)
+    else:
+        db[tmp].drop()
+        attendance_stats_collection.delete_many({})
+    print(f"Attendance stats rebuilt: {counts}", flush=True)
+    return counts
+
+
+def sessions_live():
+    """True while any class has an attendance session running."""
+    return db["classes"].find_one({"is_attendance_active": True}, {"_id": 1}) is not None
+
+
+def seed_stats():
+    """rebuild_stats() once per database, claimed so only one process runs it.
+
+    Returns False when already seeded (or claimed elsewhere) or there are
+    no events yet, None when deferred because sessions are live. A failed
+    seed releases its claim for the next start.
+    """
+    if stats_seed_collection.find_one({"_id": "seed"}):
+        return False
+    if not attendance_events_collection.find_one({}, {"_id": 1}):
+        return False
+    if sessions_live():
+        return None
+    try:
+        stats_seed_collection.insert_one({"_id": "seed", "started_at": datetime.now(timezone.utc)})
+    except DuplicateKeyError:
+        return False
+    try:
+        rebuild_stats()
+    except Exception:
+        stats_seed_collection.delete_one({"_id": "seed"})
+        raise
+    stats_seed_collection.update_one({"_id": "seed"}, {"$set": {"finished_at": datetime.now(timezone.utc)}})
+    return True
+
+
+def start_stats_seed():
+    def run():
+        while True:
+            try:
+                seeded = seed_stats()
+            except Exception as e:
+                print(f"Attendance stats seed failed: {e}", flush=True)
+                return
+            if seeded is None:
+                time.sleep(STATS_SEED_RETRY_SECONDS)
+                continue
+            if seeded:
+                print("Attendance stats seeded from existing events", flush=True)
+            return
+
+    thread = threading.Thread(target=run, name="attendance-stats-seed", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,21 @@
+from functools import wraps
+
+from flask import jsonify
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+
+def is_admin(claims=None):
+    """True for admin tokens (admin login sets role=admin in the claims)."""
+    claims = get_jwt() if claims is None else claims
+    return claims.get("role") == "admin"
+
+
+def admin_required(fn):
+    """Like @jwt_required(), but only for admin tokens (403 otherwise)."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        verify_jwt_in_request()
+        if not is_admin():
+            return jsonify({"error": "Forbidden — admin access required"}), 403
+        return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,280 @@
+import os
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from config.db_config import db
+
+# CONFIGURATION
+# Every index the app relies on, declared in one place and applied
+# idempotently (create_index is a no-op for an index that already exists).
+# Applied at deploy time by scripts/ensure_indexes.py and, unless
+# DB_INDEXES_ON_START=false, once per worker on startup.
+DB_INDEXES_ON_START = os.getenv("DB_INDEXES_ON_START", "true").lower() == "true"
+
+# collection -> [(keys, options)]. Leave "name" unset unless the index was
+# already created under an explicit name: a different name for the same
+# keys makes create_index fail.
+INDEXES = {
+    "admins": [
+        ("user_id", {"unique": True, "name": "uniq_user_id"}),
+        ("email", {"unique": True, "name": "uniq_email"}),
+    ],
+    "instructors": [
+        ("instructor_id", {}),
+        ("email", {}),
+    ],
+    "students": [
+        # Unique once scripts/migrate_student_schema.py has swapped out the
+        # old plain index; until then this entry is reported and skipped.
+        ("student_id", {"unique": True}),
+        ([("program_key", ASCENDING), ("created_at", DESCENDING)], {}),
+    ],
+    "classes": [
+        ("students.student_id", {}),
+        ([("instructor_id", ASCENDING), ("semester", ASCENDING), ("school_year", ASCENDING)], {}),
+        ([("semester", ASCENDING), ("school_year", ASCENDING), ("created_at", DESCENDING)], {}),
+        ([("program_key", ASCENDING), ("semester", ASCENDING), ("school_year", ASCENDING),
+          ("created_at", DESCENDING)], {}),
+        ([("instructor_id", ASCENDING), ("program_key", ASCENDING)], {}),
+        ([("subject_id", ASCENDING), ("course", ASCENDING), ("year_level", ASCENDING),
+          ("semester", ASCENDING), ("section", ASCENDING)], {}),
+        ("is_attendance_active", {}),
+    ],
+    "subjects": [
+        ("subject_code", {}),
+        ("instructor_id", {}),
+        ([("semester", ASCENDING), ("year_level", ASCENDING)], {}),
+        ([("program_key", ASCENDING), ("semester", ASCENDING), ("year_level", ASCENDING)], {}),
+    ],
+    "semesters": [
+        ("is_active", {}),
+    ],
+    "attendance_logs": [
+        ([("class_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("instructor_id", ASCENDING), ("date", ASCENDING)], {}),
+        # Keyset pagination: (date, _id) newest first, optionally per owner.
+        ([("date", DESCENDING), ("_id", DESCENDING)], {}),
+        ([("instructor_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)], {}),
+        ([("course", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)], {}),
+        ([("program_key", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)], {}),
+        # Legacy embedded entries, read until every log is migrated.
+        ([("students.student_id", ASCENDING), ("date", ASCENDING)], {}),
+        # Semester archival picks a semester's sessions.
+        ([("school_year", ASCENDING), ("semester", ASCENDING)], {}),
+    ],
+    "attendance_events": [
+        ([("session_id", ASCENDING), ("student_id", ASCENDING)], {"unique": True}),
+        ([("class_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("student_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("instructor_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("course", ASCENDING), ("date", ASCENDING)], {}),
+        ([("program_key", ASCENDING), ("date", ASCENDING)], {}),
+        ("date", {}),
+    ],
+    "attendance_daily": [
+        ([("instructor_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("class_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("program_key", ASCENDING), ("date", ASCENDING)], {}),
+        ([("school_year", ASCENDING), ("semester", ASCENDING)], {}),
+        ("date", {}),
+    ],
+    # Archived semesters (utils/attendance_archive.py): the same read paths,
+    # without the write-side indexes.
+    "attendance_logs_archive": [
+        ([("date", DESCENDING), ("_id", DESCENDING)], {}),
+        ([("instructor_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)], {}),
+        ([("program_key", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)], {}),
+        ([("class_id", ASCENDING), ("date", ASCENDING)], {}),
+    ],
+    "attendance_events_archive": [
+        ([("session_id", ASCENDING), ("student_id", ASCENDING)], {}),
+        ([("class_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("student_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("instructor_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("program_key", ASCENDING), ("date", ASCENDING)], {}),
+    ],
+    "attendance_daily_archive": [
+        ([("instructor_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("class_id", ASCENDING), ("date", ASCENDING)], {}),
+        ([("program_key", ASCENDING), ("date", ASCENDING)], {}),
+    ],
+    "attendance_rollup_days": [
+        ("dirty", {}),
+    ],
+    "gallery_versions": [
+        ("version", {}),
+    ],
+    "jobs": [
+        ([("status", ASCENDING), ("heartbeat_at", ASCENDING)], {}),
+        ([("status", ASCENDING), ("created_at", ASCENDING)], {}),
+        ([("status", ASCENDING), ("finished_at", ASCENDING)], {}),
+        ([("kind", ASCENDING), ("status", ASCENDING)], {}),
+    ],
+}
+
+# Hot query shapes, with placeholder values; each must be served by an index.
+HOT_QUERIES = [
+    {"name": "student by id", "collection": "students",
+     "filter": {"student_id": "S"}},
+    {"name": "program students", "collection": "students",
+     "filter": {"program_key": "BSIT"}, "sort": {"created_at": -1}},
+    {"name": "class gallery students", "collection": "students",
+     "filter": {"student_id": {"$in": ["S1", "S2"]}, "embeddings": {"$exists": True}}},
+    {"name": "instructor by id", "collection": "instructors",
+     "filter": {"instructor_id": "I"}},
+    {"name": "instructor by email", "collection": "instructors",
+     "filter": {"email": "x@example.com"}},
+    {"name": "admin by user id", "collection": "admins",
+     "filter": {"user_id": "A"}},
+    {"name": "active semester", "collection": "semesters",
+     "filter": {"is_active": True}},
+    {"name": "classes of a student", "collection": "classes",
+     "filter": {"students.student_id": "S"}},
+    {"name": "instructor classes this semester", "collection": "classes",
+     "filter": {"instructor_id": "I", "semester": "1st Semester", "school_year": "2025-2026"}},
+    {"name": "program classes this semester", "collection": "classes",
+     "filter": {"program_key": "BSIT", "semester": "1st Semester", "school_year": "2025-2026"},
+     "sort": {"created_at": -1}},
+    {"name": "class block lookup", "collection": "classes",
+     "filter": {"subject_id": "X", "course": "BSIT", "year_level": "1",
+                "semester": "1st Semester", "section": "A"}},
+    {"name": "active attendance session", "collection": "classes",
+     "filter": {"is_attendance_active": True, "instructor_id": "I"}},
+    {"name": "subject by code", "collection": "subjects",
+     "filter": {"subject_code": "IT101"}},
+    {"name": "class logs by date", "collection": "attendance_logs",
+     "filter": {"class_id": "C", "date": {"$gte": "2025-01-01", "$lte": "2025-12-31"}},
+     "sort": {"date": 1}},
+    {"name": "instructor sessions", "collection": "attendance_logs",
+     "filter": {"instructor_id": "I"}, "sort": {"date": -1}},
+    {"name": "instructor class sessions", "collection": "attendance_logs",
+     "filter": {"class_id": "C", "instructor_id": "I"}, "sort": {"date": -1}},
+    {"name": "sessions page", "collection": "attendance_logs",
+     "filter": {"$or": [{"date": {"$lt": "2025-06-01"}},
+                        {"date": "2025-06-01", "_id": {"$lt": "000000000000000000000000"}}]},
+     "sort": {"date": -1, "_id": -1}},
+    {"name": "program sessions page", "collection": "attendance_logs",
+     "filter": {"program_key": "BSIT"}, "sort": {"date": -1, "_id": -1}},
+    {"name": "program events today", "collection": "attendance_events",
+     "filter": {"program_key": "BSIT", "date": "2025-01-01"}},
+    {"name": "event already logged", "collection": "attendance_events",
+     "filter": {"class_id": "C", "date": "2025-01-01", "student_id": "S"}},
+    {"name": "session statuses", "collection": "attendance_events",
+     "filter": {"session_id": "L", "student_id": {"$in": ["S1", "S2"]}}},
+    {"name": "student attendance rate", "collection": "attendance_events",
+     "pipeline": [{"$match": {"student_id": "S"}},
+                  {"$group": {"_id": "$status", "n": {"$sum": 1}}}]},
+    {"name": "students list rates", "collection": "attendance_events",
+     "pipeline": [{"$match": {"student_id": {"$in": ["S1", "S2"]}}},
+                  {"$group": {"_id": "$student_id", "n": {"$sum": 1}}}]},
+    {"name": "instructor attendance report", "collection": "attendance_events",
+     "filter": {"instructor_id": "I", "date": {"$gte": "2025-01-01"}}, "sort": {"date": -1}},
+    {"name": "program export", "collection": "attendance_events",
+     "filter": {"program_key": "BSIT", "semester": "1st Semester", "date": {"$gte": "2025-01-01"}},
+     "sort": {"date": 1}},
+    {"name": "live trend days", "collection": "attendance_events",
+     "filter": {"date": {"$type": "string", "$gt": "2025-01-01"}}},
+    {"name": "instructor daily buckets", "collection": "attendance_daily",
+     "filter": {"instructor_id": "I", "date": {"$gte": "2025-01-01", "$lte": "2025-12-31"}}},
+    {"name": "program daily buckets", "collection": "attendance_daily",
+     "filter": {"program_key": "BSIT", "date": {"$lte": "2025-12-31"}}},
+    {"name": "semester sessions to archive", "collection": "attendance_logs",
+     "filter": {"semester": "1st Sem", "school_year": "2025-2026"}},
+    {"name": "semester buckets to archive", "collection": "attendance_daily",
+     "filter": {"semester": "1st Sem", "school_year": "2025-2026"}},
+    {"name": "archived sessions page", "collection": "attendance_logs_archive",
+     "filter": {"program_key": "BSIT"}, "sort": {"date": -1, "_id": -1}},
+    {"name": "archived session events", "collection": "attendance_events_archive",
+     "filter": {"session_id": {"$in": ["L1", "L2"]}}},
+    {"name": "dirty rollup days", "collection": "attendance_rollup_days",
+     "filter": {"dirty": True, "_id": {"$lt": "2025-01-01"}}},
+    {"name": "stale running jobs", "collection": "jobs",
+     "filter": {"status": "running", "heartbeat_at": {"$lt": "2025-01-01"}}},
+    {"name": "expired jobs", "collection": "jobs",
+     "filter": {"status": {"$in": ["done", "failed", "cancelled"]}, "finished_at": {"$lt": "2025-01-01"}}},
+    {"name": "active job of a kind", "collection": "jobs",
+     "filter": {"kind": "rebuild_attendance_stats", "status": {"$in": ["queued", "running"]}}},
+    {"name": "gallery version poll", "collection": "gallery_versions",
+     "filter": {"_id": {"$ne": "__seq__"}, "version": {"$gt": 0}}},
+]
+
+
+def _as_keys(keys):
+    return [(keys, ASCENDING)] if isinstance(keys, str) else keys
+
+
+def apply_indexes(collections=None, database=None):
+    """Create every declared index that is missing; returns names ensured.
+
+    A conflicting existing index (same keys, other options) is reported
+    and skipped rather than dropped.
+    """
+    database = database if database is not None else db
+    ensured = []
+    for name, specs in INDEXES.items():
+        if collections and name not in collections:
+            continue
+        for keys, options in specs:
+            try:
+                ensured.append(f"{name}.{database[name].create_index(_as_keys(keys), **options)}")
+            except OperationFailure as e:
+                print(f"Index on {name} {keys} not applied: {e}")
+    return ensured
+
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+
+def _winning_plans(explain):
+    # find: queryPlanner at the top; aggregate: one per $cursor / shard stage.
+    if "queryPlanner" in explain:
+        yield explain["queryPlanner"].get("winningPlan", {})
+    for stage in explain.get("stages", []):
+        cursor = stage.get("$cursor", {})
+        if "queryPlanner" in cursor:
+            yield cursor["queryPlanner"].get("winningPlan", {})
+    for shard in explain.get("shards", {}).values():
+        yield from _winning_plans(shard)
+
+
+def explain_query(shape, database=None):
+    """Winning-plan stage names for one HOT_QUERIES shape."""
+    database = database if database is not None else db
+    if "pipeline" in shape:
+        command = {"aggregate": shape["collection"], "pipeline": shape["pipeline"], "cursor": {}}
+    else:
+        command = {"find": shape["collection"], "filter": shape["filter"]}
+        if shape.get("sort"):
+            command["sort"] = shape["sort"]
+    explain = database.command({"explain": command, "verbosity": "queryPlanner"})
+    return [stage for plan in _winning_plans(explain) for stage in _plan_stages(plan)]
+
+
+def verify_query_plans(database=None):
+    """Explain every hot query; returns the shapes whose plan has a COLLSCAN."""
+    failures = []
+    for shape in HOT_QUERIES:
+        stages = explain_query(shape, database)
+        ok = "COLLSCAN" not in stages
+        print(f"{'ok  ' if ok else 'FAIL'} {shape['collection']}: {shape['name']} -> {' > '.join(stages)}")
+        if not ok:
+            failures.append({"name": shape["name"], "collection": shape["collection"], "stages": stages})
+    return failures
+
+
+def apply_indexes_on_start():
+    if not DB_INDEXES_ON_START:
+        return
+    try:
+        apply_indexes()
+    except Exception as e:
+        print(f"Index registry not applied: {e}")
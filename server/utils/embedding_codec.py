@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+from bson.binary import Binary
+
+# CONFIGURATION
+# How new embeddings are written to MongoDB:
+#   float32  packed little-endian float32 Binary (2 KB per angle, lossless)
+#   float16  packed float16 Binary (1 KB per angle)
+#   list     legacy array of doubles (~4.6 KB per angle)
+# Readers accept all three, so the setting can change at any time.
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32").lower()
+EMBEDDING_DIM = 512
+
+# BSON user-defined binary subtypes (128-255) tag the element type.
+SUBTYPE_FLOAT16 = 128
+SUBTYPE_FLOAT32 = 129
+
+_SUBTYPE_DTYPES = {
+    SUBTYPE_FLOAT16: np.dtype("<f2"),
+    SUBTYPE_FLOAT32: np.dtype("<f4"),
+}
+_DTYPE_SUBTYPES = {"float16": SUBTYPE_FLOAT16, "float32": SUBTYPE_FLOAT32}
+
+
+def encode_embedding(vector, dtype=None):
+    """Prepare one embedding (list or array) for storage."""
+    dtype = (dtype or EMBEDDING_STORAGE_DTYPE).lower()
+    arr = np.asarray(vector, dtype=np.float32).ravel()
+    if dtype == "list":
+        return arr.tolist()
+    subtype = _DTYPE_SUBTYPES.get(dtype)
+    if subtype is None:
+        raise ValueError(f"Unknown EMBEDDING_STORAGE_DTYPE: {dtype}")
+    return Binary(arr.astype(_SUBTYPE_DTYPES[subtype]).tobytes(), subtype)
+
+
+def decode_embedding(value):
+    """Stored embedding (Binary or legacy list) → float32 array, or None.
+
+    float32 Binary is returned as a zero-copy, read-only view of the BSON
+    bytes; float16 is widened to float32.
+    """
+    if isinstance(value, Binary) and value.subtype in _SUBTYPE_DTYPES:
+        arr = np.frombuffer(value, dtype=_SUBTYPE_DTYPES[value.subtype])
+        return arr if arr.dtype == np.float32 else arr.astype(np.float32)
+    if isinstance(value, (list, tuple)):
+        return np.asarray(value, dtype=np.float32)
+    return None
+
+
+def is_valid_embedding(value):
+    vec = decode_embedding(value)
+    return vec is not None and vec.shape == (EMBEDDING_DIM,)
+
+
+def decode_embeddings(embeddings):
+    """{angle: stored} → {angle: float32 array}, skipping invalid entries."""
+    decoded = {}
+    for angle, value in (embeddings or {}).items():
+        vec = decode_embedding(value)
+        if vec is not None and vec.shape == (EMBEDDING_DIM,):
+            decoded[angle] = vec
+    return decoded
+
+
+def embeddings_to_json(embeddings):
+    """{angle: stored} → {angle: list} for API responses."""
+    return {angle: vec.tolist() for angle, vec in decode_embeddings(embeddings).items()}
+
+
+def compute_centroid(embeddings):
+    """Normalized mean of a user's normalized angle embeddings, or None."""
+    vectors = []
+    for vec in decode_embeddings(embeddings).values():
+        norm = np.linalg.norm(vec)
+        if norm >= 1e-3:
+            vectors.append(vec / norm)
+    if not vectors:
+        return None
+    centroid = np.mean(vectors, axis=0)
+    norm = np.linalg.norm(centroid)
+    return centroid / norm if norm >= 1e-3 else None
@@ -0,0 +1,150 @@
+import os
+import time
+import threading
+
+from pymongo import UpdateOne
+
+from config.db_config import db
+from utils.embedding_codec import (
+    EMBEDDING_STORAGE_DTYPE,
+    compute_centroid,
+    decode_embeddings,
+    encode_embedding,
+)
+
+# CONFIGURATION
+EMBEDDING_COLLECTIONS = ("students", "instructors")
+MIGRATION_BATCH_SIZE = int(os.getenv("EMBEDDING_MIGRATION_BATCH", 200))
+# Pause between batches so a live migration doesn't starve request traffic.
+MIGRATION_BATCH_PAUSE = float(os.getenv("EMBEDDING_MIGRATION_PAUSE", 0.2))
+EMBEDDING_MIGRATE_ON_START = os.getenv("EMBEDDING_MIGRATE_ON_START", "false").lower() == "true"
+
+# Legacy documents store at least one angle as an array of doubles.
+LEGACY_FILTER = {"$expr": {"$anyElementTrue": {"$map": {
+    "input": {"$objectToArray": {"$ifNull": ["$embeddings", {}]}},
+    "in": {"$isArray": "$$this.v"},
+}}}}
+
+
+def migrate_collection(name, dtype=None, batch_size=MIGRATION_BATCH_SIZE, pause=MIGRATION_BATCH_PAUSE):
+    """Rewrite legacy list embeddings in `name` as packed Binary."""
+    dtype = dtype or EMBEDDING_STORAGE_DTYPE
+    collection = db[name]
+    migrated = 0
+
+    while True:
+        docs = list(collection.find(LEGACY_FILTER, {"embeddings": 1}).limit(batch_size))
+        if not docs:
+            break
+
+        ops = []
+        for doc in docs:
+            for angle, value in (doc.get("embeddings") or {}).items():
+                if not isinstance(value, list):
+                    continue
+                # Guard on the array type so a concurrent re-registration
+                # of this angle is never overwritten with the old vector.
+                ops.append(UpdateOne(
+                    {"_id": doc["_id"], f"embeddings.{angle}": {"$type": "array"}},
+                    {"$set": {f"embeddings.{angle}": encode_embedding(value, dtype)}},
+                ))
+
+        if not ops:
+            break
+        result = collection.bulk_write(ops, ordered=False)
+        migrated += result.modified_count
+        if result.modified_count == 0:
+            break
+        if pause:
+            time.sleep(pause)
+
+    return migrated
+
+
+def migrate_embeddings(dtype=None, batch_size=MIGRATION_BATCH_SIZE, pause=MIGRATION_BATCH_PAUSE):
+    results = {}
+    for name in EMBEDDING_COLLECTIONS:
+        results[name] = migrate_collection(name, dtype, batch_size, pause)
+        print(f"Embedding migration: {name} → {results[name]} angle(s) rewritten", flush=True)
+    return results
+
+
+def backfill_centroids(batch_size=MIGRATION_BATCH_SIZE):
+    """Add embedding_centroid to users registered before centroids existed."""
+    results = {}
+    for name in EMBEDDING_COLLECTIONS:
+        collection = db[name]
+        missing = {"embeddings": {"$exists": True, "$ne": {}}, "embedding_centroid": {"$exists": False}}
+        ops, written = [], 0
+        for doc in collection.find(missing, {"embeddings": 1}).batch_size(batch_size):
+            centroid = compute_centroid(doc.get("embeddings"))
+            if centroid is None:
+                continue
+            ops.append(UpdateOne(
+                {"_id": doc["_id"], "embedding_centroid": {"$exists": False}},
+                {"$set": {"embedding_centroid": encode_embedding(centroid)}},
+            ))
+            if len(ops) >= batch_size:
+                written += collection.bulk_write(ops, ordered=False).modified_count
+                ops = []
+        if ops:
+            written += collection.bulk_write(ops, ordered=False).modified_count
+        results[name] = written
+        print(f"Centroid backfill: {name} → {written} user(s)", flush=True)
+    return results
+
+
+def storage_report():
+    """Per collection: legacy vs binary docs, average document size, load time."""
+    report = {}
+    for name in EMBEDDING_COLLECTIONS:
+        collection = db[name]
+        has_embeddings = {"embeddings": {"$exists": True, "$ne": {}}}
+
+        total = collection.count_documents(has_embeddings)
+        legacy = collection.count_documents({**has_embeddings, **LEGACY_FILTER})
+
+        sizes = list(collection.aggregate([
+            {"$match": has_embeddings},
+            {"$group": {
+                "_id": None,
+                "avg_doc_bytes": {"$avg": {"$bsonSize": "$$ROOT"}},
+                "embedding_bytes": {"$sum": {"$bsonSize": "$embeddings"}},
+            }},
+        ]))
+        sizes = sizes[0] if sizes else {}
+
+        # Same projection + decode the face cache does on a miss.
+        start = time.time()
+        vectors = 0
+        for doc in collection.find(has_embeddings, {"embeddings": 1}):
+            vectors += len(decode_embeddings(doc.get("embeddings")))
+        load_ms = (time.time() - start) * 1000
+
+        report[name] = {
+            "documents": total,
+            "legacy_documents": legacy,
+            "binary_documents": total - legacy,
+            "vectors": vectors,
+            "avg_doc_bytes": round(sizes.get("avg_doc_bytes") or 0),
+            "embedding_bytes": sizes.get("embedding_bytes") or 0,
+            "load_ms": round(load_ms, 1),
+        }
+    return report
+
+
+def start_background_migration():
+    """Migrate legacy embeddings in a daemon thread (EMBEDDING_MIGRATE_ON_START)."""
+    if not EMBEDDING_MIGRATE_ON_START:
+        return None
+
+    def run():
+        try:
+            migrate_embeddings()
+            backfill_centroids()
+        except Exception as e:
+            print(f"Embedding migration failed: {e}", flush=True)
+
+    thread = threading.Thread(target=run, name="embedding-migration", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,166 @@
+import os
+
+import numpy as np
+
+from utils.embedding_codec import decode_embedding
+
+# CONFIGURATION
+EMBEDDING_DIM = 512
+# Same acceptance rules as the AI service's /recognize-multi.
+INSTRUCTOR_THRESHOLD = 0.40
+STUDENT_THRESHOLD = 0.42
+MIN_LIVE_NORM = 0.5
+
+# Two-stage search: score one centroid per user, keep the top K users,
+# then rescore only their angle vectors. Small galleries (fewer than
+# CENTROID_MIN_USERS users) are scanned in full.
+CENTROID_SHORTLIST_K = int(os.getenv("CENTROID_SHORTLIST_K", 10))
+CENTROID_MIN_USERS = int(os.getenv("CENTROID_MIN_USERS", 50))
+
+
+class Gallery:
+    """A class's registered embeddings as one pre-normalized float32 matrix."""
+
+    def __init__(self, registered_faces, centroids=None):
+        rows, row_user, angles = [], [], []
+        user_index = {}
+        users = []
+
+        for r in registered_faces:
+            emb = np.asarray(r.get("embedding"), dtype=np.float32)
+            if emb.shape != (EMBEDDING_DIM,):
+                continue
+            norm = np.linalg.norm(emb)
+            if norm < 1e-3:
+                continue
+
+            user_id = r.get("user_id")
+            if user_id not in user_index:
+                user_index[user_id] = len(users)
+                users.append({
+                    "user_id": user_id,
+                    "type": "instructor" if r.get("is_instructor") else r.get("type", "student"),
+                })
+
+            rows.append(emb / norm)
+            row_user.append(user_index[user_id])
+            angles.append(r.get("angle"))
+
+        matrix = np.stack(rows) if rows else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self._index(matrix, users, row_user, angles)
+        self.centroids = self._build_centroids(centroids or {})
+
+    @classmethod
+    def from_arrays(cls, matrix, users, row_user, angles, centroids):
+        """Wrap already-normalized arrays (e.g. a mapped snapshot) without copying."""
+        gallery = cls.__new__(cls)
+        gallery._index(matrix, users, row_user, angles)
+        gallery.centroids = centroids
+        return gallery
+
+    def _index(self, matrix, users, row_user, angles):
+        self.matrix = matrix
+        self.users = users                              # per user: {"user_id", "type"}
+        self.row_user = np.asarray(row_user, dtype=np.int64)
+        self.angles = list(angles)
+        self.meta = [users[u] for u in self.row_user]   # per row
+        self.user_rows = [np.flatnonzero(self.row_user == u) for u in range(len(users))]
+
+    def registered_faces(self):
+        """Rows back in get_cached_faces' list-of-dicts shape."""
+        return [
+            {
+                "user_id": meta["user_id"],
+                "embedding": self.matrix[i],
+                "angle": self.angles[i],
+                "is_instructor": meta["type"] == "instructor",
+            }
+            for i, meta in enumerate(self.meta)
+        ]
+
+    def _build_centroids(self, stored):
+        out = np.empty((len(self.users), EMBEDDING_DIM), dtype=np.float32)
+        for u, user in enumerate(self.users):
+            # Stored centroid when registration kept one, else derive it.
+            centroid = decode_embedding(stored.get(user["user_id"]))
+            if centroid is None or centroid.shape != (EMBEDDING_DIM,):
+                centroid = self.matrix[self.user_rows[u]].mean(axis=0)
+            norm = np.linalg.norm(centroid)
+            out[u] = centroid / norm if norm >= 1e-3 else centroid
+        return out
+
+    def __len__(self):
+        return len(self.meta)
+
+    def search(self, live):
+        """Best row index and cosine score for each live embedding (rows of `live`)."""
+        if len(self.users) < max(CENTROID_MIN_USERS, CENTROID_SHORTLIST_K + 1):
+            sims = live @ self.matrix.T
+            best_idx = np.argmax(sims, axis=1)
+            return best_idx, sims[np.arange(len(live)), best_idx]
+
+        k = CENTROID_SHORTLIST_K
+        shortlist = np.argpartition(-(live @ self.centroids.T), k - 1, axis=1)[:, :k]
+
+        best_idx = np.empty(len(live), dtype=np.int64)
+        best_score = np.empty(len(live), dtype=np.float32)
+        for i, users in enumerate(shortlist):
+            rows = np.concatenate([self.user_rows[u] for u in users])
+            sims = self.matrix[rows] @ live[i]
+            j = int(np.argmax(sims))
+            best_idx[i] = rows[j]
+            best_score[i] = sims[j]
+        return best_idx, best_score
+
+
+def match_faces(gallery, faces):
+    """Turn /embed-multi results into /recognize-multi's "recognized" list.
+
+    Faces are walked in frame order with the AI service's rules: best cosine
+    match, per-type threshold, skip users already matched in this frame,
+    then drop spoofs.
+    """
+    if not len(gallery):
+        return []
+
+    valid = []
+    for f in faces:
+        emb = np.squeeze(np.asarray(f.get("embedding") or [], dtype=np.float32))
+        if emb.shape != (EMBEDDING_DIM,) or np.linalg.norm(emb) < MIN_LIVE_NORM:
+            continue
+        valid.append((f, emb))
+    if not valid:
+        return []
+
+    best_idx, best_scores = gallery.search(np.stack([emb for _, emb in valid]))
+
+    recognized = []
+    seen_user_ids = set()
+    for (f, _), idx, score in zip(valid, best_idx, best_scores):
+        best_score = float(score)
+        target = gallery.meta[int(idx)]
+        user_id = target["user_id"]
+        user_type = target["type"]
+
+        threshold = INSTRUCTOR_THRESHOLD if user_type == "instructor" else STUDENT_THRESHOLD
+        if best_score < threshold:
+            continue
+        if user_id in seen_user_ids:
+            continue
+        seen_user_ids.add(user_id)
+
+        if not f.get("is_real"):
+            print(f"SPOOF blocked: {user_id} (score={best_score:.4f})")
+            continue
+
+        recognized.append({
+            "user_id": user_id,
+            "type": user_type,
+            "match_score": round(best_score, 4),
+            "spoof_status": "Real",
+            "spoof_confidence": f.get("spoof_confidence"),
+            "real_prob": f.get("real_prob"),
+            "spoof_prob": f.get("spoof_prob"),
+        })
+
+    return recognized
@@ -0,0 +1,176 @@
+import os
+import re
+import glob
+import json
+import mmap
+import time
+import struct
+import tempfile
+import threading
+
+import numpy as np
+
+from utils.gallery import Gallery, EMBEDDING_DIM
+
+# CONFIGURATION
+# One file per class gallery version, written once and memory-mapped
+# read-only by every worker (backend and, on the same host, the AI
+# service), so N workers share one copy through the page cache.
+_DEFAULT_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+GALLERY_SNAPSHOT_DIR = os.getenv("GALLERY_SNAPSHOT_DIR", os.path.join(_DEFAULT_DIR, "frams-galleries"))
+GALLERY_SNAPSHOTS_ENABLED = os.getenv("GALLERY_SNAPSHOTS", "true").lower() == "true"
+# float16 halves the file; readers then upcast into private memory.
+GALLERY_SNAPSHOT_DTYPE = os.getenv("GALLERY_SNAPSHOT_DTYPE", "float32").lower()
+# Snapshots older than this are rebuilt from Mongo even at the same
+# version, as a backstop for writes that never bumped a version.
+GALLERY_SNAPSHOT_MAX_AGE = int(os.getenv("GALLERY_SNAPSHOT_MAX_AGE", 3600))
+# Every build gets its own file name (version + build time + pid), so a
+# rebuild never rewrites a path a reader (or the AI service's map cache)
+# already holds.
+_NAME = re.compile(r"^class-(?P<class_id>.+)-v(?P<version>\d+)-(?P<built>\d+)-\d+\.gal$")
+
+# Layout: MAGIC | uint32 header length | JSON header | pad to 64 | matrix | centroids
+MAGIC = b"FRAMSGL1"
+_PREFIX = struct.Struct("<8sI")
+_ALIGN = 64
+
+
+def _aligned(n):
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def snapshot_path(class_id, version, built_ns):
+    return os.path.join(GALLERY_SNAPSHOT_DIR, f"class-{class_id}-v{version}-{built_ns}-{os.getpid()}.gal")
+
+
+def _builds(class_id):
+    """[(version, built_ns, path)] of this class's snapshot files, newest first."""
+    builds = []
+    for path in glob.glob(os.path.join(GALLERY_SNAPSHOT_DIR, f"class-{class_id}-v*.gal")):
+        m = _NAME.match(os.path.basename(path))
+        if m and m["class_id"] == str(class_id):
+            builds.append((int(m["version"]), int(m["built"]), path))
+        elif not m:
+            builds.append((-1, 0, path))   # pre-build-name file (class-<id>-v<n>.gal)
+    return sorted(builds, reverse=True)
+
+
+class GallerySnapshot:
+    """A read-only memory map of one snapshot file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_len = _PREFIX.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a gallery snapshot: {path}")
+        self.header = json.loads(self._mm[_PREFIX.size:_PREFIX.size + header_len])
+        self.data_offset = _aligned(_PREFIX.size + header_len)
+
+        h = self.header
+        self.dtype = np.dtype(h["dtype"])
+        count, dim, users = h["count"], h["dim"], len(h["users"])
+        self.matrix_offset = self.data_offset
+        self.centroids_offset = self.matrix_offset + count * dim * self.dtype.itemsize
+
+        matrix = np.frombuffer(self._mm, self.dtype, count * dim, self.matrix_offset).reshape(count, dim)
+        centroids = np.frombuffer(self._mm, self.dtype, users * dim, self.centroids_offset).reshape(users, dim)
+        if self.dtype != np.float32:
+            matrix, centroids = matrix.astype(np.float32), centroids.astype(np.float32)
+
+        self.gallery = Gallery.from_arrays(matrix, h["users"], h["row_user"], h["angles"], centroids)
+
+    @property
+    def built_at(self):
+        return self.header.get("built_at", 0)
+
+    def descriptor(self):
+        """Where the AI service can map the row matrix itself."""
+        return {
+            "file": self.path,
+            "offset": self.matrix_offset,
+            "count": self.header["count"],
+            "dim": self.header["dim"],
+            "dtype": self.dtype.name,
+        }
+
+
+def _write(path, class_id, version, gallery):
+    dtype = np.dtype(GALLERY_SNAPSHOT_DTYPE)
+    header = json.dumps({
+        "class_id": class_id,
+        "version": version,
+        "built_at": time.time(),
+        "count": int(gallery.matrix.shape[0]),
+        "dim": EMBEDDING_DIM,
+        "dtype": dtype.name,
+        "users": gallery.users,
+        "row_user": gallery.row_user.tolist(),
+        "angles": gallery.angles,
+    }).encode()
+    data_offset = _aligned(_PREFIX.size + len(header))
+
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_offset - _PREFIX.size - len(header)))
+        f.write(np.ascontiguousarray(gallery.matrix, dtype=dtype).tobytes())
+        f.write(np.ascontiguousarray(gallery.centroids, dtype=dtype).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    # Readers either see the old name missing or the complete new file.
+    os.replace(tmp, path)
+
+
+def load_snapshot(class_id, version):
+    """Map the newest build of this version, or None if missing / too old."""
+    if not GALLERY_SNAPSHOTS_ENABLED:
+        return None
+    for built_version, _, path in _builds(class_id):
+        if built_version != version:
+            continue
+        try:
+            snapshot = GallerySnapshot(path)
+        except (OSError, ValueError):
+            continue   # removed meanwhile; try an older build
+        if time.time() - snapshot.built_at > GALLERY_SNAPSHOT_MAX_AGE:
+            return None
+        return snapshot
+    return None
+
+
+def write_snapshot(class_id, version, gallery):
+    """Persist `gallery` as this version's snapshot and map it; None on failure."""
+    if not GALLERY_SNAPSHOTS_ENABLED:
+        return None
+    built_ns = time.time_ns()
+    path = snapshot_path(class_id, version, built_ns)
+    try:
+        os.makedirs(GALLERY_SNAPSHOT_DIR, exist_ok=True)
+        _write(path, class_id, version, gallery)
+        snapshot = GallerySnapshot(path)
+    except (OSError, ValueError) as e:
+        print(f"Gallery snapshot write failed for class {class_id}: {e}")
+        return None
+
+    # Builds of older versions can go; workers still mapping them keep
+    # their pages. Same-version builds stay: another worker's cache may be
+    # handing its file to the AI service, and a newer version stays too.
+    for old_version, _, old in _builds(class_id):
+        if old_version < version:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return snapshot
+
+
+def remove_snapshot(class_id):
+    for path in glob.glob(os.path.join(GALLERY_SNAPSHOT_DIR, f"class-{class_id}-v*.gal")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+from datetime import datetime
+
+from pymongo import ReturnDocument, UpdateOne
+
+from config.db_config import db
+
+# CONFIGURATION
+# Every write that changes what a cache would return bumps a version key:
+#   class:<class_id>      the class document (roster, instructor, session state)
+#   gallery:<class_id>    the class's face gallery (roster, embeddings)
+#   student:<student_id>  student document (names, embeddings)
+# Caches remember the version they were built at and rebuild only when it
+# moves, so TTLs can be long without serving stale galleries.
+gallery_versions_collection = db["gallery_versions"]
+SEQ_KEY = "__seq__"
+VERSION_POLL_SECONDS = float(os.getenv("GALLERY_VERSION_POLL_SECONDS", 2))
+# Re-read this many sequence numbers behind the newest seen, so a bump
+# that took its number first but wrote last is never skipped.
+VERSION_POLL_OVERLAP = 100
+GALLERY_VERSION_WATCH = os.getenv("GALLERY_VERSION_WATCH", "false").lower() == "true"
+
+classes_collection = db["classes"]
+
+
+def class_key(class_id):
+    return f"class:{class_id}"
+
+
+def gallery_key(class_id):
+    return f"gallery:{class_id}"
+
+
+def student_key(student_id):
+    return f"student:{student_id}"
+
+
+class VersionTracker:
+    """Process-local view of gallery_versions, refreshed by polling."""
+
+    def __init__(self, poll_seconds=VERSION_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._last_seq = 0
+        self._last_poll = 0.0
+        self.polls = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _poll(self):
+        since = max(0, self._last_seq - VERSION_POLL_OVERLAP)
+        for doc in gallery_versions_collection.find(
+            {"_id": {"$ne": SEQ_KEY}, "version": {"$gt": since}},
+            {"version": 1},
+        ):
+            self.note(doc["_id"], doc["version"])
+        self.polls += 1
+
+    def note(self, key, version):
+        with self._lock:
+            if version > self._versions.get(key, 0):
+                self._versions[key] = version
+            self._last_seq = max(self._last_seq, version)
+
+    def version(self, key):
+        now = time.time()
+        if now - self._last_poll >= self.poll_seconds:
+            self._last_poll = now
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"Gallery version poll failed: {e}")
+        return self._versions.get(key, 0)
+
+    def is_fresh(self, entry, key):
+        """True if a cache entry was built at the key's current version."""
+        fresh = entry is not None and entry.get("version") == self.version(key)
+        if fresh:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return fresh
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "tracked_keys": len(self._versions),
+            "last_seq": self._last_seq,
+            "polls": self.polls,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+versions = VersionTracker()
+
+
+def bump(*keys):
+    keys = [k for k in keys if k]
+    if not keys:
+        return
+    seq = gallery_versions_collection.find_one_and_update(
+        {"_id": SEQ_KEY},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )["seq"]
+    now = datetime.utcnow()
+    gallery_versions_collection.bulk_write([
+        UpdateOne({"_id": key}, {"$max": {"version": seq}, "$set": {"updated_at": now}}, upsert=True)
+        for key in keys
+    ], ordered=False)
+    # This worker sees its own write immediately; others on the next poll.
+    for key in keys:
+        versions.note(key, seq)
+
+
+def bump_class(class_id, gallery=True):
+    """Class document changed; gallery=False for session-only updates."""
+    bump(class_key(class_id), gallery_key(class_id) if gallery else None)
+
+
+def bump_student(student_id):
+    """Student changed: their own entry plus every class gallery they're in."""
+    class_ids = [
+        str(c["_id"])
+        for c in classes_collection.find({"students.student_id": student_id}, {"_id": 1})
+    ]
+    bump(student_key(student_id), *[gallery_key(cid) for cid in class_ids])
+
+
+def bump_instructor(instructor_id):
+    """Instructor (re-)registered: galleries of every class they teach."""
+    class_ids = [
+        str(c["_id"])
+        for c in classes_collection.find({"instructor_id": instructor_id}, {"_id": 1})
+    ]
+    bump(*[gallery_key(cid) for cid in class_ids])
+
+
+def start_gallery_version_watcher():
+    """Optional change-stream push (replica sets only); polling stays as backup."""
+    if not GALLERY_VERSION_WATCH:
+        return None
+
+    def run():
+        try:
+            with gallery_versions_collection.watch(full_document="updateLookup") as stream:
+                for change in stream:
+                    doc = change.get("fullDocument") or {}
+                    if doc.get("_id") not in (None, SEQ_KEY) and "version" in doc:
+                        versions.note(doc["_id"], doc["version"])
+        except Exception as e:
+            print(f"Gallery version watcher stopped, polling only: {e}")
+
+    thread = threading.Thread(target=run, name="gallery-version-watch", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,174 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from config.db_config import db
+
+# CONFIGURATION
+# Pre-build each class's caches (gallery, snapshot, class and student
+# entries) a few minutes before its scheduled block, and drop them once
+# the block is over, so the first frame of a session is never cold.
+GALLERY_WARMUP_ENABLED = os.getenv("GALLERY_WARMUP", "true").lower() == "true"
+WARMUP_LEAD_MINUTES = int(os.getenv("GALLERY_WARMUP_LEAD_MINUTES", 10))
+WARMUP_EVICT_GRACE_MINUTES = int(os.getenv("GALLERY_WARMUP_EVICT_GRACE_MINUTES", 15))
+WARMUP_POLL_SECONDS = float(os.getenv("GALLERY_WARMUP_POLL_SECONDS", 60))
+
+PH_TZ = timezone(timedelta(hours=8))  # schedule_blocks are Philippine local time
+TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p")
+
+classes_collection = db["classes"]
+
+
+def _parse_time(value):
+    value = (value or "").strip().upper()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).time()
+        except ValueError:
+            continue
+    return None
+
+
+def _meets_on(block, day):
+    # Days are stored as "Mon", "Tue", ...; tolerate full names too.
+    return any(str(d).strip()[:3].lower() == day for d in block.get("days") or [])
+
+
+def todays_windows(classes, now):
+    """(class_id, start, end) for every block meeting today, as aware datetimes."""
+    day = now.strftime("%a").lower()
+    windows = []
+    for cls in classes:
+        for block in cls.get("schedule_blocks") or []:
+            start, end = _parse_time(block.get("start")), _parse_time(block.get("end"))
+            if not start or not end or not _meets_on(block, day):
+                continue
+            start = now.replace(hour=start.hour, minute=start.minute, second=0, microsecond=0)
+            end = now.replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
+            if end <= start:
+                continue
+            windows.append((str(cls["_id"]), start, end))
+    return windows
+
+
+class GalleryWarmer:
+    """Background thread that warms caches ahead of scheduled classes.
+
+    `warm(class_id)` and `evict(class_id)` are supplied by face_routes, which
+    owns the caches; evict returns False to keep a class that is still live.
+    Warming is repeated on every tick inside a window, so a version bump is
+    rebuilt here rather than on the next live frame.
+    """
+
+    def __init__(self, warm, evict, poll_seconds=WARMUP_POLL_SECONDS):
+        self.warm = warm
+        self.evict = evict
+        self.poll_seconds = poll_seconds
+        self._requests = queue.Queue()
+        self._warm_until = {}       # class_id -> datetime it may be evicted after
+        self.warmups = 0
+        self.evictions = 0
+        self.failures = 0
+        self.last_tick_ms = None
+
+    def request(self, class_id, minutes=None):
+        """Warm now and keep warm for `minutes` (plus the eviction grace)."""
+        self._requests.put((str(class_id), minutes))
+
+    def _warm(self, class_id, until):
+        self._warm_until[class_id] = max(until, self._warm_until.get(class_id, until))
+        try:
+            self.warm(class_id)
+            self.warmups += 1
+        except Exception as e:
+            self.failures += 1
+            print(f"Gallery warm-up failed for class {class_id}: {e}")
+
+    def tick(self):
+        start = time.time()
+        now = datetime.now(PH_TZ)
+        lead = timedelta(minutes=WARMUP_LEAD_MINUTES)
+        grace = timedelta(minutes=WARMUP_EVICT_GRACE_MINUTES)
+
+        classes = classes_collection.find(
+            {"schedule_blocks.0": {"$exists": True}},
+            {"schedule_blocks": 1},
+        )
+        for class_id, block_start, block_end in todays_windows(classes, now):
+            if block_start - lead <= now < block_end:
+                self._warm(class_id, block_end + grace)
+
+        for class_id, until in list(self._warm_until.items()):
+            if now < until:
+                continue
+            try:
+                evicted = self.evict(class_id)
+            except Exception as e:
+                print(f"Gallery evict failed for class {class_id}: {e}")
+                evicted = True
+            if evicted is False:
+                # Session ran past its block: keep warm, look again later.
+                self._warm_until[class_id] = now + grace
+            else:
+                self._warm_until.pop(class_id, None)
+                self.evictions += 1
+
+        self.last_tick_ms = round((time.time() - start) * 1000, 1)
+
+    def run(self):
+        next_tick = 0.0
+        while True:
+            timeout = max(0.0, next_tick - time.time())
+            try:
+                class_id, minutes = self._requests.get(timeout=timeout)
+                minutes = (minutes or 0) + WARMUP_EVICT_GRACE_MINUTES
+                self._warm(class_id, datetime.now(PH_TZ) + timedelta(minutes=minutes))
+                continue
+            except queue.Empty:
+                pass
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Gallery warm-up tick failed: {e}")
+            next_tick = time.time() + self.poll_seconds
+
+    def stats(self):
+        return {
+            "enabled": GALLERY_WARMUP_ENABLED,
+            "warm_classes": len(self._warm_until),
+            "warmups": self.warmups,
+            "evictions": self.evictions,
+            "failures": self.failures,
+            "last_tick_ms": self.last_tick_ms,
+        }
+
+
+_warmer = None
+_warmer_pid = None
+
+
+def start_gallery_warmup(warm, evict):
+    """Start this worker's warmer (caches are per process, so one per worker)."""
+    global _warmer, _warmer_pid
+    if not GALLERY_WARMUP_ENABLED:
+        return None
+    if _warmer is not None and _warmer_pid == os.getpid():
+        return _warmer
+    _warmer = GalleryWarmer(warm, evict)
+    _warmer_pid = os.getpid()
+    threading.Thread(target=_warmer.run, name="gallery-warmup", daemon=True).start()
+    return _warmer
+
+
+def request_warmup(class_id, minutes=None):
+    """Queue an immediate warm-up; a no-op until the warmer is started."""
+    if _warmer is not None and _warmer_pid == os.getpid():
+        _warmer.request(class_id, minutes)
+
+
+def warmup_stats():
+    if _warmer is None or _warmer_pid != os.getpid():
+        return {"enabled": GALLERY_WARMUP_ENABLED, "running": False}
+    return {**_warmer.stats(), "running": True}
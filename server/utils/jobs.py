@@ -0,0 +1,244 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import gridfs
+from bson import ObjectId
+from gridfs.errors import NoFile
+
+from config.db_config import db
+
+# CONFIGURATION
+# In-process job queue for work too slow for a request thread: roster
+# ingestion, absent marking, exports, rebuilds, archiving. The request
+# records a job in Mongo and returns its id at once. A worker pool of
+# the same process runs it, and GET /api/jobs/<id> polls the record from
+# any worker. File results (exports) go to GridFS. Cancellation is a flag
+# on the record, which the job checks between steps.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# Running jobs are touched every JOB_HEARTBEAT_SECONDS. One silent for
+# JOB_STALE_SECONDS lost its process (restart, crash) and is failed.
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", 15))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 120))
+# Finished jobs (and their files) are kept this long.
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", 72))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+jobs_collection = db["jobs"]
+job_files = gridfs.GridFS(db, collection="job_files")
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_running = set()
+_running_lock = threading.Lock()
+_WORKER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _object_id(job_id):
+    try:
+        return ObjectId(str(job_id))
+    except Exception:
+        return None
+
+
+class Job:
+    """Handle a job function gets as its first argument."""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self._checked = 0.0
+
+    def progress(self, done, total=None, message=None):
+        """Report progress; raises JobCancelled once cancellation was asked for."""
+        fields = {"progress.done": done, "heartbeat_at": _now()}
+        if total is not None:
+            fields["progress.total"] = total
+        if message is not None:
+            fields["progress.message"] = message
+        doc = jobs_collection.find_one_and_update(
+            {"_id": self.id}, {"$set": fields}, projection={"cancel_requested": 1}
+        )
+        if doc and doc.get("cancel_requested"):
+            raise JobCancelled()
+
+    def check_cancelled(self, every=1.0):
+        """Raise JobCancelled if asked to stop; reads the record at most every `every` s."""
+        now = time.monotonic()
+        if now - self._checked < every:
+            return
+        self._checked = now
+        doc = jobs_collection.find_one({"_id": self.id}, {"cancel_requested": 1})
+        if doc and doc.get("cancel_requested"):
+            raise JobCancelled()
+
+    def save_file(self, chunks, filename, content_type):
+        """Store a streamed result in GridFS as the job's download."""
+        with job_files.new_file(filename=filename, content_type=content_type,
+                                metadata={"job_id": self.id}) as f:
+            for chunk in chunks:
+                f.write(chunk.encode() if isinstance(chunk, str) else chunk)
+                self.check_cancelled()
+        jobs_collection.update_one({"_id": self.id}, {"$set": {"file_id": f._id, "filename": filename}})
+
+
+def _finish(job_id, status, **fields):
+    jobs_collection.update_one(
+        {"_id": job_id},
+        {"$set": {"status": status, "finished_at": _now(), **fields}},
+    )
+
+
+def _run(job_id, fn, args, kwargs):
+    with _running_lock:
+        _running.add(job_id)
+    try:
+        claimed = jobs_collection.update_one(
+            {"_id": job_id, "status": QUEUED},
+            {"$set": {"status": RUNNING, "started_at": _now(), "heartbeat_at": _now(), "worker": _WORKER}},
+        )
+        if not claimed.modified_count:
+            return  # cancelled while queued
+        job = Job(job_id)
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            _finish(job_id, CANCELLED)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}", flush=True)
+            _finish(job_id, FAILED, error=str(e))
+        else:
+            _finish(job_id, DONE, result=result)
+    finally:
+        with _running_lock:
+            _running.discard(job_id)
+
+
+def submit_job(kind, fn, *args, created_by, params=None, **kwargs):
+    """Record a job and queue fn(job, *args, **kwargs); returns the job id (str).
+
+    created_by is the submitter's JWT identity; only they can see the job
+    (only admins, when it is None). fn's return value becomes the job's
+    result and must be storable in Mongo.
+    """
+    doc = {
+        "kind": kind,
+        "status": QUEUED,
+        "params": params or {},
+        "progress": {"done": 0, "total": None},
+        "created_by": created_by,
+        "created_at": _now(),
+        "cancel_requested": False,
+    }
+    job_id = jobs_collection.insert_one(doc).inserted_id
+    start_job_maintenance()   # this process must heartbeat its own jobs
+    _executor.submit(_run, job_id, fn, args, kwargs)
+    return str(job_id)
+
+
+def serialize_job(doc):
+    return {
+        "job_id": str(doc["_id"]),
+        "kind": doc.get("kind"),
+        "status": doc.get("status"),
+        "params": doc.get("params", {}),
+        "progress": doc.get("progress", {}),
+        "result": doc.get("result"),
+        "error": doc.get("error"),
+        "download": bool(doc.get("file_id")) and doc.get("status") == DONE,
+        "created_at": doc.get("created_at"),
+        "started_at": doc.get("started_at"),
+        "finished_at": doc.get("finished_at"),
+    }
+
+
+def get_job(job_id):
+    oid = _object_id(job_id)
+    return jobs_collection.find_one({"_id": oid}) if oid else None
+
+
+def active_job(kind):
+    """The queued or running job of this kind, if any (for one-at-a-time operations)."""
+    return jobs_collection.find_one({"kind": kind, "status": {"$in": [QUEUED, RUNNING]}})
+
+
+def cancel_job(job_id):
+    """Cancel a queued job at once, ask a running one to stop; returns the updated record."""
+    oid = _object_id(job_id)
+    if not oid:
+        return None
+    jobs_collection.update_one({"_id": oid, "status": QUEUED}, {"$set": {
+        "status": CANCELLED, "cancel_requested": True, "finished_at": _now(),
+    }})
+    jobs_collection.update_one({"_id": oid, "status": RUNNING}, {"$set": {"cancel_requested": True}})
+    return jobs_collection.find_one({"_id": oid})
+
+
+def open_job_file(doc):
+    """GridFS file of a finished job's download, or None."""
+    if not doc or doc.get("status") != DONE or not doc.get("file_id"):
+        return None
+    try:
+        return job_files.get(doc["file_id"])
+    except NoFile:
+        return None
+
+
+# Maintenance: heartbeat, stale jobs, retention
+def _maintain():
+    now = _now()
+    with _running_lock:
+        running = list(_running)
+    if running:
+        jobs_collection.update_many({"_id": {"$in": running}, "status": RUNNING}, {"$set": {"heartbeat_at": now}})
+
+    stale = now - timedelta(seconds=JOB_STALE_SECONDS)
+    jobs_collection.update_many(
+        {"status": RUNNING, "heartbeat_at": {"$lt": stale}},
+        {"$set": {"status": FAILED, "error": "Worker stopped before the job finished", "finished_at": now}},
+    )
+    # Queued jobs live only in their process's pool; one that old was lost.
+    jobs_collection.update_many(
+        {"status": QUEUED, "created_at": {"$lt": now - timedelta(hours=1)}},
+        {"$set": {"status": FAILED, "error": "Job was never started", "finished_at": now}},
+    )
+
+    expired = now - timedelta(hours=JOB_RETENTION_HOURS)
+    for doc in jobs_collection.find({"status": {"$in": list(FINISHED)}, "finished_at": {"$lt": expired}},
+                                    {"file_id": 1}):
+        if doc.get("file_id"):
+            job_files.delete(doc["file_id"])
+        jobs_collection.delete_one({"_id": doc["_id"]})
+
+
+_maintainer_pid = None
+
+
+def start_job_maintenance(interval=JOB_HEARTBEAT_SECONDS):
+    global _maintainer_pid
+    if _maintainer_pid == os.getpid():
+        return None
+    _maintainer_pid = os.getpid()
+
+    def run():
+        while True:
+            try:
+                _maintain()
+            except Exception as e:
+                print(f"Job maintenance failed: {e}", flush=True)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="job-maintenance", daemon=True)
+    thread.start()
+    return thread
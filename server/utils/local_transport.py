@@ -0,0 +1,247 @@
+import os
+import stat
+import atexit
+import base64
+import socket
+import struct
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from multiprocessing import shared_memory
+
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+# CONFIGURATION
+# Optional same-host transport to the AI service: HTTP over a Unix domain
+# socket plus a shared-memory ring for image / embedding bytes.
+#   AI_TRANSPORT=auto  use it when the socket exists and the AI URL is local
+#   AI_TRANSPORT=http  always plain HTTP
+AI_TRANSPORT = os.getenv("AI_TRANSPORT", "auto").lower()
+AI_UDS_PATH = os.getenv("AI_UDS_PATH")
+AI_SHM_ENABLED = os.getenv("AI_SHM_ENABLED", "true").lower() == "true"
+SHM_RING_SLOTS = int(os.getenv("AI_SHM_RING_SLOTS", 8))
+SHM_SLOT_BYTES = int(os.getenv("AI_SHM_SLOT_BYTES", 4 * 1024 * 1024))
+
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+# Shared with AI-Microservice/utils/local_transport.py: (seq, length) + payload.
+SLOT_HEADER = struct.Struct("<QQ")
+
+
+def uds_available(base_url, path=AI_UDS_PATH):
+    """True when the AI service is on this host and its socket is present."""
+    if AI_TRANSPORT == "http" or not path:
+        return False
+    if urlparse(base_url).hostname not in LOCAL_HOSTS:
+        return False
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+# Unix socket plumbing for requests
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, socket_path, **kwargs):
+        super().__init__("localhost", **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    def __init__(self, socket_path, **kwargs):
+        super().__init__("localhost", **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self):
+        self.num_connections += 1
+        return UnixHTTPConnection(self.socket_path, timeout=self.timeout.connect_timeout)
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """Sends every request mounted on it to one Unix socket, keep-alive pooled."""
+
+    def __init__(self, socket_path, pool_size):
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        super().__init__(max_retries=0)
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = UnixHTTPConnectionPool(self.socket_path, maxsize=self.pool_size)
+            return self._pool
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._get_pool()
+
+    def get_connection(self, url, proxies=None):
+        return self._get_pool()
+
+    def close(self):
+        super().close()
+        if self._pool is not None:
+            self._pool.close()
+
+
+# Shared-memory ring (writer side)
+class ShmRing:
+    """Fixed-size slots in one shared-memory segment, reserved per request.
+
+    A request reserves its slots before writing and releases them once the
+    AI service has answered, so concurrent requests never overwrite each
+    other. A slot is still invalidated (seq=0) before it is rewritten, so a
+    reader that outlived its request detects reuse and torn reads by
+    checking the sequence around its copy.
+    """
+
+    def __init__(self, slots=SHM_RING_SLOTS, slot_bytes=SHM_SLOT_BYTES):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self._lock = threading.Lock()
+        self._free = list(range(slots))
+        self._seq = 0
+        self.writes = 0
+        self.overflows = 0
+        self.exhausted = 0
+
+    @property
+    def capacity(self):
+        return self.slot_bytes - SLOT_HEADER.size
+
+    def reserve(self, count):
+        """`count` free slot indices, or None when not enough are free."""
+        with self._lock:
+            if count > len(self._free):
+                self.exhausted += 1
+                return None
+            taken = self._free[:count]
+            del self._free[:count]
+            return taken
+
+    def release(self, slots):
+        with self._lock:
+            self._free.extend(slots)
+
+    def write(self, slot, data):
+        """Copy `data` into a reserved slot; None if it doesn't fit."""
+        data = memoryview(data).cast("B")
+        if len(data) > self.capacity:
+            self.overflows += 1
+            return None
+
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self.writes += 1
+        offset = slot * self.slot_bytes
+        buf = self.shm.buf
+        SLOT_HEADER.pack_into(buf, offset, 0, 0)
+        start = offset + SLOT_HEADER.size
+        buf[start:start + len(data)] = data
+        SLOT_HEADER.pack_into(buf, offset, seq, len(data))
+
+        return {"name": self.shm.name, "offset": offset, "seq": seq, "len": len(data)}
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception:
+            pass
+
+
+_ring = None
+_ring_pid = None
+_ring_lock = threading.Lock()
+
+
+def get_ring():
+    # One ring per worker process; a forked worker must not share its parent's.
+    global _ring, _ring_pid
+    with _ring_lock:
+        if _ring is None or _ring_pid != os.getpid():
+            _ring = ShmRing()
+            _ring_pid = os.getpid()
+            atexit.register(_ring.close)
+        return _ring
+
+
+def _decode_data_url(image):
+    if "," in image:
+        image = image.split(",", 1)[1]
+    return base64.b64decode(image)
+
+
+@contextmanager
+def packed_recognize_payload(faces, registered_faces, snapshot=None):
+    """Yield a /recognize-multi body that carries only shared-memory handles.
+
+    All faces go into one ring slot as a single blob; without a gallery
+    snapshot the gallery matrix takes a second slot (with one, the AI service
+    maps the snapshot file directly). The slots stay reserved until the
+    block exits. Yields None (send inline instead) when shared memory is
+    disabled, the ring has no free slots, or something doesn't fit.
+    """
+    if not AI_SHM_ENABLED:
+        yield None
+        return
+
+    ring = get_ring()
+    copy_gallery = snapshot is None and len(registered_faces) > 0
+    slots = ring.reserve(2 if copy_gallery else 1)
+    if slots is None:
+        yield None
+        return
+    try:
+        yield _pack(ring, slots, faces, registered_faces, snapshot)
+    finally:
+        ring.release(slots)
+
+
+def _pack(ring, slots, faces, registered_faces, snapshot):
+    images = [_decode_data_url(face) for face in faces]
+    face_blob = ring.write(slots[0], b"".join(images))
+    if face_blob is None:
+        return None
+    face_blob["sizes"] = [len(image) for image in images]
+
+    gallery = None
+    if snapshot is not None:
+        gallery = snapshot.descriptor()
+    elif len(registered_faces):
+        matrix = np.asarray([f["embedding"] for f in registered_faces], dtype=np.float32)
+        handle = ring.write(slots[1], np.ascontiguousarray(matrix))
+        if handle is None:
+            return None
+        gallery = {"handle": handle, "count": matrix.shape[0], "dim": matrix.shape[1]}
+
+    meta = [
+        {k: v for k, v in f.items() if k != "embedding"}
+        for f in registered_faces
+    ]
+    return {"shm": {"faces": face_blob, "gallery": gallery, "meta": meta}}
+
+
+def stats():
+    ring = _ring if _ring_pid == os.getpid() else None
+    return {
+        "transport": AI_TRANSPORT,
+        "uds_path": AI_UDS_PATH,
+        "shm_enabled": AI_SHM_ENABLED,
+        "shm_writes": ring.writes if ring else 0,
+        "shm_overflows": ring.overflows if ring else 0,
+        "shm_exhausted": ring.exhausted if ring else 0,
+    }
@@ -0,0 +1,142 @@
+import json
+import heapq
+import base64
+from datetime import datetime
+from itertools import islice
+
+from bson import ObjectId
+from flask import Response, current_app, stream_with_context
+
+from utils.programs import program_filter
+
+# CONFIGURATION
+# Keyset pagination over (date, _id), newest first, and JSON responses
+# streamed from the Mongo cursor so a request never holds the whole
+# history in memory. Without ?limit= the endpoint streams everything.
+MAX_PAGE_LIMIT = 1000
+STREAM_BATCH_SIZE = 200
+
+# Request args that filter session headers directly.
+SESSION_FILTER_ARGS = ("class_id", "instructor_id", "course", "section", "semester", "school_year")
+
+
+def encode_cursor(doc):
+    key = {"d": doc.get("date"), "i": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """(date, ObjectId) from a cursor token; ValueError when malformed."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return key["d"], ObjectId(key["i"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def page_args(args):
+    """(limit, after) from ?limit=&cursor=; limit None streams everything."""
+    limit = args.get("limit", type=int)
+    if limit is not None and not 1 <= limit <= MAX_PAGE_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+    after = decode_cursor(args["cursor"]) if args.get("cursor") else None
+    return limit, after
+
+
+def include_archived(args):
+    """?include_archived=true|1|yes also reads archived semesters."""
+    return str(args.get("include_archived", "")).lower() in ("1", "true", "yes")
+
+
+def session_filters(args):
+    """Header filters from request args, plus ?start= / ?end= on date.
+
+    Callers set access-scoped fields (an admin's course, the instructor)
+    on the result afterwards so a query arg can never widen them.
+    """
+    query = {}
+    for field in SESSION_FILTER_ARGS:
+        if args.get(field):
+            query[field] = args[field]
+    # ?course= matches the normalized program, whatever its stored casing.
+    query.update(program_filter(query.pop("course", None)))
+    date_range = {}
+    for arg, op in (("start", "$gte"), ("end", "$lte")):
+        value = args.get(arg)
+        if value:
+            datetime.strptime(value, "%Y-%m-%d")
+            date_range[op] = value
+    if date_range:
+        query["date"] = date_range
+    return query
+
+
+PAGE_SORT = [("date", -1), ("_id", -1)]
+
+
+def _newest_first(doc):
+    return (doc.get("date") or "", doc["_id"])
+
+
+def _after(query, after):
+    if after is None:
+        return query
+    date_val, oid = after
+    return {"$and": [query, {"$or": [
+        {"date": {"$lt": date_val}},
+        {"date": date_val, "_id": {"$lt": oid}},
+    ]}]}
+
+
+def keyset_page(collection, query, limit=None, after=None, projection=None, batch_size=STREAM_BATCH_SIZE,
+                archive=None):
+    """(rows, next_cursor) for one page of `query`, newest (date, _id) first.
+
+    With a limit the page is read once (limit + 1 rows, bounded by
+    MAX_PAGE_LIMIT) and the next cursor is the last row returned, so
+    inserts between reads can never shift the page past its cursor.
+    Without one every row is streamed from the cursor. With an `archive`
+    collection both are read and merged in key order.
+    """
+    query = _after(query, after)
+    collections = [collection] if archive is None else [collection, archive]
+
+    cursors = []
+    for c in collections:
+        cursor = c.find(query, projection).sort(PAGE_SORT).batch_size(batch_size)
+        cursors.append(cursor.limit(limit + 1) if limit else cursor)
+    rows = cursors[0] if archive is None else heapq.merge(*cursors, key=_newest_first, reverse=True)
+    if not limit:
+        return rows, None
+
+    page = list(islice(rows, limit + 1))
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def _dumps(value):
+    return current_app.json.dumps(value)
+
+
+def stream_json(items, key=None, extra=None, next_cursor=None):
+    """Stream `items` as a JSON array, or as {key: [...], **extra} when key is set.
+
+    The envelope also carries next_cursor; the X-Next-Cursor header always does.
+    """
+    def generate():
+        if key is not None:
+            head = {**(extra or {})}
+            yield _dumps(head)[:-1] + ("," if head else "") + f"{_dumps(key)}:["
+        else:
+            yield "["
+        for i, item in enumerate(items):
+            yield ("," if i else "") + _dumps(item)
+        if key is not None:
+            yield f'],"next_cursor":{_dumps(next_cursor)}}}'
+        else:
+            yield "]"
+
+    response = Response(stream_with_context(generate()), mimetype="application/json")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
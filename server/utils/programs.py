@@ -0,0 +1,81 @@
+import os
+import threading
+
+from config.db_config import db
+
+# CONFIGURATION
+# Programs ("BSIT", "BSCS", ...) are matched through a normalized
+# `program_key` kept next to course / Course on students, classes,
+# subjects and attendance (logs, events, daily buckets), so filters are
+# exact, index-served matches instead of case-insensitive regexes.
+# Filters only match documents that have the key, so older documents
+# are backfilled in the background at startup.
+PROGRAM_KEY_BACKFILL_ON_START = os.getenv("PROGRAM_KEY_BACKFILL_ON_START", "true").lower() == "true"
+PROGRAM_KEY_COLLECTIONS = (
+    "students", "classes", "subjects",
+    "attendance_logs", "attendance_events", "attendance_daily",
+)
+
+
+def program_key(value):
+    """" bsit" -> "BSIT"; None for a missing / blank program."""
+    if value is None:
+        return None
+    return str(value).strip().upper() or None
+
+
+def with_program_key(doc):
+    """Set doc["program_key"] from its course (or legacy Course); returns doc."""
+    doc["program_key"] = program_key(doc.get("course") or doc.get("Course"))
+    return doc
+
+
+def program_filter(program):
+    """Exact-match filter for a program, {} when none is given."""
+    key = program_key(program)
+    return {"program_key": key} if key else {}
+
+
+NO_PROGRAM_ERROR = "Forbidden — your account has no program"
+
+
+def admin_scope(claims):
+    """program_filter for an admin token's own program; None when it carries
+    none (callers answer 403 rather than widening the scope)."""
+    return program_filter(claims.get("program")) or None
+
+
+def backfill_program_keys(collections=PROGRAM_KEY_COLLECTIONS):
+    """Set program_key wherever it is missing, server-side (pipeline update).
+
+    Same normalization as program_key(): trim + upper of course / Course.
+    Safe to re-run; documents that already have a key are skipped.
+    """
+    counts = {}
+    for name in collections:
+        result = db[name].update_many(
+            {"program_key": {"$exists": False}},
+            [{"$set": {"program_key": {"$let": {
+                "vars": {"course": {"$trim": {"input": {"$toString": {"$ifNull": ["$course", "$Course", ""]}}}}},
+                "in": {"$cond": [{"$eq": ["$$course", ""]}, None, {"$toUpper": "$$course"}]},
+            }}}}],
+        )
+        counts[name] = result.modified_count
+    print(f"Program keys backfilled: {counts}", flush=True)
+    return counts
+
+
+def start_program_key_backfill():
+    """backfill_program_keys() in a daemon thread (PROGRAM_KEY_BACKFILL_ON_START)."""
+    if not PROGRAM_KEY_BACKFILL_ON_START:
+        return None
+
+    def run():
+        try:
+            backfill_program_keys()
+        except Exception as e:
+            print(f"Program key backfill failed: {e}", flush=True)
+
+    thread = threading.Thread(target=run, name="program-key-backfill", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,148 @@
+import io
+import os
+import csv
+import tempfile
+from datetime import datetime
+
+from flask import Response, stream_with_context
+from openpyxl import Workbook
+
+from utils.attendance_events import attendance_events_archive, attendance_events_collection
+from utils.jobs import submit_job
+
+# CONFIGURATION
+# Attendance exports streamed straight from an attendance_events cursor:
+# CSV goes out every EXPORT_CSV_CHUNK_ROWS rows; XLSX is written by
+# openpyxl in write-only mode (rows go to a temp file, not a DOM) and the
+# finished file is streamed in chunks, then deleted. Routes run exports
+# as background jobs (download from /api/jobs/<id>/download); ?stream=true
+# streams CSV directly and is rejected for XLSX, which has no first byte
+# until the whole workbook is written.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_CSV_CHUNK_ROWS = int(os.getenv("EXPORT_CSV_CHUNK_ROWS", 500))
+EXPORT_FILE_CHUNK_BYTES = 64 * 1024
+EXPORT_FORMATS = ("csv", "xlsx")
+STREAM_FORMATS = ("csv",)
+
+EXPORT_COLUMNS = [
+    ("Date", "date"),
+    ("Time", "time"),
+    ("Status", "status"),
+    ("Student ID", "student_id"),
+    ("Last Name", "last_name"),
+    ("First Name", "first_name"),
+    ("Subject Code", "subject_code"),
+    ("Subject Title", "subject_title"),
+    ("Course", "course"),
+    ("Section", "section"),
+    ("Semester", "semester"),
+    ("School Year", "school_year"),
+    ("Class ID", "class_id"),
+    ("Excuse Reason", "excuse_reason"),
+]
+
+
+def export_rows(query, include_archived=False):
+    """Rows (lists, EXPORT_COLUMNS order) for matching events, oldest day first.
+
+    Sorted on date only so the (…, date) indexes serve the sort; within a
+    day rows come in index order, which is the order they were logged.
+    Archived semesters, when included, come first.
+    """
+    projection = {"_id": 0, **{field: 1 for _, field in EXPORT_COLUMNS}}
+    collections = [attendance_events_collection]
+    if include_archived:
+        collections.insert(0, attendance_events_archive)
+    for collection in collections:
+        cursor = collection.find(query, projection).sort("date", 1).batch_size(EXPORT_BATCH_SIZE)
+        for event in cursor:
+            yield ["" if event.get(field) is None else str(event.get(field)) for _, field in EXPORT_COLUMNS]
+
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in EXPORT_COLUMNS])
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % EXPORT_CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _xlsx_chunks(rows, sheet_title):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title[:31] or "Attendance")
+    ws.append([header for header, _ in EXPORT_COLUMNS])
+    for row in rows:
+        ws.append(row)
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(path)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(EXPORT_FILE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def _export_body(query, fmt, include_archived=False, job=None):
+    """(chunks, mimetype) of an export; with a job, rows report progress."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    rows = export_rows(query, include_archived)
+    if job is not None:
+        rows = _with_progress(rows, job)
+    if fmt == "csv":
+        return _csv_chunks(rows), "text/csv"
+    return _xlsx_chunks(rows, "Attendance"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _with_progress(rows, job):
+    i = 0
+    for i, row in enumerate(rows, 1):
+        if i % EXPORT_BATCH_SIZE == 0:
+            job.progress(i)
+        yield row
+    job.progress(i)
+
+
+def _stamped(filename, fmt):
+    return f"{filename}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+
+
+def export_response(query, fmt, filename, include_archived=False):
+    """A streamed CSV attachment of the events matching `query`."""
+    if fmt in EXPORT_FORMATS and fmt not in STREAM_FORMATS:
+        raise ValueError(f"stream=true supports {', '.join(STREAM_FORMATS)} only; omit it to export {fmt} as a job")
+    body, mimetype = _export_body(query, fmt, include_archived)
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f'attachment; filename="{_stamped(filename, fmt)}"'
+    return response
+
+
+def run_export_job(job, query, fmt, filename, include_archived=False):
+    """Job body (utils/jobs.py): write the export to the job's download file."""
+    body, mimetype = _export_body(query, fmt, include_archived, job)
+    filename = _stamped(filename, fmt)
+    job.save_file(body, filename, mimetype)
+    return {"filename": filename, "format": fmt}
+
+
+def wants_stream(args):
+    return args.get("stream", "false").lower() == "true"
+
+
+def submit_export_job(query, fmt, filename, include_archived=False, params=None, *, created_by):
+    """Queue run_export_job; returns the job id. Raises ValueError on a bad format."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    return submit_job("export", run_export_job, query, fmt, filename, include_archived,
+                      params=params, created_by=created_by)
@@ -0,0 +1,202 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+
+# CONFIGURATION
+# Per-session live state ("student X already logged in session S", "the
+# instructor was seen in S"), scoped by attendance log id so a new session
+# starts empty. Backends:
+#   memory  per-process dict (single worker)
+#   shm     SQLite file in /dev/shm, shared by every worker on the host
+#   sqlite  SQLite file on local disk (SESSION_STATE_PATH), same semantics
+SESSION_STATE_BACKEND = os.getenv("SESSION_STATE_BACKEND", "shm").lower()
+_DEFAULT_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+SESSION_STATE_PATH = os.getenv("SESSION_STATE_PATH")
+# Backstop for sessions that were never stopped.
+SESSION_STATE_TTL = int(os.getenv("SESSION_STATE_TTL", 6 * 3600))
+
+INSTRUCTOR_KEY = "__instructor__"
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}             # session -> {key: (value, expires)}
+
+    def get_many(self, session, keys, now):
+        entries = self._data.get(session, {})
+        out = {}
+        for key in keys:
+            value = entries.get(key)
+            if value and value[1] > now:
+                out[key] = value[0]
+        return out
+
+    def set_if_absent(self, session, key, value, expires, now):
+        with self._lock:
+            entries = self._data.setdefault(session, {})
+            current = entries.get(key)
+            if current and current[1] > now:
+                return current[0], False
+            entries[key] = (value, expires)
+            return value, True
+
+    def clear(self, session):
+        with self._lock:
+            self._data.pop(session, None)
+
+    def purge(self, now):
+        with self._lock:
+            for session in list(self._data):
+                if all(exp <= now for _, exp in self._data[session].values()):
+                    self._data.pop(session)
+
+
+class SqliteBackend:
+    """One SQLite file shared by every worker; set-if-absent is one INSERT OR IGNORE."""
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                " session TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires REAL NOT NULL, PRIMARY KEY (session, key))"
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, session, keys, now):
+        keys = list(keys)
+        if not keys:
+            return {}
+        marks = ",".join("?" * len(keys))
+        rows = self._conn().execute(
+            f"SELECT key, value FROM session_state"
+            f" WHERE session = ? AND expires > ? AND key IN ({marks})",
+            [session, now, *keys],
+        )
+        return dict(rows.fetchall())
+
+    def set_if_absent(self, session, key, value, expires, now):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM session_state WHERE session = ? AND key = ? AND expires <= ?",
+                (session, key, now),
+            )
+            created = conn.execute(
+                "INSERT OR IGNORE INTO session_state VALUES (?, ?, ?, ?)",
+                (session, key, value, expires),
+            ).rowcount == 1
+            if not created:
+                value = conn.execute(
+                    "SELECT value FROM session_state WHERE session = ? AND key = ?",
+                    (session, key),
+                ).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value, created
+
+    def clear(self, session):
+        self._conn().execute("DELETE FROM session_state WHERE session = ?", (session,))
+
+    def purge(self, now):
+        self._conn().execute("DELETE FROM session_state WHERE expires <= ?", (now,))
+
+
+class SessionStateStore:
+    def __init__(self, backend, ttl=SESSION_STATE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.claims = 0
+        self.conflicts = 0
+        self._last_purge = time.time()
+
+    def _maybe_purge(self, now):
+        if now - self._last_purge > 600:
+            self._last_purge = now
+            self.backend.purge(now)
+
+    def logged_students(self, session, student_ids):
+        """{student_id: status} for the students already logged in `session`."""
+        student_ids = list(student_ids)
+        found = self.backend.get_many(str(session), student_ids, time.time())
+        self.hits += len(found)
+        self.misses += len(student_ids) - len(found)
+        return found
+
+    def claim_student(self, session, student_id, status):
+        """Atomically record a student as logged; returns (status, claimed).
+
+        claimed is False when another request or worker got there first,
+        and status is then the one it recorded.
+        """
+        now = time.time()
+        self._maybe_purge(now)
+        value, claimed = self.backend.set_if_absent(str(session), student_id, status, now + self.ttl, now)
+        if claimed:
+            self.claims += 1
+        else:
+            self.conflicts += 1
+        return value, claimed
+
+    def remember_student(self, session, student_id, status):
+        """Record a status already stored in Mongo (no-op if known)."""
+        now = time.time()
+        self.backend.set_if_absent(str(session), student_id, status, now + self.ttl, now)
+
+    def instructor_detected(self, session):
+        return bool(self.backend.get_many(str(session), [INSTRUCTOR_KEY], time.time()))
+
+    def mark_instructor(self, session):
+        now = time.time()
+        self.backend.set_if_absent(str(session), INSTRUCTOR_KEY, "1", now + self.ttl, now)
+
+    def end_session(self, session):
+        self.backend.clear(str(session))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "claims": self.claims,
+            "conflicts": self.conflicts,
+        }
+
+
+def _make_backend():
+    if SESSION_STATE_BACKEND in ("shm", "sqlite"):
+        default_dir = _DEFAULT_DIR if SESSION_STATE_BACKEND == "shm" else tempfile.gettempdir()
+        path = SESSION_STATE_PATH or os.path.join(default_dir, "frams-session-state.db")
+        try:
+            return SqliteBackend(path, SESSION_STATE_BACKEND)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Session state backend {SESSION_STATE_BACKEND} unavailable, using memory: {e}")
+    return MemoryBackend()
+
+
+session_state = SessionStateStore(_make_backend())
@@ -0,0 +1,139 @@
+import os
+import threading
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+from config.db_config import db
+
+# CONFIGURATION
+# One field set for student documents: student_id plus the capitalized
+# profile fields face registration and the admin editor write. Older
+# documents used the legacy names on the right; migrate_student_schema()
+# rewrites them in place so reads can be single-field lookups on the
+# unique student_id index.
+# Runs at startup too (STUDENT_SCHEMA_MIGRATE_ON_START), since reads no
+# longer fall back to the legacy names.
+STUDENT_SCHEMA_MIGRATE_ON_START = os.getenv("STUDENT_SCHEMA_MIGRATE_ON_START", "true").lower() == "true"
+students_collection = db["students"]
+
+CANONICAL_FIELDS = {
+    "student_id": "Student_ID",
+    "First_Name": "first_name",
+    "Middle_Name": "middle_name",
+    "Last_Name": "last_name",
+    "Suffix": "suffix",
+    "Course": "course",
+    "Section": "section",
+    "Year_Level": "year_level",
+    "Semester": "semester",
+    "Email": "email",
+    "Contact_Number": "contact_number",
+    "Subjects": "subjects",
+}
+LEGACY_FILTER = {"$or": [{legacy: {"$exists": True}} for legacy in CANONICAL_FIELDS.values()]}
+MIGRATION_BATCH_SIZE = 500
+
+
+def canonical_student(data):
+    """Rename legacy keys in a student dict; canonical keys win when both are set."""
+    doc = dict(data)
+    for canonical, legacy in CANONICAL_FIELDS.items():
+        if legacy in doc:
+            value = doc.pop(legacy)
+            if doc.get(canonical) is None:
+                doc[canonical] = value
+    return doc
+
+
+def _migration_pipeline():
+    return [
+        {"$set": {canonical: {"$ifNull": [f"${canonical}", f"${legacy}"]}
+                  for canonical, legacy in CANONICAL_FIELDS.items()}},
+        {"$unset": list(CANONICAL_FIELDS.values())},
+    ]
+
+
+def migrate_student_schema(batch_size=MIGRATION_BATCH_SIZE):
+    """Rewrite legacy-named student documents in batches.
+
+    Each batch is one server-side update_many, so an interrupted run loses
+    nothing: the next run picks up the documents still carrying legacy
+    fields. Returns the number of documents rewritten.
+    """
+    migrated = 0
+    while True:
+        ids = [d["_id"] for d in students_collection.find(LEGACY_FILTER, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            break
+        result = students_collection.update_many({"_id": {"$in": ids}}, _migration_pipeline())
+        migrated += result.modified_count
+        print(f"Students migrated: {migrated}", flush=True)
+    return migrated
+
+
+def duplicate_student_ids(limit=50):
+    """[{"student_id", "count", "ids"}] for ids held by more than one document."""
+    return [
+        {"student_id": row["_id"], "count": row["count"], "ids": [str(i) for i in row["ids"]]}
+        for row in students_collection.aggregate([
+            {"$group": {"_id": "$student_id", "count": {"$sum": 1}, "ids": {"$push": "$_id"}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$limit": limit},
+        ], allowDiskUse=True)
+    ]
+
+
+BRIDGE_INDEX = "student_id_bridge"
+
+
+def ensure_unique_student_id():
+    """Swap the plain student_id index for a unique one; drop the Student_ID index.
+
+    Refuses (returns False) while duplicate or missing ids remain; those
+    need resolving by hand first. A (student_id, _id) bridge index serves
+    student_id lookups while the plain index is swapped out, and stays if
+    the unique index cannot be built, so lookups are never unindexed.
+    """
+    duplicates = duplicate_student_ids()
+    if duplicates:
+        print(f"Unique student_id index not created, duplicate ids: {duplicates}", flush=True)
+        return False
+
+    indexes = students_collection.index_information()
+    if any([k for k, _ in info["key"]] == ["student_id"] and info.get("unique") for info in indexes.values()):
+        plain = []
+    else:
+        plain = [name for name, info in indexes.items()
+                 if [k for k, _ in info["key"]] == ["student_id"] and not info.get("unique")]
+        students_collection.create_index([("student_id", ASCENDING), ("_id", ASCENDING)], name=BRIDGE_INDEX)
+        for name in plain:
+            students_collection.drop_index(name)
+        try:
+            students_collection.create_index([("student_id", ASCENDING)], unique=True)
+        except OperationFailure as e:
+            print(f"Unique student_id index not created (bridge index kept): {e}", flush=True)
+            return False
+
+    for name, info in students_collection.index_information().items():
+        if name == BRIDGE_INDEX or [k for k, _ in info["key"]] == ["Student_ID"]:
+            students_collection.drop_index(name)
+    return True
+
+
+def start_student_schema_migration():
+    """Rewrite legacy student documents, then make student_id unique, in a daemon thread."""
+    if not STUDENT_SCHEMA_MIGRATE_ON_START:
+        return None
+
+    def run():
+        try:
+            if migrate_student_schema():
+                print("Student schema migration finished", flush=True)
+            ensure_unique_student_id()
+        except Exception as e:
+            print(f"Student schema migration failed: {e}", flush=True)
+
+    thread = threading.Thread(target=run, name="student-schema-migration", daemon=True)
+    thread.start()
+    return thread